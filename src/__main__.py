@@ -1,16 +1,21 @@
 import os
 import asyncio
+import secrets
 import logging
+from typing import List
 
 from aiogram import Dispatcher, Bot, types
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from src.modules import modules
 from src.start import START
+from src.storage import create_storage
+from src.modules.ces import WATCHER, CesCallback, CesAlertCallback
+from src.modules.report import CHANGES, ReportCallback
+from src import outbound, webhook, workers
 
 
 def create_dispatcher() -> Dispatcher:
-    storage = MemoryStorage()
+    storage = create_storage()
     dispatcher = Dispatcher(storage=storage)
     dispatcher.include_router(START.router)
 
@@ -20,6 +25,16 @@ def create_dispatcher() -> Dispatcher:
     return dispatcher
 
 
+def start_background(bot: Bot) -> List:
+    """Запускает фоновые уведомления; в режиме нескольких процессов - только в `workers.BACKGROUND`."""
+    background = [WATCHER, CHANGES]
+    send = outbound.background(lambda chat_id, text: bot.send_message(chat_id, text, parse_mode='html'))
+    for service in background:
+        service.start(send)
+
+    return background
+
+
 async def main():
     bot = Bot(token=os.getenv('TOKEN'))
     await bot.set_my_commands(
@@ -30,9 +45,35 @@ async def main():
     dispatcher = create_dispatcher()
     logging.basicConfig(level=logging.INFO)
 
-    await dispatcher.start_polling(
-        bot
-    )
+    # только message и callback_query: других типов роутеры не обрабатывают
+    allowed_updates = dispatcher.resolve_used_update_types()
+    url = os.getenv('WEBHOOK_URL')
+    shards = None
+
+    count = int(os.getenv('WORKERS', '1'))
+    if count > 1:
+        await dispatcher.storage.close()
+        # подписки на алерты и изменения оформляются там же, где работают фоновые сервисы
+        shards = workers.Shards(bot.token, count,
+                                pinned=(CesCallback.__prefix__, CesAlertCallback.__prefix__, ReportCallback.__prefix__))
+        shards.start()
+        feed = shards.put
+    else:
+        outbound.install(bot)
+        start_background(bot)
+        feed = workers.Worker(dispatcher, bot).submit
+
+    try:
+        if url:
+            await webhook.serve(bot, feed, url, os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32),
+                                allowed_updates, os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+                                int(os.getenv('WEBHOOK_PORT', '8080')))
+        else:
+            await bot.delete_webhook()
+            await workers.route(bot, feed, allowed_updates)
+    finally:
+        if shards is not None:
+            shards.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
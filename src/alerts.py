@@ -0,0 +1,205 @@
+import html
+import time
+import asyncio
+import logging
+import operator
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from huaweicloudsdkces.v1 import MetricInfoList, MetricsDimension
+
+from src.clients import Service, get_client
+from src.metrics import METRICS, MetricStore, Series
+from src.sdk import account_key
+
+OPERATORS = {'>': operator.gt, '<': operator.lt}
+
+# Период сырых данных Cloud Eye (period '1'), в секундах
+RAW_STEP = 60
+
+# Доля порога, на которую метрика должна вернуться, чтобы алерт снялся
+HYSTERESIS = 0.1
+
+Send = Callable[[int, str], Awaitable]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Условие алерта: `metric_name` `op` `threshold` на протяжении `minutes` минут."""
+    namespace: str
+    dimension: str
+    value: str
+    metric_name: str
+    op: str
+    threshold: float
+    minutes: int
+    period: str = '1'
+
+    @property
+    def margin(self) -> float:
+        return abs(self.threshold) * HYSTERESIS
+
+    @property
+    def step(self) -> int:
+        """Шаг точек серии в мс; сырые данные ('1') приходят примерно раз в `RAW_STEP` секунд."""
+        return (RAW_STEP if self.period == '1' else int(self.period)) * 1000
+
+    @property
+    def samples(self) -> int:
+        """Сколько точек должно быть в окне `minutes`."""
+        return max(1, self.minutes * 60 * 1000 // self.step)
+
+    def breached(self, timestamps: List[int], values: List[float], since: int) -> bool:
+        """
+        Порог нарушен всё окно с `since` (мс): окно покрыто точками с начала и
+        целиком, а не одной точкой после пропуска данных или на первом опросе.
+        """
+        if len(values) < self.samples or timestamps[0] > since + self.step:
+            return False
+
+        compare = OPERATORS[self.op]
+        return all(compare(value, self.threshold) for value in values)
+
+    def recovered(self, value: float) -> bool:
+        if self.op == '>':
+            return value < self.threshold - self.margin
+        return value > self.threshold + self.margin
+
+    def __str__(self) -> str:
+        return f'{self.namespace} {self.dimension}={self.value}: ' \
+               f'{self.metric_name} {self.op} {self.threshold:g} {self.minutes} мин'
+
+
+@dataclass
+class Subscription:
+    id: int
+    chat_id: int
+    rule: Rule
+    credentials: dict = field(repr=False)
+    firing: bool = False
+
+
+class Watcher:
+    """
+    Фоновый опрос Cloud Eye по подпискам на пороги.
+
+    Раз в `interval` секунд подписки группируются по аккаунту и period, и все их
+    уникальные серии запрашиваются через `MetricStore` - одним BatchListMetricData
+    на группу (по 500 метрик), сколько бы чатов ни подписалось на одну серию.
+    Алерт отправляется один раз при срабатывании и один раз при возврате метрики
+    за порог с запасом `HYSTERESIS`.
+    """
+
+    def __init__(self, service: Service, store: MetricStore = METRICS, interval: float = 60):
+        self.service = service
+        self.store = store
+        self.interval = interval
+        self.send: Optional[Send] = None
+        self._subscriptions: Dict[int, Subscription] = {}
+        self._next_id = 1
+        self._task: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger(__name__)
+
+    def subscribe(self, chat_id: int, rule: Rule, credentials: dict) -> Subscription:
+        for subscription in self._subscriptions.values():
+            if subscription.chat_id == chat_id and subscription.rule == rule:
+                subscription.credentials = credentials
+                return subscription
+
+        subscription = Subscription(self._next_id, chat_id, rule, credentials)
+        self._subscriptions[subscription.id] = subscription
+        self._next_id += 1
+
+        return subscription
+
+    def unsubscribe(self, chat_id: int, subscription_id: int) -> bool:
+        subscription = self._subscriptions.get(subscription_id)
+        if subscription is None or subscription.chat_id != chat_id:
+            return False
+
+        del self._subscriptions[subscription_id]
+        return True
+
+    def subscriptions(self, chat_id: int) -> List[Subscription]:
+        return [s for s in self._subscriptions.values() if s.chat_id == chat_id]
+
+    def client(self, credentials: dict):
+        return get_client(self.service, credentials)
+
+    def start(self, send: Send):
+        self.send = send
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.poll()
+
+    async def poll(self, now: Optional[float] = None) -> List[Tuple[Subscription, str]]:
+        """Опрашивает все серии и рассылает алерты; возвращает отправленные (подписка, текст)."""
+        now = time.time() if now is None else now
+        to = int(now * 1000)
+
+        groups: Dict[Hashable, List[Subscription]] = {}
+        for subscription in self._subscriptions.values():
+            client = self.client(subscription.credentials)
+            key = (account_key(client.batch_list_metric_data_async), subscription.rule.period)
+            groups.setdefault(key, []).append(subscription)
+
+        alerts = []
+        for (_, period), subscriptions in groups.items():
+            client = self.client(subscriptions[0].credentials)
+            rules = list(dict.fromkeys(subscription.rule for subscription in subscriptions))
+            metrics = [MetricInfoList(namespace=rule.namespace, metric_name=rule.metric_name,
+                                      dimensions=[MetricsDimension(name=rule.dimension, value=rule.value)])
+                       for rule in rules]
+            from_ = to - max(rule.minutes for rule in rules) * 60 * 1000
+
+            try:
+                series = await self.store.fetch(client, metrics, period, 'average', from_, to)
+            except Exception as e:
+                self._logger.warning('Metric poll failed: %s', e)
+                continue
+
+            by_rule = dict(zip(rules, series))
+            for subscription in subscriptions:
+                text = self._evaluate(subscription, by_rule[subscription.rule], to)
+                if text is not None:
+                    alerts.append((subscription, text))
+
+        for subscription, text in alerts:
+            if self.send is not None:
+                try:
+                    await self.send(subscription.chat_id, text)
+                except Exception as e:
+                    self._logger.warning('Alert delivery to %s failed: %s', subscription.chat_id, e)
+
+        return alerts
+
+    @staticmethod
+    def _evaluate(subscription: Subscription, series: Series, to: int) -> Optional[str]:
+        rule = subscription.rule
+        since = to - rule.minutes * 60 * 1000
+        points = [(timestamp, value) for timestamp, value in zip(series.timestamps, series.values)
+                  if timestamp >= since and value is not None]
+        if not points:
+            return None
+        timestamps, values = [timestamp for timestamp, _ in points], [value for _, value in points]
+
+        current = html.escape(f'{values[-1]:g}{series.unit or ""}')
+        rule_text = html.escape(str(rule))
+        if not subscription.firing and rule.breached(timestamps, values, since):
+            subscription.firing = True
+            return f'<b>Сработал алерт</b> {rule_text} (сейчас {current})'
+        if subscription.firing and rule.recovered(values[-1]):
+            subscription.firing = False
+            return f'<b>Алерт снят</b> {rule_text} (сейчас {current})'
+
+        return None
@@ -0,0 +1,51 @@
+"""
+Микробенчмарк форматирования: `python -m src.bench [число образов]`.
+
+Сравнивает прежний вывод ims_list (ответ SDK -> str -> json.loads и сборка
+сообщения через `+=`) с `Renderer`, читающим атрибуты моделей напрямую.
+"""
+import sys
+import json
+import timeit
+
+from huaweicloudsdkims.v2 import ImageInfo, ListImagesResponse
+
+from src.modules.ims import IMAGE_VIEW
+
+
+def _response(count: int) -> ListImagesResponse:
+    images = [ImageInfo(id=f'{index:08d}-0000-0000-0000-000000000000', name=f'Ubuntu 22.04 server 64bit {index}',
+                        os_type='Linux', visibility='public', status='active', min_disk=40)
+              for index in range(count)]
+
+    return ListImagesResponse(images=images)
+
+
+def concatenated(response: ListImagesResponse) -> str:
+    response = json.loads(str(response))
+    messag = ''
+    for image in response['images']:
+        messag += ('**Name:**\t`' + image['name'] + '`') if image['name'] else ''
+        messag += '\n'
+        messag += ('**ID:**\t`' + image['id'] + '`') if image['id'] else ''
+        messag += '\n'
+        messag += '\n'
+
+    return messag
+
+
+def rendered(response: ListImagesResponse) -> str:
+    return IMAGE_VIEW.render_many(response.images)
+
+
+def main(count: int = 10000, number: int = 5):
+    response = _response(count)
+    assert concatenated(response) == rendered(response) + '\n'
+
+    for function in (concatenated, rendered):
+        best = min(timeit.repeat(lambda: function(response), number=number, repeat=3)) / number
+        print(f'{function.__name__:>12}: {best * 1000:8.1f} ms на {count} образов')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+# Время жизни закэшированных ответов по типам ресурсов, в секундах
+TTLS = {
+    'vpc': 60,
+    'subnet': 60,
+    'nat': 60,
+    'eps': 300,
+    'ecs': 30,
+    'flavor': 3600,
+    'ims': 300,
+}
+
+MISS = object()
+
+Tag = Tuple[Hashable, str]
+
+
+class ResourceCache:
+    """
+    TTL кэш ответов SDK, ключ - (credentials, тип ресурса, запрос).
+
+    Записи помечены тегом (аккаунт, тип ресурса), по которому их сбрасывают
+    после успешных create/update/delete/enable/disable. Каждый сброс увеличивает
+    поколение тега: ответ на запрос, начатый до записи, в кэш уже не попадёт.
+    Размер ограничен `max_entries`, лишние вытесняются по LRU. Просроченные
+    записи не удаляются сразу и доступны через `stale`.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, max_entries: int = 4096):
+        self.ttls = dict(TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._tags: Dict[Tag, Set[Hashable]] = {}
+        self._generations: Dict[Tag, int] = {}
+
+    def generation(self, account: Hashable, resource: str) -> int:
+        return self._generations.get((account, resource), 0)
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISS
+
+        value, expires, tag = entry
+        if expires <= time.monotonic():
+            # просроченная запись остаётся до вытеснения: её отдаёт `stale`, пока сервис недоступен
+            self.misses += 1
+            return MISS
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def stale(self, key: Hashable) -> Any:
+        """Ответ по ключу без учёта TTL; сброшенные записью ответы сюда не попадают."""
+        entry = self._entries.get(key)
+
+        return MISS if entry is None else entry[0]
+
+    def put(self, account: Hashable, resource: str, key: Hashable, value: Any, generation: int = 0):
+        ttl = self.ttls.get(resource, 0)
+        tag = (account, resource)
+        if ttl <= 0 or self._generations.get(tag, 0) != generation:
+            return
+
+        self._entries[key] = (value, time.monotonic() + ttl, tag)
+        self._entries.move_to_end(key)
+        self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, account: Hashable, *resources: str):
+        for resource in resources:
+            tag = (account, resource)
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in self._tags.pop(tag, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+
+    def _drop(self, key: Hashable):
+        _, _, tag = self._entries.pop(key)
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+CACHE = ResourceCache()
@@ -0,0 +1,283 @@
+import re
+import abc
+import time
+import heapq
+import asyncio
+import bisect
+import logging
+from typing import Any, AsyncIterable, Callable, Dict, Hashable, List, Optional, Set
+
+from src.cache import TTLS
+
+Loader = Callable[[], AsyncIterable[Any]]
+
+_TOKEN = re.compile(r'[a-z0-9а-яё]+')
+
+
+class Catalog(abc.ABC):
+    """
+    Справочник ресурсов региона в памяти процесса.
+
+    Первая загрузка ждёт ответа API, дальше справочник отвечает из памяти,
+    а по истечении `ttl` обновляется в фоне (stale-while-revalidate).
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.loaded_at: Optional[float] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    async def ensure(self, loader: Loader):
+        if self.stale and self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self.refresh(loader))
+            self._refreshing.add_done_callback(self._refreshed)
+
+        # пустой справочник ждёт загрузки, одновременные вызовы - одной и той же
+        if self.loaded_at is None:
+            await asyncio.shield(self._refreshing)
+
+    async def refresh(self, loader: Loader):
+        self.load([item async for item in loader()])
+        self.loaded_at = time.monotonic()
+
+    def _refreshed(self, task: asyncio.Task):
+        self._refreshing = None
+        if not task.cancelled() and task.exception() is not None:
+            self._logger.warning('Catalog refresh failed: %s', task.exception())
+
+    @abc.abstractmethod
+    def load(self, items: List[Any]):
+        """Строит индексы справочника по полному списку ресурсов."""
+
+
+class FlavorCatalog(Catalog):
+    """
+    Флейворы ECS: хэш-индекс по имени и отсортированные индексы по vCPU и RAM.
+
+    Цен API флейворов не отдаёт, поэтому «дешевле» значит меньше vCPU, затем меньше RAM.
+    """
+
+    def __init__(self, ttl: float = 3600):
+        super().__init__(ttl)
+        self.by_name: Dict[str, Any] = {}
+        self._by_vcpus: List[tuple] = []
+        self._by_ram: List[tuple] = []
+
+    @staticmethod
+    def vcpus(flavor) -> int:
+        return int(flavor.vcpus)
+
+    def load(self, items: List[Any]):
+        self.by_name = {flavor.name: flavor for flavor in items}
+        self._by_vcpus = sorted((self.vcpus(f), f.ram, f.name) for f in items)
+        self._by_ram = sorted((f.ram, self.vcpus(f), f.name) for f in items)
+
+    def get(self, name: str):
+        return self.by_name.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.by_name
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+    def sorted(self) -> List[Any]:
+        return [self.by_name[name] for _, _, name in self._by_vcpus]
+
+    def query(self, min_vcpus: int = 0, min_ram: int = 0, limit: int = 10) -> List[Any]:
+        """Флейворы с vCPU >= `min_vcpus` и RAM (MB) >= `min_ram`, дешёвые первыми."""
+        by_vcpus = bisect.bisect_left(self._by_vcpus, (min_vcpus,))
+        by_ram = bisect.bisect_left(self._by_ram, (min_ram,))
+
+        # проверяем второе условие на меньшем из двух диапазонов
+        if len(self._by_vcpus) - by_vcpus <= len(self._by_ram) - by_ram:
+            found = [(vcpus, ram, name) for vcpus, ram, name in self._by_vcpus[by_vcpus:] if ram >= min_ram]
+        else:
+            found = sorted((vcpus, ram, name) for ram, vcpus, name in self._by_ram[by_ram:] if vcpus >= min_vcpus)
+
+        return [self.by_name[name] for _, _, name in found[:limit]]
+
+
+# ключ - регион и credentials проекта: доступные флейворы у проектов могут различаться
+FLAVORS: Dict[Hashable, FlavorCatalog] = {}
+
+
+async def flavor_catalog(key: Hashable, loader: Loader) -> FlavorCatalog:
+    catalog = FLAVORS.get(key)
+    if catalog is None:
+        catalog = FLAVORS[key] = FlavorCatalog(TTLS['flavor'])
+
+    await catalog.ensure(loader)
+
+    return catalog
+
+
+class ImageCatalog(Catalog):
+    """
+    Образы IMS с поиском по префиксу имени, по словам и по атрибутам.
+
+    Обновление инкрементальное: запрашиваются только образы с `updated_at` не раньше
+    последнего известного, а раз в `full_ttl` справочник перечитывается целиком,
+    чтобы из него пропали удалённые образы.
+    """
+
+    ATTRIBUTES = ('os_type', 'visibility', 'status')
+
+    def __init__(self, ttl: float = 300, full_ttl: float = 3600):
+        super().__init__(ttl)
+        self.full_ttl = full_ttl
+        self.updated_at: Optional[str] = None
+        self.by_id: Dict[str, Any] = {}
+        self._full_at: Optional[float] = None
+        self._names: List[tuple] = []
+        self._tokens: Dict[str, Set[str]] = {}
+        self._attributes: Dict[tuple, Set[str]] = {}
+        self._sorted_tokens: Optional[List[str]] = None
+
+    @staticmethod
+    def tokenize(text: Optional[str]) -> List[str]:
+        return _TOKEN.findall(text.lower()) if text else []
+
+    def _image_tokens(self, image) -> Set[str]:
+        return set(self.tokenize(image.name) + self.tokenize(getattr(image, 'os_version', None)))
+
+    async def refresh(self, loader: Callable[[Optional[str]], AsyncIterable[Any]]):
+        full = self._full_at is None or time.monotonic() - self._full_at > self.full_ttl
+        changed = [image async for image in loader(None if full else self.updated_at)]
+
+        if full:
+            self.load(changed)
+            self._full_at = time.monotonic()
+        else:
+            self.update(changed)
+        self.loaded_at = time.monotonic()
+
+    def load(self, items: List[Any]):
+        self.by_id = {}
+        self._names = []
+        self._tokens = {}
+        self._attributes = {}
+        self.updated_at = None
+        self.update(items)
+
+    def update(self, items: List[Any]):
+        for image in items:
+            if image.id in self.by_id:
+                self._remove(self.by_id[image.id])
+            self._add(image)
+            if image.updated_at and (self.updated_at is None or image.updated_at > self.updated_at):
+                self.updated_at = image.updated_at
+
+        self._sorted_tokens = None
+
+    def _add(self, image):
+        self.by_id[image.id] = image
+        if image.name:
+            bisect.insort(self._names, (image.name.lower(), image.id))
+        for token in self._image_tokens(image):
+            self._tokens.setdefault(token, set()).add(image.id)
+        for attribute in self.ATTRIBUTES:
+            self._attributes.setdefault((attribute, _lower(getattr(image, attribute))), set()).add(image.id)
+
+    def _remove(self, image):
+        del self.by_id[image.id]
+        if image.name:
+            index = bisect.bisect_left(self._names, (image.name.lower(), image.id))
+            if index < len(self._names) and self._names[index] == (image.name.lower(), image.id):
+                del self._names[index]
+        for token in self._image_tokens(image):
+            _discard(self._tokens, token, image.id)
+        for attribute in self.ATTRIBUTES:
+            _discard(self._attributes, (attribute, _lower(getattr(image, attribute))), image.id)
+
+    def get(self, image_id: str):
+        return self.by_id.get(image_id)
+
+    def __contains__(self, image_id: str) -> bool:
+        return image_id in self.by_id
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def _prefixed(self, token: str) -> Set[str]:
+        """id образов, у которых есть слово, начинающееся с `token`."""
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._tokens)
+
+        found = set()
+        index = bisect.bisect_left(self._sorted_tokens, token)
+        while index < len(self._sorted_tokens) and self._sorted_tokens[index].startswith(token):
+            found |= self._tokens[self._sorted_tokens[index]]
+            index += 1
+
+        return found
+
+    def _name_prefixed(self, prefix: str) -> Set[str]:
+        found = set()
+        index = bisect.bisect_left(self._names, (prefix,))
+        while index < len(self._names) and self._names[index][0].startswith(prefix):
+            found.add(self._names[index][1])
+            index += 1
+
+        return found
+
+    def search(self, text: str = '', limit: int = 10, disk: Optional[int] = None, **attributes) -> List[Any]:
+        """
+        Ищет образы по словам из `text` (каждое - префикс слова в имени или версии ОС)
+        и по атрибутам `os_type`, `visibility`, `status` (без учёта регистра).
+        `disk` оставляет образы, которым хватает диска такого размера (min_disk <= disk).
+
+        Выше в выдаче образы, где слова совпали целиком и имя начинается с `text`.
+        """
+        tokens = self.tokenize(text)
+        candidates = [self._prefixed(token) for token in tokens]
+        candidates += [self._attributes.get((name, _lower(value)), set())
+                       for name, value in attributes.items() if value is not None]
+
+        if candidates:
+            candidates.sort(key=len)
+            found = set(candidates[0]).intersection(*candidates[1:])
+        else:
+            found = set(self.by_id)
+
+        if disk is not None:
+            found = {image_id for image_id in found if (self.by_id[image_id].min_disk or 0) <= disk}
+
+        by_name = self._name_prefixed(text.strip().lower()) if text.strip() else set()
+
+        def rank(image_id: str) -> tuple:
+            image = self.by_id[image_id]
+            exact = sum(token in self._tokens and image_id in self._tokens[token] for token in tokens)
+            return -exact, image_id not in by_name, (image.name or '').lower()
+
+        return [self.by_id[image_id] for image_id in heapq.nsmallest(limit, found, key=rank)]
+
+
+def _lower(value: Any) -> Any:
+    return value.lower() if isinstance(value, str) else value
+
+
+def _discard(index: Dict[Any, Set[str]], key: Any, value: str):
+    values = index.get(key)
+    if values is not None:
+        values.discard(value)
+        if not values:
+            del index[key]
+
+
+IMAGES: Dict[Hashable, ImageCatalog] = {}
+
+
+async def image_catalog(key: Hashable, loader: Callable[[Optional[str]], AsyncIterable[Any]]) -> ImageCatalog:
+    catalog = IMAGES.get(key)
+    if catalog is None:
+        catalog = IMAGES[key] = ImageCatalog()
+
+    await catalog.ensure(loader)
+
+    return catalog
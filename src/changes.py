@@ -0,0 +1,205 @@
+import html
+import json
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from src.inventory import Source
+
+Send = Callable[[int, str], Awaitable]
+
+CREATED = 'created'
+DELETED = 'deleted'
+STATUS = 'status'
+CHANGED = 'changed'
+
+# Не больше стольких изменений в одном уведомлении
+MAX_LINES = 50
+
+
+class Record(NamedTuple):
+    """Сжатое состояние ресурса в снимке: хэш содержимого, статус и имя для уведомлений."""
+    digest: bytes
+    status: Any
+    name: Optional[str]
+
+
+class Change(NamedTuple):
+    kind: str
+    resource: str
+    id: str
+    old: Optional[Record]
+    new: Optional[Record]
+
+
+def digest(item: Any) -> bytes:
+    content = item.to_dict() if hasattr(item, 'to_dict') else vars(item)
+    return hashlib.blake2b(json.dumps(content, sort_keys=True, default=str).encode(), digest_size=16).digest()
+
+
+def record(item: Any) -> Record:
+    return Record(digest(item), getattr(item, 'status', None), getattr(item, 'name', None))
+
+
+def diff(resource: str, old: Dict[str, Record], new: Dict[str, Record]) -> List[Change]:
+    """Изменения между снимками за O(len(old) + len(new)): сравниваются только хэши по id."""
+    changes = []
+    for resource_id, current in new.items():
+        previous = old.get(resource_id)
+        if previous is None:
+            changes.append(Change(CREATED, resource, resource_id, None, current))
+        elif previous.digest != current.digest:
+            kind = STATUS if previous.status != current.status else CHANGED
+            changes.append(Change(kind, resource, resource_id, previous, current))
+
+    for resource_id in old.keys() - new.keys():
+        changes.append(Change(DELETED, resource, resource_id, old[resource_id], None))
+
+    return changes
+
+
+def describe(change: Change) -> str:
+    name = html.escape(str((change.new or change.old).name or ''))
+    title = f'{change.resource} <b>{name}</b> <code>{change.id}</code>'
+
+    if change.kind == CREATED:
+        return f'+ {title} создан'
+    if change.kind == DELETED:
+        return f'- {title} удалён'
+    if change.kind == STATUS:
+        return f'~ {title}: статус {html.escape(str(change.old.status))} → {html.escape(str(change.new.status))}'
+
+    return f'~ {title} изменён'
+
+
+def message(changes: List[Change]) -> str:
+    lines = [describe(change) for change in changes[:MAX_LINES]]
+    if len(changes) > MAX_LINES:
+        lines.append(f'... и ещё {len(changes) - MAX_LINES}')
+
+    return '\n'.join(lines)
+
+
+@dataclass
+class Subscriber:
+    chat_id: int
+    resources: Set[str]
+
+
+@dataclass
+class Account:
+    credentials: dict = field(repr=False)
+    subscribers: Dict[int, Subscriber] = field(default_factory=dict)
+    snapshots: Dict[str, Dict[str, Record]] = field(default_factory=dict)
+
+
+class ChangeWatcher:
+    """
+    Уведомления об изменениях инвентаря аккаунта.
+
+    Раз в `interval` секунд для каждого аккаунта с подписчиками снимается снимок
+    нужных типов ресурсов через list операции `sources` (не больше `concurrency`
+    одновременно). В снимке от ресурса остаются только хэш содержимого, статус и
+    имя; сравнение идёт по id, и дальше обрабатываются только изменившиеся
+    записи. Первый снимок - точка отсчёта, о нём не сообщается.
+    """
+
+    def __init__(self, sources: Iterable[Source], interval: float = 300, concurrency: int = 3):
+        self.sources = {source.resource: source for source in sources}
+        self.interval = interval
+        self.concurrency = concurrency
+        self.send: Optional[Send] = None
+        self._accounts: Dict[Hashable, Account] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def account(credentials: dict) -> Hashable:
+        secret = hashlib.sha256(credentials['sk'].encode()).hexdigest()
+        return credentials['ak'], secret, credentials.get('project_id'), credentials.get('account_id')
+
+    def subscribe(self, chat_id: int, credentials: dict, resources: Iterable[str]):
+        account = self._accounts.setdefault(self.account(credentials), Account(credentials))
+        account.credentials = credentials
+        account.subscribers[chat_id] = Subscriber(chat_id, set(resources) & self.sources.keys())
+
+    def unsubscribe(self, chat_id: int) -> bool:
+        found = False
+        for key, account in list(self._accounts.items()):
+            if account.subscribers.pop(chat_id, None) is not None:
+                found = True
+            if not account.subscribers:
+                del self._accounts[key]
+
+        return found
+
+    def start(self, send: Send):
+        self.send = send
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.poll()
+            await asyncio.sleep(self.interval)
+
+    async def _snapshot(self, source: Source, credentials: dict) -> Dict[str, Record]:
+        snapshot = {}
+        async for page in source.pages(credentials):
+            for item in page:
+                snapshot[item.id] = record(item)
+
+        return snapshot
+
+    async def poll(self) -> Dict[int, List[Change]]:
+        """Снимает снимки, рассылает изменения и возвращает их по чатам."""
+        slots = asyncio.Semaphore(self.concurrency)
+        delivered: Dict[int, List[Change]] = {}
+
+        async def refresh(account: Account, resource: str) -> Tuple[str, List[Change]]:
+            async with slots:
+                snapshot = await self._snapshot(self.sources[resource], account.credentials)
+
+            previous = account.snapshots.get(resource)
+            account.snapshots[resource] = snapshot
+
+            return resource, [] if previous is None else diff(resource, previous, snapshot)
+
+        for account in list(self._accounts.values()):
+            resources = set().union(*(s.resources for s in account.subscribers.values()))
+            for resource in account.snapshots.keys() - resources:
+                del account.snapshots[resource]
+
+            results = await asyncio.gather(*(refresh(account, resource) for resource in resources),
+                                           return_exceptions=True)
+
+            changes: Dict[str, List[Change]] = {}
+            for result in results:
+                if isinstance(result, BaseException):
+                    self._logger.warning('Inventory snapshot failed: %s', result)
+                    continue
+                resource, found = result
+                changes[resource] = found
+
+            for subscriber in account.subscribers.values():
+                found = [c for resource in subscriber.resources for c in changes.get(resource, ())]
+                if found:
+                    delivered.setdefault(subscriber.chat_id, []).extend(found)
+
+        for chat_id, found in delivered.items():
+            if self.send is None:
+                continue
+            try:
+                await self.send(chat_id, message(found))
+            except Exception as e:
+                self._logger.warning('Change delivery to %s failed: %s', chat_id, e)
+
+        return delivered
@@ -0,0 +1,111 @@
+import io
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+from src.metrics import Series
+from src.sdk import SingleFlight
+
+# (подпись, timestamps в мс, значения)
+Curve = Tuple[str, List[int], List[float]]
+
+
+class ChartsBusy(Exception):
+    """Очередь отрисовки заполнена, график не строим."""
+
+
+def plot(title: str, curves: Sequence[Curve]) -> bytes:
+    """PNG с графиком на каждую серию; выполняется в процессе пула."""
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot
+
+    figure, axes = pyplot.subplots(len(curves), 1, sharex=True, squeeze=False,
+                                   figsize=(8, 1.8 * len(curves) + 0.6), dpi=100)
+    for (label, timestamps, values), (ax,) in zip(curves, axes):
+        times = [datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc) for timestamp in timestamps]
+        ax.plot(times, values, linewidth=1.2)
+        ax.set_title(label, fontsize=9, loc='left')
+        ax.grid(True, alpha=0.3)
+
+    figure.suptitle(title, fontsize=10)
+    figure.autofmt_xdate()
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    pyplot.close(figure)
+
+    return buffer.getvalue()
+
+
+class ChartRenderer:
+    """
+    Рисует PNG графики серий Cloud Eye в пуле процессов, не нагружая event loop.
+
+    Одновременно в работе и ожидании не больше `queue_size` графиков, лишние
+    запросы получают `ChartsBusy`. Готовые PNG кэшируются по ключу серий и
+    отрезку времени длиной `bucket` секунд, одинаковые запросы склеиваются.
+    """
+
+    def __init__(self, workers: int = 2, queue_size: int = 8, bucket: int = 60, max_cached: int = 256):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.bucket = bucket
+        self.max_cached = max_cached
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._flights = SingleFlight()
+        self._cache: 'OrderedDict[Hashable, bytes]' = OrderedDict()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: дочерние процессы не наследуют потоки и сокеты бота
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    async def render(self, key: Hashable, title: str, series: Sequence[Series], to: int) -> bytes:
+        """
+        PNG для `series`; `key` должен однозначно задавать аккаунт, серии и окно,
+        `to` (мс) - конец окна, по нему выбирается отрезок кэша.
+        """
+        key = (key, to // (self.bucket * 1000))
+
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            return png
+
+        curves = [(f'{one.metric_name} ({one.unit or ""})', list(one.timestamps),
+                   [float('nan') if value is None else value for value in one.values]) for one in series]
+
+        return await self._flights.do(key, lambda: self._render(key, title, curves))
+
+    async def _render(self, key: Hashable, title: str, curves: List[Curve]) -> bytes:
+        if self.pending >= self.queue_size:
+            raise ChartsBusy()
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            png = await loop.run_in_executor(self.pool, plot, title, curves)
+        finally:
+            self.pending -= 1
+
+        self._cache[key] = png
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+        return png
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+CHARTS = ChartRenderer()
@@ -0,0 +1,121 @@
+import time
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from huaweicloudsdkcore.auth.credentials import BasicCredentials, GlobalCredentials
+from huaweicloudsdkcore.http.http_config import HttpConfig
+
+from src.transport import TRANSPORT, TransportConfig
+
+
+@dataclass(frozen=True)
+class Service:
+    """
+    Описание сервиса SberCloud, для которого строятся клиенты.
+
+    `scope` определяет тип credentials: 'project' - `BasicCredentials` с project id,
+    'domain' - `GlobalCredentials` с account id, None - `BasicCredentials` без проекта.
+    `transport` - настройки пула соединений, таймаутов и ретраев для endpoint'а.
+    """
+    name: str
+    client_type: type
+    endpoint: str
+    scope: Optional[str] = 'project'
+    transport: TransportConfig = TransportConfig()
+
+    @property
+    def region(self) -> str:
+        host = self.endpoint.split('://', 1)[-1]
+        parts = host.split('.')
+
+        return parts[1] if len(parts) > 1 else host
+
+    def scope_id(self, data: dict) -> Optional[str]:
+        if self.scope == 'project':
+            return data['project_id']
+        if self.scope == 'domain':
+            return data['account_id']
+
+        return None
+
+    def credentials(self, data: dict):
+        if self.scope == 'domain':
+            return GlobalCredentials(data['ak'], data['sk'], domain_id=data['account_id'])
+
+        return BasicCredentials(ak=data['ak'], sk=data['sk'], project_id=self.scope_id(data))
+
+    def build(self, data: dict):
+        config = HttpConfig.get_default_config()
+        config.ignore_ssl_verification = False
+        config.timeout = self.transport.timeout
+
+        client = self.client_type().new_builder() \
+            .with_http_config(config) \
+            .with_credentials(self.credentials(data)) \
+            .with_endpoint(self.endpoint) \
+            .build()
+
+        return TRANSPORT.attach(client, self.endpoint, self.transport)
+
+
+Key = Tuple[str, str, str, str, Optional[str]]
+
+
+class ClientPool:
+    """
+    Общий на процесс пул SDK клиентов.
+
+    Клиент (а вместе с ним его пул соединений и TLS сессии) переиспользуется
+    между нажатиями и между пользователями одного аккаунта. Клиенты, которыми
+    не пользовались дольше `idle_ttl` секунд, закрываются.
+    """
+
+    def __init__(self, idle_ttl: float = 600):
+        self.idle_ttl = idle_ttl
+        self._clients: Dict[Key, list] = {}
+
+    @staticmethod
+    def key(service: Service, data: dict) -> Key:
+        # sk тоже входит в ключ: иначе пользователь, знающий только ak и project id,
+        # получил бы чужой уже авторизованный клиент
+        secret = hashlib.sha256(data['sk'].encode()).hexdigest()
+
+        return (service.name, service.region, data['ak'], secret, service.scope_id(data))
+
+    def get(self, service: Service, data: dict):
+        now = time.monotonic()
+        self.evict(now)
+
+        key = self.key(service, data)
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = [service.build(data), now]
+            self._clients[key] = entry
+        entry[1] = now
+
+        return entry[0]
+
+    def evict(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+
+        for key, (client, last_used) in list(self._clients.items()):
+            if now - last_used > self.idle_ttl:
+                del self._clients[key]
+                client.close()
+
+    def clear(self):
+        for client, _ in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+CLIENTS = ClientPool()
+
+
+def get_client(service: Service, data: dict):
+    """Возвращает клиент сервиса для credentials из FSM data."""
+    return CLIENTS.get(service, data)
@@ -0,0 +1,130 @@
+import io
+import csv
+import gzip
+import json
+import asyncio
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+from src.clients import Service, get_client
+from src.pagination import MARKER, pages
+
+CSV = 'csv'
+JSON = 'json'
+
+COLUMNS = ('resource', 'id', 'name', 'status')
+
+
+@dataclass(frozen=True)
+class Source:
+    """
+    list операция одного типа ресурсов для инвентаризации.
+
+    `details` - атрибуты ресурса сверх `COLUMNS`, путь через точку допустим (`flavor.name`).
+    """
+    resource: str
+    service: Service
+    operation: str
+    request: Callable[[], Any]
+    field: str
+    paging: str = MARKER
+    details: Tuple[str, ...] = ()
+
+    def pages(self, data: dict) -> AsyncIterator[List[Any]]:
+        """Страницы ресурсов в обход кэша: выгрузка не должна вытеснять ответы для интерактивных экранов."""
+        method = getattr(get_client(self.service, data), self.operation)
+        return pages(method, self.request(), self.field, self.paging)
+
+    def row(self, item: Any) -> Dict[str, Any]:
+        row = {'resource': self.resource, 'id': item.id, 'name': getattr(item, 'name', None),
+               'status': getattr(item, 'status', None)}
+        for path in self.details:
+            try:
+                row[path] = attrgetter(path)(item)
+            except AttributeError:
+                row[path] = None
+
+        return row
+
+
+class _Writer:
+    """Пишет строки отчёта сразу в gzip поток в памяти."""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.count = 0
+        self.buffer = io.BytesIO()
+        self._gzip = gzip.GzipFile(fileobj=self.buffer, mode='wb')
+        self._text = io.TextIOWrapper(self._gzip, encoding='utf-8', newline='')
+        if fmt == CSV:
+            self._csv = csv.writer(self._text)
+            self._csv.writerow(COLUMNS + ('details',))
+        else:
+            self._text.write('[')
+
+    def write(self, row: Dict[str, Any]):
+        if self.fmt == CSV:
+            details = ';'.join(f'{key}={value}' for key, value in row.items() if key not in COLUMNS)
+            self._csv.writerow([row[column] for column in COLUMNS] + [details])
+        else:
+            self._text.write((',\n' if self.count else '\n') + json.dumps(row, ensure_ascii=False, default=str))
+        self.count += 1
+
+    def close(self) -> bytes:
+        if self.fmt == JSON:
+            self._text.write('\n]\n')
+        self._text.close()
+
+        return self.buffer.getvalue()
+
+
+async def export(sources: List[Source], data: dict, fmt: str = CSV, concurrency: int = 3,
+                 queue_size: int = 8) -> Tuple[bytes, int, Dict[str, str]]:
+    """
+    Выгружает все ресурсы `sources` в gzip CSV или JSON в памяти.
+
+    Источники листаются параллельно, но не больше `concurrency` сразу, а страницы
+    идут к единственному писателю через очередь на `queue_size` страниц: в памяти
+    только сжатый результат и несколько страниц, сколько бы ресурсов ни было.
+    Возвращает (gzip, число строк, {ресурс: ошибка}).
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    slots = asyncio.Semaphore(concurrency)
+    errors: Dict[str, str] = {}
+
+    async def produce(source: Source):
+        async with slots:
+            try:
+                async for page in source.pages(data):
+                    await queue.put((source, page))
+            except Exception as e:
+                errors[source.resource] = getattr(e, 'error_msg', None) or str(e)
+
+    writer = _Writer(fmt)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            source, page = item
+            for resource in page:
+                writer.write(source.row(resource))
+
+    producers = [asyncio.ensure_future(produce(source)) for source in sources]
+
+    async def finish():
+        await asyncio.gather(*producers)
+        await queue.put(None)
+
+    tasks = producers + [asyncio.ensure_future(finish()), asyncio.ensure_future(consume())]
+    try:
+        # ждём писателя: если он упадёт, источники не должны висеть на полной очереди
+        await tasks[-1]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return writer.close(), writer.count, errors
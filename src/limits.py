@@ -0,0 +1,128 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TokenBucket:
+    """Token bucket: в среднем `rate` вызовов в секунду, всплесками до `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class LaneStats:
+    queued: int = 0
+    running: int = 0
+    calls: int = 0
+    wait_total: float = 0
+    wait_max: float = 0
+
+
+class _Lane:
+    def __init__(self, concurrency: int, rate: float, burst: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.stats = LaneStats()
+
+
+class Limiter:
+    """
+    Выделенный пул потоков для всех вызовов SberCloud SDK.
+
+    На каждый ключ (аккаунт, сервис) действуют лимит одновременных вызовов
+    `concurrency` и token bucket на `rate` вызовов в секунду (всплеск до `burst`);
+    общий лимит на процесс - `workers`. Лишние вызовы не падают, а ждут в очереди.
+    """
+
+    def __init__(self, workers: int = 32, concurrency: int = 4, rate: float = 10, burst: float = 20):
+        self.workers = workers
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sdk')
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lanes: Dict[Hashable, _Lane] = {}
+        self._logger = logging.getLogger(__name__)
+
+    def share(self, processes: int):
+        """
+        Делит лимиты ключа между `processes` процессами-обработчиками: обновления
+        распределяются по пользователям, и один аккаунт может вызываться из всех
+        процессов сразу. Меньше одного одновременного вызова лимит не опускается.
+        """
+        self.concurrency = max(1, self.concurrency // processes)
+        self.rate = self.rate / processes
+        self.burst = max(1, self.burst / processes)
+
+    def _lane(self, key: Hashable) -> _Lane:
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = _Lane(self.concurrency, self.rate, self.burst)
+            self._lanes[key] = lane
+
+        return lane
+
+    async def run(self, key: Hashable, fn: Callable, *args) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        lane = self._lane(key)
+        stats = lane.stats
+        queued_at = time.monotonic()
+
+        stats.queued += 1
+        started = False
+        try:
+            async with lane.semaphore:
+                await lane.bucket.acquire()
+                async with self._slots:
+                    started = True
+                    stats.queued -= 1
+                    wait = time.monotonic() - queued_at
+                    stats.wait_total += wait
+                    stats.wait_max = max(stats.wait_max, wait)
+                    stats.calls += 1
+                    stats.running += 1
+
+                    if wait > 1:
+                        self._logger.info('SDK call %s waited %.2fs in queue', key, wait)
+
+                    try:
+                        loop = asyncio.get_running_loop()
+                        return await loop.run_in_executor(self.executor, fn, *args)
+                    finally:
+                        stats.running -= 1
+        finally:
+            if not started:
+                stats.queued -= 1
+
+    def stats(self) -> Dict[Hashable, LaneStats]:
+        """Глубина очереди, число вызовов и время ожидания по ключам (аккаунт, сервис)."""
+        return {key: lane.stats for key, lane in self._lanes.items()}
+
+    @property
+    def queued(self) -> int:
+        return sum(lane.stats.queued for lane in self._lanes.values())
+
+
+LIMITER = Limiter()
@@ -0,0 +1,161 @@
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from huaweicloudsdkces.v1 import BatchListMetricDataRequest, BatchListMetricDataRequestBody, MetricInfoList
+
+from src.sdk import account_key, execute
+
+# Ограничение BatchListMetricData на число метрик в одном запросе
+MAX_METRICS = 500
+
+Dimensions = Tuple[Tuple[str, str], ...]
+# (аккаунт, namespace, измерения, метрика, period, filter)
+SeriesKey = Tuple[Hashable, str, Dimensions, str, str, str]
+
+
+def dimensions_of(metric) -> Dimensions:
+    return tuple(sorted((dimension.name, dimension.value) for dimension in metric.dimensions or ()))
+
+
+class RingBuffer:
+    """
+    Последние `capacity` точек одной серии по возрастанию timestamp.
+
+    `start` - начало окна, с которого серия загружена без пропусков, `fetched_to` -
+    конец последнего запрошенного окна. Всё между ними уже есть в буфере.
+    """
+
+    def __init__(self, capacity: int):
+        self.timestamps: deque = deque(maxlen=capacity)
+        self.values: deque = deque(maxlen=capacity)
+        self.unit: Optional[str] = None
+        self.start: Optional[int] = None
+        self.fetched_to: Optional[int] = None
+
+    @property
+    def last(self) -> Optional[int]:
+        return self.timestamps[-1] if self.timestamps else None
+
+    def covers(self, from_: int) -> bool:
+        return self.fetched_to is not None and self.start is not None and self.start <= from_
+
+    def reset(self, start: int):
+        self.timestamps.clear()
+        self.values.clear()
+        self.start = start
+        self.fetched_to = None
+
+    def extend(self, points: List[Tuple[int, float]], to: int):
+        for timestamp, value in points:
+            last = self.last
+            if last is not None and timestamp <= last:
+                # последняя точка агрегируется, пока не закончился её период: берём свежее значение
+                if timestamp == last:
+                    self.values[-1] = value
+                continue
+
+            if len(self.timestamps) == self.timestamps.maxlen:
+                self.start = self.timestamps[1]
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+
+        self.fetched_to = to if self.fetched_to is None else max(self.fetched_to, to)
+
+    def window(self, from_: int, to: int) -> Tuple[List[int], List[float]]:
+        timestamps, values = [], []
+        for timestamp, value in zip(self.timestamps, self.values):
+            if from_ <= timestamp <= to:
+                timestamps.append(timestamp)
+                values.append(value)
+
+        return timestamps, values
+
+
+@dataclass
+class Series:
+    namespace: str
+    dimensions: Dimensions
+    metric_name: str
+    unit: Optional[str]
+    timestamps: List[int]
+    values: List[float]
+
+
+class MetricStore:
+    """
+    Кэш серий Cloud Eye: кольцевой буфер на каждую серию
+    (аккаунт, namespace, измерения, метрика, period, filter).
+
+    Первый запрос серии загружает всё окно, повторные - только точки начиная
+    с последней известной. Серии, которым нужен один и тот же `from`, идут одним
+    BatchListMetricData (по `MAX_METRICS` метрик). Число серий ограничено `max_series`, LRU.
+    """
+
+    def __init__(self, capacity: int = 1440, max_series: int = 4096):
+        self.capacity = capacity
+        self.max_series = max_series
+        self._buffers: 'OrderedDict[SeriesKey, RingBuffer]' = OrderedDict()
+
+    def _buffer(self, key: SeriesKey) -> RingBuffer:
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = RingBuffer(self.capacity)
+            while len(self._buffers) > self.max_series:
+                self._buffers.popitem(last=False)
+        self._buffers.move_to_end(key)
+
+        return buffer
+
+    async def fetch(self, client, metrics: List[MetricInfoList], period: str, filter: str,
+                    from_: int, to: int) -> List[Series]:
+        """Серии `metrics` за окно [from_, to] (в мс) в порядке `metrics`."""
+        method = client.batch_list_metric_data_async
+        account = account_key(method)
+
+        keys = [(account, metric.namespace, dimensions_of(metric), metric.metric_name, period, filter)
+                for metric in metrics]
+        buffers = {key: self._buffer(key) for key in keys}
+
+        groups: Dict[int, List[Any]] = {}
+        points: Dict[SeriesKey, List[Tuple[int, float]]] = {}
+        for key, metric in zip(keys, metrics):
+            buffer = buffers[key]
+            if not buffer.covers(from_):
+                buffer.reset(from_)
+                start = from_
+            elif buffer.fetched_to is not None and buffer.fetched_to >= to:
+                continue
+            else:
+                start = max(from_, buffer.last if buffer.last is not None else buffer.fetched_to)
+            groups.setdefault(start, []).append(metric)
+            points[key] = []
+
+        requests = []
+        for start, group in groups.items():
+            for index in range(0, len(group), MAX_METRICS):
+                body = BatchListMetricDataRequestBody(metrics=group[index:index + MAX_METRICS], period=period,
+                                                      filter=filter, _from=start, to=to)
+                requests.append(execute(method, BatchListMetricDataRequest(body)))
+
+        for result in await asyncio.gather(*requests):
+            for data in result.metrics or ():
+                key = (account, data.namespace, dimensions_of(data), data.metric_name, period, filter)
+                if key in points:
+                    points[key] = sorted((point.timestamp, getattr(point, filter)) for point in data.datapoints or ())
+                    buffers[key].unit = data.unit or buffers[key].unit
+
+        for key, fetched in points.items():
+            buffers[key].extend(fetched, to)
+
+        series = []
+        for key in keys:
+            _, namespace, dimensions, metric_name, _, _ = key
+            timestamps, values = buffers[key].window(from_, to)
+            series.append(Series(namespace, dimensions, metric_name, buffers[key].unit, timestamps, values))
+
+        return series
+
+
+METRICS = MetricStore()
@@ -5,5 +5,6 @@ from .nat import NAT
 from .ecs import ECS
 from .ims import IMS
 from .ces import CES
+from .report import REPORT
 
-modules = (EPS, VPC, SUBNET, NAT, IMS, CES, ECS)
+modules = (EPS, VPC, SUBNET, NAT, IMS, CES, ECS, REPORT)
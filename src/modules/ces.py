@@ -1,5 +1,8 @@
+import html
+import time
+import logging
+from array import array
 from enum import Enum
-from datetime import datetime, timedelta
 
 from aiogram import F, Router, types
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
@@ -7,20 +10,31 @@ from aiogram.types.callback_query import CallbackQuery
 from aiogram.filters.callback_data import CallbackData
 from aiogram.filters.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
+from aiogram.types import BufferedInputFile
 
-from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkcore.exceptions import exceptions
-from huaweicloudsdkcore.http.http_config import HttpConfig
-from huaweicloudsdkces.v1 import CesAsyncClient, ListMetricsRequest, BatchListMetricDataRequest
-from huaweicloudsdkces.v1 import BatchListMetricDataRequestBody, MetricInfoList, MetricsDimension
-from huaweicloudsdkecs.v2 import EcsAsyncClient, ListServersDetailsRequest
+from huaweicloudsdkces.v1 import CesAsyncClient, ListMetricsRequest, MetricInfoList, MetricsDimension
+from huaweicloudsdkecs.v2 import ListServersDetailsRequest
 
 
 from src.module import Module
+from src.clients import Service, get_client
+from src.transport import TransportConfig
+from src.sdk import account_key
+from src.metrics import METRICS, MetricStore
+from src.pagination import items, PAGE
+from src.charts import CHARTS, ChartsBusy
+from src.stats import resolution, summarize, top
+from src.alerts import OPERATORS, Rule, Watcher
 from src.utils import add_exit_button
+from src.render import Renderer
 from src.globalstate import GlobalState
+from . import ecs
 
 ENDPOINT = 'https://ces.ru-moscow-1.hc.sbercloud.ru'
+SERVICE = Service('ces', CesAsyncClient, ENDPOINT, transport=TransportConfig(read_timeout=30))
+
+WATCHER = Watcher(SERVICE)
 
 CES = Module(
     name='Cloud Eye Monitoring',
@@ -32,6 +46,9 @@ class Action(str, Enum):
     NAT = 'show NAT metrics'
     ECS = 'show ECS metrics'
     EVS = 'show EVS disk id'
+    SUBSCRIBE = 'subscribe alert'
+    ALERTS = 'my alerts'
+    TOP_ECS = 'top ECS servers'
 
 
 class CesCallback(CallbackData, prefix='ces'):
@@ -55,25 +72,6 @@ def keyboard() -> InlineKeyboardMarkup:
 
 @CES.router.callback_query(F.data == CES.name)
 async def ces_main(call: CallbackQuery, state: FSMContext):
-    config = HttpConfig.get_default_config()
-    config.ignore_ssl_verification = False
-
-    data = await state.get_data()
-
-    credentials = BasicCredentials(
-        ak=data['ak'],
-        sk=data['sk'],
-        project_id=data['project_id'],
-    )
-
-    client = CesAsyncClient().new_builder() \
-        .with_http_config(config) \
-        .with_credentials(credentials) \
-        .with_endpoint(ENDPOINT) \
-        .build()
-
-    await state.update_data(client=client)
-
     await call.message.edit_reply_markup(reply_markup=keyboard())
     await call.answer()
 
@@ -84,139 +82,261 @@ class CesShowStates(StatesGroup):
     EVS = State()
 
 
-def __metric_to_str(metric) -> str:
-    text = f'<b>{metric.metric_name} ({metric.unit})</b>: {metric.datapoints}'
+def _number(value: float) -> str:
+    return f'{value:.4g}'
 
-    return text
+
+SUMMARY_VIEW = Renderer(
+    '<b>{metric_name}</b> ({unit}) {sparkline}',
+    '<code>min {min}  avg {mean}  p95 {p95}  max {max}  last {last}</code>',
+    **{name: (lambda summary, name=name: _number(getattr(summary, name)))
+       for name in ('min', 'mean', 'p95', 'max', 'last')},
+)
 
 
 @CES.router.callback_query(CesCallback.filter(F.action == Action.ECS))
 async def ces_show_ecs(call: CallbackQuery, state: FSMContext):
-    await call.message.answer(text='Введи ECS id')
+    await call.message.answer(text='Введи ECS id и, если нужно, окно в минутах (по умолчанию 60)')
     await state.set_state(CesShowStates.ECS)
     await call.answer()
 
 
 @CES.router.callback_query(CesCallback.filter(F.action == Action.NAT))
 async def ces_show_nat(call: CallbackQuery, state: FSMContext):
-    await call.message.answer(text='Введи NAT id')
+    await call.message.answer(text='Введи NAT id и, если нужно, окно в минутах (по умолчанию 60)')
     await state.set_state(CesShowStates.NAT)
     await call.answer()
 
 
 @CES.router.callback_query(CesCallback.filter(F.action == Action.EVS))
 async def ces_show_evs(call: CallbackQuery, state: FSMContext):
-    await call.message.answer(text='Введи EVS disk id')
+    await call.message.answer(text='Введи EVS disk id и, если нужно, окно в минутах (по умолчанию 60)')
     await state.set_state(CesShowStates.EVS)
     await call.answer()
 
 
-@CES.router.message(CesShowStates.ECS)
-async def ces_show_ecs_id(message: types.Message, state: FSMContext):
+async def __show_metrics(message: types.Message, state: FSMContext, namespace: str, dimension: str,
+                         metric_names: list, minutes: int = 60):
     data = await state.get_data()
-    client = data['client']  # type: CesAsyncClient
+    client = get_client(SERVICE, data)  # type: CesAsyncClient
 
-    ecs_id = message.text
+    # "<id> [окно в минутах]"
+    words = (message.text or '').split()
+    if not words:
+        await message.answer('Нужен id ресурса')
+        return
 
-    from_ = int((datetime.utcnow() - timedelta(minutes=5)).timestamp() * 1000)
-    to = int(datetime.utcnow().timestamp() * 1000)
+    resource_id, *window = words
+    if window and window[0].isdigit():
+        minutes = int(window[0])
 
-    metric_names = ['cpu_util', 'network_vm_connections',
-                    'network_vm_newconnections']
+    to = int(time.time() * 1000)
+    from_ = to - minutes * 60 * 1000
+    period = resolution(minutes * 60)
 
-    dimensions = [MetricsDimension(name='instance_id', value=ecs_id)]
+    dimensions = [MetricsDimension(name=dimension, value=resource_id)]
 
     metrics = []
     for name in metric_names:
         metric = MetricInfoList(
-            dimensions=dimensions, metric_name=name, namespace='SYS.ECS')
+            dimensions=dimensions, metric_name=name, namespace=namespace)
         metrics.append(metric)
 
-    body = BatchListMetricDataRequestBody(
-        metrics=metrics, period='300', filter='average', _from=from_, to=to)
+    try:
+        series = await METRICS.fetch(client, metrics, period, 'average', from_, to)
+    except exceptions.SdkException as e:
+        await message.answer(e.error_msg)
+        await state.set_state(GlobalState.DEFAULT)
+        return
+
+    parts = [f'За {minutes} мин, период {period}:\n']
+    for one in series:
+        summary = summarize(one)
+        if summary is None:
+            parts.append(f'<b>{one.metric_name}</b>: нет данных\n')
+        else:
+            SUMMARY_VIEW.render_into(parts, summary)
+
+    await message.answer(text=''.join(parts), parse_mode='html')
+    await state.set_state(GlobalState.DEFAULT)
 
-    request = BatchListMetricDataRequest(body)
-    request = client.batch_list_metric_data_async(request)
-    result = request.result()
+    plotted = [one for one in series if one.values]
+    if not plotted:
+        return
 
-    entries = []
-    for metric in result.metrics:
-        entries.append(__metric_to_str(metric))
+    key = (account_key(client.batch_list_metric_data_async), namespace, resource_id, tuple(metric_names), minutes)
+    try:
+        png = await CHARTS.render(key, f'{namespace} {resource_id}, {minutes} мин', plotted, to)
+    except ChartsBusy:
+        await message.answer('Сейчас строится много графиков, попробуй позже')
+        return
+    except Exception as e:
+        logging.getLogger(__name__).warning('Chart rendering failed: %s', e)
+        return
 
-    await message.answer(text='\n'.join(entries), parse_mode='html')
-    await state.set_state(GlobalState.DEFAULT)
+    await message.answer_photo(BufferedInputFile(png, filename='metrics.png'))
 
 
-@CES.router.message(CesShowStates.NAT)
-async def ces_show_nat_id(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    client = data['client']  # type: CesAsyncClient
+@CES.router.message(CesShowStates.ECS)
+async def ces_show_ecs_id(message: types.Message, state: FSMContext):
+    metric_names = ['cpu_util', 'network_vm_connections',
+                    'network_vm_newconnections']
 
-    nat_id = message.text
+    await __show_metrics(message, state, 'SYS.ECS', 'instance_id', metric_names)
 
-    from_ = int((datetime.utcnow() - timedelta(minutes=1)).timestamp() * 1000)
-    to = int(datetime.utcnow().timestamp() * 1000)
 
+@CES.router.message(CesShowStates.NAT)
+async def ces_show_nat_id(message: types.Message, state: FSMContext):
     metric_names = ['snat_connection', 'inbound_bandwidth', 'outbound_bandwidth',
                     'inbound_traffic', 'outbound_traffic',
                     'inbound_bandwidth_ratio']
 
-    dimensions = [MetricsDimension(name='nat_gateway_id', value=nat_id)]
+    await __show_metrics(message, state, 'SYS.NAT', 'nat_gateway_id', metric_names)
 
-    metrics = []
-    for name in metric_names:
-        metric = MetricInfoList(
-            dimensions=dimensions, metric_name=name, namespace='SYS.NAT')
-        metrics.append(metric)
 
-    body = BatchListMetricDataRequestBody(
-        metrics=metrics, period='1', filter='average', _from=from_, to=to)
+@CES.router.message(CesShowStates.EVS)
+async def ces_show_evs_id(message: types.Message, state: FSMContext):
+    metric_names = ['disk_device_read_bytes_rate', 'disk_device_write_bytes_rate',
+                    'disk_device_read_requests_rate', 'disk_device_queue_length',
+                    'disk_device_write_await', 'disk_device_read_await',
+                    'disk_device_io_iops_qos_num']
 
-    request = BatchListMetricDataRequest(body)
-    request = client.batch_list_metric_data_async(request)
-    result = request.result()
+    await __show_metrics(message, state, 'SYS.EVS', 'disk_name', metric_names)
 
-    entries = []
-    for metric in result.metrics:
-        entries.append(__metric_to_str(metric))
 
-    await message.answer(text='\n'.join(entries), parse_mode='html')
-    await state.set_state(GlobalState.DEFAULT)
+# Тип ресурса в подписке -> (namespace, измерение)
+TARGETS = {
+    'ecs': ('SYS.ECS', 'instance_id'),
+    'nat': ('SYS.NAT', 'nat_gateway_id'),
+    'evs': ('SYS.EVS', 'disk_name'),
+}
 
 
-@CES.router.message(CesShowStates.EVS)
-async def ces_show_evs_id(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    client = data['client']  # type: CesAsyncClient
+def parse_rule(text: str) -> Rule:
+    """`ecs <id> cpu_util > 90 10` -> Rule; ValueError, если формат не тот."""
+    target, value, metric_name, op, threshold, minutes = text.split()
+    if target.lower() not in TARGETS or op not in OPERATORS:
+        raise ValueError(text)
 
-    evs_id = message.text
+    namespace, dimension = TARGETS[target.lower()]
 
-    from_ = int((datetime.utcnow() - timedelta(minutes=5)).timestamp() * 1000)
-    to = int(datetime.utcnow().timestamp() * 1000)
+    return Rule(namespace, dimension, value, metric_name, op, float(threshold), int(minutes))
 
-    metric_names = ['disk_device_read_bytes_rate', 'disk_device_write_bytes_rate',
-                    'disk_device_read_requests_rate', 'disk_device_queue_length',
-                    'disk_device_write_await', 'disk_device_read_await',
-                    'disk_device_io_iops_qos_num']
 
-    dimensions = [MetricsDimension(name='disk_name', value=evs_id)]
+class CesSubscribeStates(StatesGroup):
+    RULE = State()
 
-    metrics = []
-    for name in metric_names:
-        metric = MetricInfoList(
-            dimensions=dimensions, metric_name=name, namespace='SYS.EVS')
-        metrics.append(metric)
 
-    body = BatchListMetricDataRequestBody(
-        metrics=metrics, period='300', filter='average', _from=from_, to=to)
+class CesAlertCallback(CallbackData, prefix='ces_alert'):
+    id: int
 
-    request = BatchListMetricDataRequest(body)
-    request = client.batch_list_metric_data_async(request)
-    result = request.result()
 
-    entries = []
-    for metric in result.metrics:
-        entries.append(__metric_to_str(metric))
+@CES.router.callback_query(CesCallback.filter(F.action == Action.SUBSCRIBE))
+async def ces_subscribe_rule(call: CallbackQuery, state: FSMContext):
+    await call.message.answer('Введи условие: <code>ecs|nat|evs id метрика &gt;|&lt; порог минут</code>\n'
+                              'Например: <code>ecs 0b2f... cpu_util &gt; 90 10</code>', parse_mode='html')
+    await state.set_state(CesSubscribeStates.RULE)
+    await call.answer()
+
+
+@CES.router.message(CesSubscribeStates.RULE)
+async def ces_subscribe(message: types.Message, state: FSMContext):
+    try:
+        rule = parse_rule(message.text)
+    except ValueError:
+        await message.answer('Не понял условие, попробуй ещё раз. Например: ecs 0b2f... cpu_util > 90 10')
+        return
+
+    data = await state.get_data()
+    credentials = {key: data[key] for key in ('ak', 'sk', 'project_id')}
+    WATCHER.subscribe(message.chat.id, rule, credentials)
 
-    await message.answer(text='\n'.join(entries), parse_mode='html')
+    await message.answer(f'Подписка оформлена: {html.escape(str(rule))}', parse_mode='html')
     await state.set_state(GlobalState.DEFAULT)
+
+
+def __alerts_keyboard(chat_id: int) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+
+    for subscription in WATCHER.subscriptions(chat_id):
+        builder.button(text=f'Отписаться: {subscription.rule}', callback_data=CesAlertCallback(id=subscription.id))
+
+    add_exit_button(builder)
+    builder.adjust(1)
+
+    return builder.as_markup()
+
+
+@CES.router.callback_query(CesCallback.filter(F.action == Action.ALERTS))
+async def ces_alerts(call: CallbackQuery, state: FSMContext):
+    if WATCHER.subscriptions(call.message.chat.id):
+        await call.message.answer('Твои подписки:', reply_markup=__alerts_keyboard(call.message.chat.id))
+    else:
+        await call.message.answer('Подписок нет')
+    await call.answer()
+
+
+@CES.router.callback_query(CesAlertCallback.filter())
+async def ces_unsubscribe(call: CallbackQuery, state: FSMContext, callback_data: CesAlertCallback):
+    WATCHER.unsubscribe(call.message.chat.id, callback_data.id)
+    await call.message.edit_reply_markup(reply_markup=__alerts_keyboard(call.message.chat.id))
+    await call.answer('Подписка удалена')
+
+
+FLEET_METRICS = ['cpu_util', 'network_incoming_bytes_rate_inband', 'network_outgoing_bytes_rate_inband']
+FLEET_MINUTES = 15
+TOP_SIZE = 5
+
+# Серии всего парка: короткие буферы, зато помещаются тысячи серверов
+FLEET = MetricStore(capacity=64, max_series=32768)
+
+
+@CES.router.callback_query(CesCallback.filter(F.action == Action.TOP_ECS))
+async def ces_top_ecs(call: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    client = get_client(SERVICE, data)  # type: CesAsyncClient
+    ecs_client = get_client(ecs.SERVICE, data)
+
+    await call.answer()
+
+    try:
+        ids, names = [], []
+        servers = items(ecs_client.list_servers_details_async, ListServersDetailsRequest(), 'servers', PAGE,
+                        resource='ecs')
+        async for server in servers:
+            ids.append(server.id)
+            names.append(server.name)
+
+        if not ids:
+            await call.message.answer('Серверов нет')
+            return
+
+        to = int(time.time() * 1000)
+        from_ = to - FLEET_MINUTES * 60 * 1000
+        metrics = [MetricInfoList(namespace='SYS.ECS', metric_name=name,
+                                  dimensions=[MetricsDimension(name='instance_id', value=server_id)])
+                   for name in FLEET_METRICS for server_id in ids]
+        series = await FLEET.fetch(client, metrics, resolution(FLEET_MINUTES * 60), 'average', from_, to)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await state.set_state(GlobalState.DEFAULT)
+        return
+
+    parts = [f'Топ-{TOP_SIZE} из {len(ids)} серверов за {FLEET_MINUTES} мин (среднее):\n']
+    for index, name in enumerate(FLEET_METRICS):
+        chunk = series[index * len(ids):(index + 1) * len(ids)]
+        values = array('d', (_mean(one.values) for one in chunk))
+        unit = next((one.unit for one in chunk if one.unit), '')
+
+        parts.append(f'\n<b>{name}</b> ({html.escape(unit)}):\n')
+        for place, server in enumerate(top(values, TOP_SIZE), 1):
+            parts.append(f'{place}. {html.escape(names[server] or "")} <code>{ids[server]}</code>: '
+                         f'{_number(values[server])}\n')
+
+    await call.message.answer(''.join(parts), parse_mode='html')
+
+
+def _mean(values: list) -> float:
+    values = [value for value in values if value is not None]
+
+    return sum(values) / len(values) if values else float('nan')
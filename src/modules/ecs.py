@@ -1,3 +1,4 @@
+import uuid
 from enum import Enum
 
 from aiogram import F, Router, types
@@ -7,19 +8,25 @@ from aiogram.filters.callback_data import CallbackData
 from aiogram.filters.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
-from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkcore.exceptions import exceptions
-from huaweicloudsdkcore.http.http_config import HttpConfig
 from huaweicloudsdkecs.v2 import (EcsAsyncClient, ListServersDetailsRequest, ListFlavorsRequest, CreateServersRequest,
                                   CreateServersRequestBody, PrePaidServer, PrePaidServerRootVolume, PrePaidServerNic,
                                   ShowServerRequest)
 
 from src.module import Module
+from src.clients import Service, get_client
+from src.sdk import execute, account_key
+from src.pagination import items, PAGE
+from src.catalog import FlavorCatalog, flavor_catalog
+from src.output import send_entries
+from src.render import Renderer
 from src.utils import add_exit_button
 from src.globalstate import GlobalState
 from ..terraform import TerraformCreate
+from . import ims
 
 ENDPOINT = 'https://ecs.ru-moscow-1.hc.sbercloud.ru'
+SERVICE = Service('ecs', EcsAsyncClient, ENDPOINT)
 
 ECS = Module(
     name='Elastic Cloud Server',
@@ -34,6 +41,7 @@ class Action(str, Enum):
     SHOW = 'show'
     LIST_FLAVORS = 'list flavors'
     SHOW_FLAVOR = 'show flavors'
+    FIND_FLAVOR = 'find flavor'
 
 
 class EcsCallback(CallbackData, prefix='ecs'):
@@ -57,25 +65,6 @@ def keyboard() -> InlineKeyboardMarkup:
 
 @ECS.router.callback_query(F.data == ECS.name)
 async def ecs_main(call: CallbackQuery, state: FSMContext):
-    config = HttpConfig.get_default_config()
-    config.ignore_ssl_verification = False
-
-    data = await state.get_data()
-
-    credentials = BasicCredentials(
-        ak=data['ak'],
-        sk=data['sk'],
-        project_id=data['project_id'],
-    )
-
-    client = EcsAsyncClient().new_builder() \
-        .with_http_config(config) \
-        .with_credentials(credentials) \
-        .with_endpoint(ENDPOINT) \
-        .build()
-
-    await state.update_data(client=client)
-
     await call.message.edit_reply_markup(reply_markup=keyboard())
     await call.answer()
 
@@ -115,17 +104,70 @@ async def ecs_create_name(message: types.Message, state: FSMContext):
 @ECS.router.message(EcsCreateStates.FLAVOR)
 async def ecs_create_flavor(message: types.Message, state: FSMContext):
     flavor = message.text
+    data = await state.get_data()
+    client = get_client(SERVICE, data)
+
+    try:
+        catalog = await flavors(client)
+    except exceptions.SdkException as e:
+        await message.answer(e.error_msg)
+        await state.set_state(GlobalState.DEFAULT)
+        return
+
+    if flavor not in catalog:
+        await message.answer('Такого флейвора нет, введи другой')
+        return
+
     await state.update_data(flavor=flavor)
-    await message.answer('Введи айди образа для новой виртуальной машины')
+    await message.answer('Введи айди образа или часть его имени, например: ubuntu 22')
     await state.set_state(EcsCreateStates.IMAGE_ID)
 
 
+class EcsImageCallback(CallbackData, prefix='ecs_image'):
+    id: str
+
+
 @ECS.router.message(EcsCreateStates.IMAGE_ID)
 async def ecs_create_image_id(message: types.Message, state: FSMContext):
-    image_id = message.text
-    await state.update_data(image_id=image_id)
-    await message.answer('Введи айди vpc для новой виртуальной машины')
+    text = message.text
+    data = await state.get_data()
+    client = get_client(ims.SERVICE, data)
+
+    try:
+        catalog = await ims.images(client)
+        known = text in catalog or await ims.find_image(client, text) is not None
+    except exceptions.SdkException as e:
+        await message.answer(e.error_msg)
+        await state.set_state(GlobalState.DEFAULT)
+        return
+
+    if known:
+        await state.update_data(image_id=text)
+        await message.answer('Введи айди vpc для новой виртуальной машины')
+        await state.set_state(EcsCreateStates.VPC_ID)
+        return
+
+    query = ims.parse_query(text)
+    query.setdefault('status', 'active')
+    found = catalog.search(**query)
+    if not found:
+        await message.answer('Такого образа нет, введи айди или часть имени образа')
+        return
+
+    builder = InlineKeyboardBuilder()
+    for image in found:
+        builder.button(text=image.name or image.id, callback_data=EcsImageCallback(id=image.id))
+    builder.adjust(1)
+
+    await message.answer('Выбери образ или уточни запрос', reply_markup=builder.as_markup())
+
+
+@ECS.router.callback_query(EcsCreateStates.IMAGE_ID, EcsImageCallback.filter())
+async def ecs_create_image_pick(call: CallbackQuery, state: FSMContext, callback_data: EcsImageCallback):
+    await state.update_data(image_id=callback_data.id)
+    await call.message.answer('Введи айди vpc для новой виртуальной машины')
     await state.set_state(EcsCreateStates.VPC_ID)
+    await call.answer()
 
 
 @ECS.router.message(EcsCreateStates.VPC_ID)
@@ -152,18 +194,18 @@ async def ecs_create_network_id(message: types.Message, state: FSMContext):
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    client = data['client']
+    client = get_client(SERVICE, data)
     try:
-        request = CreateServersRequest()
+        # токен идемпотентности: при сбое сети создание можно безопасно повторить
+        request = CreateServersRequest(x_client_token=str(uuid.uuid4()))
         root_volume = PrePaidServerRootVolume(volumetype='SSD')
         nic = PrePaidServerNic(subnet_id=subnet_id)
         server = PrePaidServer(image_ref=data['image_id'], flavor_ref=data['flavor'],
                                name=data['name'], vpcid=data['vpc_id'],
                                root_volume=root_volume, nics=[nic])
         request.body = CreateServersRequestBody(server=server)
-        response = client.create_servers_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.create_servers_async, request, resource='ecs')
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -172,49 +214,56 @@ async def ecs_create_network_id(message: types.Message, state: FSMContext):
     await state.set_state(GlobalState.DEFAULT)
 
 
-def __ecs_to_str(ecs) -> str:
-    text = f'<b>{ecs.name}</b>:\n' + \
-        f'\t id: <code>{ecs.id}</code>\n' + \
-        f'\t flavor: <code>{ecs.flavor}</code>\n' + \
-        f'\t status: <b>{ecs.status}</b>\n'
+ECS_VIEW = Renderer(
+    '<b>{name}</b>:',
+    '\t id: <code>{id}</code>',
+    '\t flavor: <code>{flavor}</code>',
+    '\t status: <b>{status}</b>',
+)
 
-    return text
+
+def __ecs_to_str(ecs) -> str:
+    return ECS_VIEW.render(ecs)
 
 
 @ECS.router.callback_query(EcsCallback.filter(F.action == Action.LIST))
 async def ecs_list(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
     try:
         request = ListServersDetailsRequest()
-        response = client.list_servers_details_async(request)
-        result = response.result()
-    except exceptions.ClientRequestException as e:
+        servers = items(client.list_servers_details_async, request, 'servers', PAGE, resource='ecs')
+        await send_entries(call.message, (__ecs_to_str(ecs) async for ecs in servers), filename='servers.txt')
+    except exceptions.SdkException as e:
         await call.message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    entries = [__ecs_to_str(ecs) for ecs in result.servers]
-    await call.message.answer('\n'.join(entries), parse_mode='html')
     await call.answer()
 
 
+async def flavors(client: EcsAsyncClient) -> FlavorCatalog:
+    return await flavor_catalog((SERVICE.region,) + account_key(client.list_flavors_async),
+                                lambda: items(client.list_flavors_async, ListFlavorsRequest(), 'flavors'))
+
+
 @ECS.router.callback_query(EcsCallback.filter(F.action == Action.LIST_FLAVORS))
 async def ecs_list_flavors(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
 
     try:
-        request = ListFlavorsRequest()
-        response = client.list_flavors_async(request)
-        result = response.result()
-    except exceptions.ClientRequestException as e:
+        catalog = await flavors(client)
+    except exceptions.SdkException as e:
         await call.message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    entries = [flavor.name for flavor in result.flavors]
-    await call.message.answer('\n'.join(entries), parse_mode='html')
+    async def entries():
+        for flavor in catalog.sorted():
+            yield flavor.name
+
+    await send_entries(call.message, entries(), filename='flavors.txt')
     await call.answer()
 
 
@@ -222,13 +271,16 @@ class EcsShowFlavor(StatesGroup):
     SHOW = State()
 
 
-def __flavor_to_str(flavor) -> str:
-    text = f'<b>{flavor.name}</b>:\n' + \
-        f'\t disk: <b>{flavor.disk}</b>\n' + \
-        f'\t vcpus: <b>{flavor.vcpus}</b>\n' + \
-        f'\t ram: <b>{flavor.ram}</b>\n'
+FLAVOR_VIEW = Renderer(
+    '<b>{name}</b>:',
+    '\t disk: <b>{disk}</b>',
+    '\t vcpus: <b>{vcpus}</b>',
+    '\t ram: <b>{ram}</b>',
+)
 
-    return text
+
+def __flavor_to_str(flavor) -> str:
+    return FLAVOR_VIEW.render(flavor)
 
 
 @ECS.router.callback_query(EcsCallback.filter(F.action == Action.SHOW_FLAVOR))
@@ -242,20 +294,56 @@ async def ecs_show_flavor_name(call: CallbackQuery, state: FSMContext):
 async def ecs_show_flavor(message: types.Message, state: FSMContext):
     name = message.text
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
 
     try:
-        request = ListFlavorsRequest()
-        response = client.list_flavors_async(request)
-        result = response.result()
-    except exceptions.ClientRequestException as e:
+        flavor = (await flavors(client)).get(name)
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    entries = [__flavor_to_str(flavor)
-               for flavor in result.flavors if flavor.name == name]
-    await message.answer('\n'.join(entries), parse_mode='html')
+    if flavor is None:
+        await message.answer('Такого флейвора нет')
+    else:
+        await message.answer(__flavor_to_str(flavor), parse_mode='html')
+    await state.set_state(GlobalState.DEFAULT)
+
+
+class EcsFindFlavor(StatesGroup):
+    REQUIREMENTS = State()
+
+
+@ECS.router.callback_query(EcsCallback.filter(F.action == Action.FIND_FLAVOR))
+async def ecs_find_flavor_requirements(call: CallbackQuery, state: FSMContext):
+    await call.message.answer('Сколько нужно минимум vCPU и RAM (GB)? Например: <code>4 8</code>', parse_mode='html')
+    await state.set_state(EcsFindFlavor.REQUIREMENTS)
+    await call.answer()
+
+
+@ECS.router.message(EcsFindFlavor.REQUIREMENTS)
+async def ecs_find_flavor(message: types.Message, state: FSMContext):
+    try:
+        vcpus, ram = (float(value) for value in message.text.replace(',', '.').split())
+    except ValueError:
+        await message.answer('Нужно два числа: vCPU и RAM в GB, например: 4 8')
+        return
+
+    data = await state.get_data()
+    client = get_client(SERVICE, data)
+
+    try:
+        catalog = await flavors(client)
+    except exceptions.SdkException as e:
+        await message.answer(e.error_msg)
+        await state.set_state(GlobalState.DEFAULT)
+        return
+
+    found = catalog.query(min_vcpus=vcpus, min_ram=ram * 1024)
+    if found:
+        await message.answer(FLAVOR_VIEW.render_many(found), parse_mode='html')
+    else:
+        await message.answer('Подходящих флейворов нет')
     await state.set_state(GlobalState.DEFAULT)
 
 
@@ -263,18 +351,21 @@ class EcsShow(StatesGroup):
     SERVER_ID = State()
 
 
-def __server_to_str(server) -> str:
-    text = f'<b>{server.name}</b>: {server.description} \n' + \
-        f'\t flavor: <code>{server.flavor}</code>\n' + \
-        f'\t os type: {server.metadata["os_type"]} \n' + \
-        f'\t os bit: {server.metadata["os_bit"]} \n' + \
-        f'\t charging mode: {server.metadata["charging_mode"]} \n' + \
-        f'\t tags: {server.tags}\n' + \
-        f'\t updated: {server.updated}\n' + \
-        f'\t created: {server.created}\n' + \
-        f'\t status: <b>{server.status}</b>\n'
+SERVER_VIEW = Renderer(
+    '<b>{name}</b>: {description} ',
+    '\t flavor: <code>{flavor}</code>',
+    '\t os type: {metadata[os_type]} ',
+    '\t os bit: {metadata[os_bit]} ',
+    '\t charging mode: {metadata[charging_mode]} ',
+    '\t tags: {tags}',
+    '\t updated: {updated}',
+    '\t created: {created}',
+    '\t status: <b>{status}</b>',
+)
 
-    return text
+
+def __server_to_str(server) -> str:
+    return SERVER_VIEW.render(server)
 
 
 @ECS.router.callback_query(EcsCallback.filter(F.action == Action.SHOW))
@@ -288,13 +379,12 @@ async def ecs_show_server_id(call: CallbackQuery, state: FSMContext):
 async def ecs_show(message: types.Message, state: FSMContext):
     server_id = message.text
     data = await state.get_data()
-    client = data['client']  # type: EcsAsyncClient
+    client = get_client(SERVICE, data)  # type: EcsAsyncClient
 
     try:
         request = ShowServerRequest(server_id=server_id)
-        response = client.show_server_async(request)
-        result = response.result()
-    except exceptions.ClientRequestException as e:
+        result = await execute(client.show_server_async, request, resource='ecs')
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -1,15 +1,14 @@
 from enum import Enum
 
 from aiogram import F, Router, types
+from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
 from aiogram.types.callback_query import CallbackQuery
 from aiogram.filters.callback_data import CallbackData
 from aiogram.filters.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
-from huaweicloudsdkcore.auth.credentials import GlobalCredentials
 from huaweicloudsdkcore.exceptions import exceptions
-from huaweicloudsdkcore.http.http_config import HttpConfig
 from huaweicloudsdkeps.v1 import (EpsAsyncClient, ListEnterpriseProjectRequest,
                                   CreateEnterpriseProjectRequest, EnterpriseProject,
                                   EnableEnterpriseProjectRequest, DisableAction,
@@ -18,11 +17,17 @@ from huaweicloudsdkeps.v1 import (EpsAsyncClient, ListEnterpriseProjectRequest,
                                   ResqEpResouce)
 
 from src.module import Module
-from src.utils import add_exit_button
+from src.clients import Service, get_client
+from src.sdk import execute
+from src.pagination import items, picker_page, OFFSET
+from src.output import send_entries
+from src.render import Renderer
+from src.utils import add_exit_button, add_page_buttons
 from src.globalstate import GlobalState
 from src.terraform import TerraformCreate
 
 ENDPOINT = 'https://eps.ru-moscow-1.hc.sbercloud.ru'
+SERVICE = Service('eps', EpsAsyncClient, ENDPOINT, scope='domain')
 
 EPS = Module(
     name='Enterprise Project Management Service',
@@ -65,25 +70,6 @@ def keyboard() -> InlineKeyboardMarkup:
 
 @EPS.router.callback_query(F.data == EPS.name)
 async def eps_main(call: CallbackQuery, state: FSMContext):
-    config = HttpConfig.get_default_config()
-    config.ignore_ssl_verification = False
-
-    data = await state.get_data()
-
-    credentials = GlobalCredentials(
-        ak=data['ak'],
-        sk=data['sk'],
-        domain_id=data['account_id'],
-    )
-
-    client = EpsAsyncClient().new_builder() \
-        .with_http_config(config) \
-        .with_credentials(credentials) \
-        .with_endpoint(ENDPOINT) \
-        .build()
-
-    await state.update_data(client=client)
-
     await call.message.edit_reply_markup(reply_markup=keyboard())
     await call.answer()
 
@@ -131,14 +117,13 @@ async def eps_create_desc(message: types.Message, state: FSMContext):
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    client = data['client']
+    client = get_client(SERVICE, data)
 
     try:
         request = CreateEnterpriseProjectRequest()
         request.body = EnterpriseProject(data['name'], description)
-        response = client.create_enterprise_project_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.create_enterprise_project_async, request, resource='eps')
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -147,28 +132,34 @@ async def eps_create_desc(message: types.Message, state: FSMContext):
     await state.set_state(GlobalState.DEFAULT)
 
 
-def __eps_to_str(eps) -> str:
-    text = f'<b>{eps.name}</b>: {eps.description}\n' + \
-        f'\t id: <code>{eps.id}</code>\n' + \
-        f'\t status: <b>{"enabled" if eps.status == 1 else "disabled"}</b>\n'
+EPS_VIEW = Renderer(
+    '<b>{name}</b>: {description}',
+    '\t id: <code>{id}</code>',
+    '\t status: <b>{status}</b>',
+    status=lambda eps: 'enabled' if eps.status == 1 else 'disabled',
+)
 
-    return text
+
+def __eps_to_str(eps) -> str:
+    return EPS_VIEW.render(eps)
 
 
-def __create_epss_keyboard(client, callbacktype):
+async def __create_epss_keyboard(client, callbacktype, page=0):
     request = ListEnterpriseProjectRequest()
-    response = client.list_enterprise_project_async(request)
-    result = response.result()
+    epss, has_next = await picker_page(client.list_enterprise_project_async, request, 'enterprise_projects', page, OFFSET, resource='eps')
 
     builder = InlineKeyboardBuilder()
 
-    for eps in result.enterprise_projects:
+    for eps in epss:
         builder.button(
             text=eps.name,
             callback_data=callbacktype(action='do', id=eps.id),
         )
-    builder.button(text='Назад', callback_data=callbacktype(
-        action='back', id='____'))
+    builder.adjust(2)
+
+    add_page_buttons(builder, callbacktype, page, has_next)
+    builder.row(InlineKeyboardButton(text='Назад', callback_data=callbacktype(
+        action='back', id='____').pack()))
 
     return builder.as_markup()
 
@@ -176,13 +167,21 @@ def __create_epss_keyboard(client, callbacktype):
 class EpsShowCallback(CallbackData, prefix='eps_show'):
     action: str
     id: str
+    page: int = 0
 
 
 @EPS.router.callback_query(EpsCallback.filter(F.action == Action.SHOW_PROJECT))
 async def eps_show_buttons(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: EpsAsyncClient
-    await call.message.edit_text('Выбери EPS', reply_markup=__create_epss_keyboard(client, EpsShowCallback))
+    client = get_client(SERVICE, data)  # type: EpsAsyncClient
+    try:
+        markup = await __create_epss_keyboard(client, EpsShowCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери EPS', reply_markup=markup)
     await call.answer()
 
 
@@ -195,12 +194,16 @@ async def eps_show_buttons_back(call: CallbackQuery):
 @EPS.router.callback_query(EpsShowCallback.filter(F.action == 'do'))
 async def eps_show_buttons_entry(call: CallbackQuery, state: FSMContext, callback_data: EpsShowCallback):
     data = await state.get_data()
-    client = data['client']  # type: EpsAsyncClient
+    client = get_client(SERVICE, data)  # type: EpsAsyncClient
 
-    request = ShowEnterpriseProjectRequest(
-        enterprise_project_id=callback_data.id)
-    response = client.show_enterprise_project_async(request)
-    result = response.result()
+    try:
+        request = ShowEnterpriseProjectRequest(
+            enterprise_project_id=callback_data.id)
+        result = await execute(client.show_enterprise_project_async, request, resource='eps')
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
 
     await call.message.reply(__eps_to_str(result.enterpise_project), parse_mode='html')
     await call.answer()
@@ -209,47 +212,53 @@ async def eps_show_buttons_entry(call: CallbackQuery, state: FSMContext, callbac
 @EPS.router.callback_query(EpsCallback.filter(F.action == Action.LIST))
 async def eps_list(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
 
     try:
         request = ListEnterpriseProjectRequest()
-        response = client.list_enterprise_project_async(request)
-        result = response.result()
-    except exceptions.ClientRequestException as e:
+        projects = items(client.list_enterprise_project_async, request, 'enterprise_projects', OFFSET, resource='eps')
+        await send_entries(call.message, (__eps_to_str(eps) async for eps in projects), filename='projects.txt')
+    except exceptions.SdkException as e:
         await call.message.answer(e.error_msg)
+        await call.answer()
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    entry = [__eps_to_str(eps) for eps in result.enterprise_projects]
-    await call.message.answer('\n'.join(entry), parse_mode='html')
     await call.answer()
 
 
 class EpsDisableCallback(CallbackData, prefix='eps_disable'):
     action: str
     id: str
+    page: int = 0
 
 
 @EPS.router.callback_query(EpsCallback.filter(F.action == Action.DISABLE))
 async def eps_disable(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: EpsAsyncClient
-    await call.message.edit_text('Выбери EPS для отключения', reply_markup=__create_epss_keyboard(client, EpsDisableCallback))
+    client = get_client(SERVICE, data)  # type: EpsAsyncClient
+    try:
+        markup = await __create_epss_keyboard(client, EpsDisableCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери EPS для отключения', reply_markup=markup)
     await call.answer()
 
 
 @EPS.router.callback_query(EpsDisableCallback.filter(F.action == 'do'))
 async def eps_disable_entry(call: CallbackQuery, state: FSMContext, callback_data: EpsDisableCallback):
     data = await state.get_data()
-    client = data['client']  # type: EpsAsyncClient
+    client = get_client(SERVICE, data)  # type: EpsAsyncClient
 
     try:
         request = DisableEnterpriseProjectRequest(
             enterprise_project_id=callback_data.id)
         request.body = DisableAction('disable')
-        response = client.disable_enterprise_project_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.disable_enterprise_project_async, request, resource='eps')
+    except exceptions.SdkException as e:
         await call.message.answer(e.error_msg)
         await call.answer()
         return
@@ -267,28 +276,35 @@ async def eps_disable_back(call: CallbackQuery):
 class EpsEnableCallback(CallbackData, prefix='eps_enable'):
     action: str
     id: str
+    page: int = 0
 
 
 @EPS.router.callback_query(EpsCallback.filter(F.action == Action.DISABLE))
 async def eps_enable(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: EpsAsyncClient
-    await call.message.edit_text('Выбери EPS для отключения', reply_markup=__create_epss_keyboard(client, EpsEnableCallback))
+    client = get_client(SERVICE, data)  # type: EpsAsyncClient
+    try:
+        markup = await __create_epss_keyboard(client, EpsEnableCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери EPS для отключения', reply_markup=markup)
     await call.answer()
 
 
 @EPS.router.callback_query(EpsEnableCallback.filter(F.action == 'do'))
 async def eps_enable_entry(call: CallbackQuery, state: FSMContext, callback_data: EpsDisableCallback):
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
 
     try:
         request = EnableEnterpriseProjectRequest(
             enterprise_project_id=callback_data.id)
         request.body = DisableAction('enable')
-        response = client.enable_enterprise_project_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.enable_enterprise_project_async, request, resource='eps')
+    except exceptions.SdkException as e:
         await call.message.answer(e.error_msg)
         await call.answer()
         return
@@ -320,14 +336,13 @@ async def eps_disable_by_id(message: types.Message, state: FSMContext):
     proj_id = message.text
 
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
 
     try:
         request = DisableEnterpriseProjectRequest(proj_id)
         request.body = DisableAction('disable')
-        response = client.disable_enterprise_project_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.disable_enterprise_project_async, request, resource='eps')
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -348,14 +363,13 @@ async def eps_enable_by_id(message: types.Message, state: FSMContext):
     proj_id = message.text
 
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
 
     try:
         request = EnableEnterpriseProjectRequest(proj_id)
         request.body = DisableAction('enable')
-        response = client.enable_enterprise_project_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.enable_enterprise_project_async, request, resource='eps')
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -399,14 +413,13 @@ async def eps_update_desc(message: types.Message, state: FSMContext):
 async def eps_update_by_id(message: types.Message, state: FSMContext):
     description = message.text
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
 
     try:
         request = UpdateEnterpriseProjectRequest(data['project_id'])
         request.body = EnterpriseProject(data['name'], description)
-        response = client.update_enterprise_project_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.update_enterprise_project_async, request, resource='eps')
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -418,13 +431,21 @@ async def eps_update_by_id(message: types.Message, state: FSMContext):
 class EpsUpdateCallback(CallbackData, prefix='eps_update'):
     action: str
     id: str
+    page: int = 0
 
 
 @EPS.router.callback_query(EpsCallback.filter(F.action == Action.UPDATE))
 async def eps_update(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: EpsAsyncClient
-    await call.message.edit_text('Выбери EPS для изменения', reply_markup=__create_epss_keyboard(client, EpsUpdateCallback))
+    client = get_client(SERVICE, data)  # type: EpsAsyncClient
+    try:
+        markup = await __create_epss_keyboard(client, EpsUpdateCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери EPS для изменения', reply_markup=markup)
     await call.answer()
 
 
@@ -450,7 +471,7 @@ async def eps_show_resources_project_id(call: CallbackQuery, state: FSMContext):
 @EPS.router.message(EpsShowResources.PROJECT_ID)
 async def eps_show_resources(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
     enterprise_project_id = message.text
     project_id = data['project_id']
 
@@ -459,9 +480,8 @@ async def eps_show_resources(message: types.Message, state: FSMContext):
             enterprise_project_id=enterprise_project_id)
         request.body = ResqEpResouce(
             resource_types=['ecs', 'vpcs', 'images', 'disk'], projects=[project_id])
-        response = client.show_resource_bind_enterprise_project_async(request)
-        result = response.result()
-    except exceptions.ClientRequestException as e:
+        result = await execute(client.show_resource_bind_enterprise_project_async, request)
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -483,3 +503,21 @@ async def eps_update_entry(call: CallbackQuery, state: FSMContext, callback_data
 async def eps_update_back(call: CallbackQuery):
     await call.message.edit_text('Enterprise Project Management', reply_markup=keyboard())
     await call.answer()
+
+
+@EPS.router.callback_query(EpsShowCallback.filter(F.action == 'page'))
+@EPS.router.callback_query(EpsDisableCallback.filter(F.action == 'page'))
+@EPS.router.callback_query(EpsEnableCallback.filter(F.action == 'page'))
+@EPS.router.callback_query(EpsUpdateCallback.filter(F.action == 'page'))
+async def eps_picker_page(call: CallbackQuery, state: FSMContext, callback_data: CallbackData):
+    data = await state.get_data()
+    client = get_client(SERVICE, data)  # type: EpsAsyncClient
+    try:
+        markup = await __create_epss_keyboard(client, type(callback_data), callback_data.page)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_reply_markup(reply_markup=markup)
+    await call.answer()
@@ -1,5 +1,5 @@
+import re
 from enum import Enum
-import json
 
 from aiogram import F, Router, types
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
@@ -8,17 +8,25 @@ from aiogram.filters.callback_data import CallbackData
 from aiogram.filters.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
-from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkcore.exceptions import exceptions
-from huaweicloudsdkcore.http.http_config import HttpConfig
 from huaweicloudsdkims.v2 import *
 
 from src.module import Module
+from src.clients import Service, get_client
+from src.transport import TransportConfig
+from src.sdk import account_key, execute
+from src.pagination import items
+from src.catalog import ImageCatalog, image_catalog
+from src.output import send_entries
+from src.render import Renderer, Line
 from src.utils import add_exit_button
 from src.globalstate import GlobalState
 from ..terraform import TerraformCreate
 
 ENDPOINT = 'https://ims.ru-moscow-1.hc.sbercloud.ru'
+SERVICE = Service('ims', ImsAsyncClient, ENDPOINT, scope=None, transport=TransportConfig(read_timeout=120))
+
+_IMAGE_ID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
 
 IMS = Module(
     name='Image Management Service',
@@ -30,6 +38,7 @@ class Action(str, Enum):
     CREATE = 'create'
     CREATE_TERRAFORM = 'create terraform'
     LIST = 'list'
+    SEARCH = 'search'
     IMPORT = 'import'
 
 
@@ -54,24 +63,6 @@ def keyboard() -> InlineKeyboardMarkup:
 
 @IMS.router.callback_query(F.data == IMS.name)
 async def ims_main(call: CallbackQuery, state: FSMContext):
-    config = HttpConfig.get_default_config()
-    config.ignore_ssl_verification = False
-
-    data = await state.get_data()
-
-    credentials = BasicCredentials(
-        ak=data['ak'],
-        sk=data['sk'],
-    )
-
-    client = ImsAsyncClient().new_builder() \
-        .with_http_config(config) \
-        .with_credentials(credentials) \
-        .with_endpoint(ENDPOINT) \
-        .build()
-
-    await state.update_data(client=client)
-
     await call.message.edit_reply_markup(reply_markup=keyboard())
     await call.answer()
 
@@ -127,15 +118,14 @@ async def ims_create_network_id(message: types.Message, state: FSMContext):
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    client = data['client']
+    client = get_client(SERVICE, data)
     description = message.text
     try:
         request = CreateImageRequest()
         request.body = CreateImageRequestBody(
             name=data['name'], instance_id=data['instance_id'], description=description)
-        response = client.create_image_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.create_image_async, request, resource='ims')
+    except exceptions.SdkException as e:
         await message.answer('Не вышло :(')
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
@@ -145,24 +135,28 @@ async def ims_create_network_id(message: types.Message, state: FSMContext):
     await state.set_state(GlobalState.DEFAULT)
 
 
+IMAGE_VIEW = Renderer(
+    Line('**Name:**\t`{name}`', optional=True),
+    Line('**ID:**\t`{id}`', optional=True),
+    escape=None,
+)
+
+
+def __image_to_str(image) -> str:
+    return IMAGE_VIEW.render(image)
+
+
 @IMS.router.callback_query(ImsCallback.filter(F.action == Action.LIST))
 async def ims_list(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
     try:
         request = ListImagesRequest()
-        response = client.list_images_async(request)
-        response = json.loads(str(response.result()))
-        messag = '**Доступные образы:**\n'
-        for image in response['images']:
-            messag += ('**Name:**\t`' +
-                       image['name'] + '`') if image['name'] else ''
-            messag += '\n'
-            messag += ('**ID:**\t`' + image['id'] + '`') if image['id'] else ''
-            messag += '\n'
-            messag += '\n'
-        await call.message.answer(messag, parse_mode='markdown')
-    except exceptions.ClientRequestException as e:
+        images = items(client.list_images_async, request, 'images', resource='ims')
+        await call.message.answer('**Доступные образы:**', parse_mode='markdown')
+        await send_entries(call.message, (__image_to_str(image) async for image in images),
+                           parse_mode='markdown', filename='images.txt')
+    except exceptions.SdkException as e:
         await call.message.answer('Не вышло :(')
         await call.message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
@@ -171,6 +165,80 @@ async def ims_list(call: CallbackQuery, state: FSMContext):
     await call.answer()
 
 
+async def images(client: ImsAsyncClient) -> ImageCatalog:
+    def loader(since):
+        request = ListImagesRequest(updated_at=f'gte:{since}' if since else None)
+        return items(client.list_images_async, request, 'images')
+
+    return await image_catalog((SERVICE.region,) + account_key(client.list_images_async), loader)
+
+
+async def find_image(client: ImsAsyncClient, image_id: str):
+    """
+    Образ по id мимо справочника: справочник может отставать на `ttl`, а образы
+    создаются не только ботом. None, если образа нет или строка не похожа на id.
+    """
+    if not _IMAGE_ID.fullmatch(image_id):
+        return None
+
+    try:
+        return await execute(client.glance_show_image_async, GlanceShowImageRequest(image_id=image_id),
+                             resource='ims')
+    except exceptions.ClientRequestException as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
+def parse_query(text: str) -> dict:
+    """`ubuntu 22 os_type:linux disk:40` -> аргументы `ImageCatalog.search`."""
+    words = []
+    query = {}
+    for word in text.split():
+        name, _, value = word.partition(':')
+        if value and name in ImageCatalog.ATTRIBUTES:
+            query[name] = value
+        elif value and name == 'disk' and value.isdigit():
+            query['disk'] = int(value)
+        else:
+            words.append(word)
+
+    query['text'] = ' '.join(words)
+
+    return query
+
+
+class ImsSearchState(StatesGroup):
+    QUERY = State()
+
+
+@IMS.router.callback_query(ImsCallback.filter(F.action == Action.SEARCH))
+async def ims_search_query(call: CallbackQuery, state: FSMContext):
+    await call.message.answer('Что ищем? Например: `ubuntu 22 visibility:public disk:40`', parse_mode='markdown')
+    await state.set_state(ImsSearchState.QUERY)
+    await call.answer()
+
+
+@IMS.router.message(ImsSearchState.QUERY)
+async def ims_search(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    client = get_client(SERVICE, data)
+    try:
+        catalog = await images(client)
+    except exceptions.SdkException as e:
+        await message.answer('Не вышло :(')
+        await message.answer(e.error_msg)
+        await state.set_state(GlobalState.DEFAULT)
+        return
+
+    found = catalog.search(**parse_query(message.text))
+    if found:
+        await message.answer(IMAGE_VIEW.render_many(found), parse_mode='markdown')
+    else:
+        await message.answer('Ничего не найдено')
+    await state.set_state(GlobalState.DEFAULT)
+
+
 class ImsImportState(StatesGroup):
     NAME = State()
     OS_VERSION = State()
@@ -213,15 +281,14 @@ async def ims_import_min_disk(message: types.Message, state: FSMContext):
 async def ims_import_image_url(message: types.Message, state: FSMContext):
     data = await state.get_data()
     image_url = await state.get_data()
-    client = data['client']
+    client = get_client(SERVICE, data)
     image_url = message.text
     try:
         request = ImportImageQuickRequest()
         request.body = QuickImportImageByFileRequestBody(
             image_url=image_url, min_disk=data['min_disk'], name=data['name'], os_version=data['os_version'])
-        response = client.import_image_quick_async(request)
-        response.result()
-    except exceptions.ClientRequestException as e:
+        await execute(client.import_image_quick_async, request, resource='ims')
+    except exceptions.SdkException as e:
         await message.answer('Не вышло :(')
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
@@ -1,6 +1,8 @@
 from enum import Enum
+from typing import Optional
 
 from aiogram import F, Router, types
+from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
 from aiogram.types.callback_query import CallbackQuery
 from aiogram.filters.callback_data import CallbackData
@@ -8,9 +10,7 @@ from aiogram.filters.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
 
-from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkcore.exceptions import exceptions
-from huaweicloudsdkcore.http.http_config import HttpConfig
 from huaweicloudsdknat.v2 import NatAsyncClient, ListNatGatewaysRequest, ListNatGatewaysResponse
 from huaweicloudsdknat.v2 import CreateNatGatewayOption, CreateNatGatewayRequest, CreateNatGatewayRequestBody, CreateNatGatewayResponse
 from huaweicloudsdknat.v2 import DeleteNatGatewayRequest
@@ -18,11 +18,17 @@ from huaweicloudsdknat.v2 import ShowNatGatewayRequest, ShowNatGatewayResponse
 from huaweicloudsdknat.v2 import UpdateNatGatewayOption, UpdateNatGatewayRequest, UpdateNatGatewayRequestBody
 
 from src.module import Module
-from src.utils import add_exit_button
+from src.clients import Service, get_client
+from src.sdk import execute
+from src.pagination import items, picker_page
+from src.output import send_entries
+from src.render import Renderer
+from src.utils import add_exit_button, add_page_buttons
 from src.globalstate import GlobalState
 from src.terraform import TerraformCreate
 
 ENDPOINT = 'https://nat.ru-moscow-1.hc.sbercloud.ru'
+SERVICE = Service('nat', NatAsyncClient, ENDPOINT)
 
 NAT = Module(
     name='Public NAT Gateway',
@@ -63,25 +69,6 @@ def keyboard() -> InlineKeyboardMarkup:
 
 @NAT.router.callback_query(F.data == NAT.name)
 async def nat_main(call: CallbackQuery, state: FSMContext):
-    config = HttpConfig.get_default_config()
-    config.ignore_ssl_verification = False
-
-    data = await state.get_data()
-
-    credentials = BasicCredentials(
-        ak=data['ak'],
-        sk=data['sk'],
-        project_id=data['project_id'],
-    )
-
-    client = NatAsyncClient().new_builder() \
-        .with_http_config(config) \
-        .with_credentials(credentials) \
-        .with_endpoint(ENDPOINT) \
-        .build()
-
-    await state.update_data(client=client)
-
     await call.message.edit_reply_markup(reply_markup=keyboard())
     await call.answer()
 
@@ -169,7 +156,7 @@ async def nat_create_projid(message: types.Message, state: FSMContext):
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    client = data['client']  # type: NatAsyncClient
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
 
     try:
         nat = CreateNatGatewayOption(
@@ -183,15 +170,14 @@ async def nat_create_projid(message: types.Message, state: FSMContext):
 
         body = CreateNatGatewayRequestBody(nat)
         request = CreateNatGatewayRequest(body)
-        response = client.create_nat_gateway_async(request)
-        result = response.result()  # type: CreateNatGatewayResponse
+        result = await execute(client.create_nat_gateway_async, request, resource='nat')  # type: CreateNatGatewayResponse
 
         if result.nat_gateway is None:
             await message.answer('Ошибка!')
             await message.answer(str(result))
             await state.set_state(GlobalState.DEFAULT)
             return
-    except exceptions.ClientRequestException as e:
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -200,30 +186,35 @@ async def nat_create_projid(message: types.Message, state: FSMContext):
     await state.set_state(GlobalState.DEFAULT)
 
 
-def __nat_to_str(nat) -> str:
-    text = f'<b>{nat.name}</b>: {nat.description}\n' + \
-        f'\t id: <code>{nat.id}</code>\n' + \
-        f'\t spec: <b>{nat.spec}</b>\n' + \
-        f'\t router id: <code>{nat.router_id}</code>\n' + \
-        f'\t status: <b>{nat.status}</b>\n'
+NAT_VIEW = Renderer(
+    '<b>{name}</b>: {description}',
+    '\t id: <code>{id}</code>',
+    '\t spec: <b>{spec}</b>',
+    '\t router id: <code>{router_id}</code>',
+    '\t status: <b>{status}</b>',
+)
 
-    return text
+
+def __nat_to_str(nat) -> str:
+    return NAT_VIEW.render(nat)
 
 
-def __create_nats_keyboard(client, callbacktype):
+async def __create_nats_keyboard(client, callbacktype, page=0, marker=None):
     request = ListNatGatewaysRequest()
-    response = client.list_nat_gateways_async(request)
-    result = response.result()
+    nats, has_next = await picker_page(client.list_nat_gateways_async, request, 'nat_gateways', page, resource='nat', marker=marker)
 
     builder = InlineKeyboardBuilder()
 
-    for nat in result.nat_gateways:
+    for nat in nats:
         builder.button(
             text=nat.name,
             callback_data=callbacktype(action='do', id=nat.id),
         )
-    builder.button(text='Назад', callback_data=callbacktype(
-        action='back', id='____'))
+    builder.adjust(2)
+
+    add_page_buttons(builder, callbacktype, page, has_next, nats[-1].id if nats else None)
+    builder.row(InlineKeyboardButton(text='Назад', callback_data=callbacktype(
+        action='back', id='____').pack()))
 
     return builder.as_markup()
 
@@ -231,27 +222,39 @@ def __create_nats_keyboard(client, callbacktype):
 @NAT.router.callback_query(GlobalState.DEFAULT, NatCallback.filter(F.action == Action.LIST))
 async def nat_list(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
 
-    request = ListNatGatewaysRequest()
-    response = client.list_nat_gateways_async(request)
-    result = response.result()  # type: ListNatGatewaysResponse
+    try:
+        request = ListNatGatewaysRequest()
+        nats = items(client.list_nat_gateways_async, request, 'nat_gateways', resource='nat')
+        await send_entries(call.message, (__nat_to_str(nat) async for nat in nats), filename='nats.txt')
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
 
-    entries = [__nat_to_str(nat) for nat in result.nat_gateways]
-    await call.message.answer('\n'.join(entries), parse_mode='html')
     await call.answer()
 
 
 class NatShowCallback(CallbackData, prefix='nat_show'):
     action: str  # do or back
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @NAT.router.callback_query(NatCallback.filter(F.action == Action.SHOW))
 async def nat_show_buttons(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
-    await call.message.edit_text('Выбери NAT', reply_markup=__create_nats_keyboard(client, NatShowCallback))
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
+    try:
+        markup = await __create_nats_keyboard(client, NatShowCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери NAT', reply_markup=markup)
     await call.answer()
 
 
@@ -264,11 +267,15 @@ async def nat_show_buttons_back(call: CallbackQuery):
 @NAT.router.callback_query(NatShowCallback.filter(F.action == 'do'))
 async def nat_show_buttons_entry(call: CallbackQuery, state: FSMContext, callback_data: NatShowCallback):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
 
-    request = ShowNatGatewayRequest(nat_gateway_id=callback_data.id)
-    response = client.show_nat_gateway_async(request)
-    result = response.result()
+    try:
+        request = ShowNatGatewayRequest(nat_gateway_id=callback_data.id)
+        result = await execute(client.show_nat_gateway_async, request, resource='nat')
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
 
     await call.message.reply(__nat_to_str(result.nat_gateway), parse_mode='html')
     await call.answer()
@@ -277,26 +284,34 @@ async def nat_show_buttons_entry(call: CallbackQuery, state: FSMContext, callbac
 class NatDeleteCallback(CallbackData, prefix='nat_delete'):
     action: str
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @NAT.router.callback_query(NatCallback.filter(F.action == Action.DELETE))
 async def nat_delete(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
-    await call.message.edit_text('Выбери NAT для удаления', reply_markup=__create_nats_keyboard(client, NatDeleteCallback))
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
+    try:
+        markup = await __create_nats_keyboard(client, NatDeleteCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери NAT для удаления', reply_markup=markup)
     await call.answer()
 
 
 @NAT.router.callback_query(NatDeleteCallback.filter(F.action == 'do'))
 async def nat_delete_entry(call: CallbackQuery, state: FSMContext, callback_data: NatDeleteCallback):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
 
     try:
         request = DeleteNatGatewayRequest(nat_gateway_id=callback_data.id)
-        response = client.delete_nat_gateway_async(request)
-        response.result()
-    except exceptions.ClientRequestException as exc:
+        await execute(client.delete_nat_gateway_async, request, resource='nat')
+    except exceptions.SdkException as exc:
         await call.message.answer(exc.error_msg)
         await call.answer()
         return
@@ -325,15 +340,14 @@ async def nat_delete_id(call: CallbackQuery, state: FSMContext):
 @NAT.router.message(NatDeleteStates.ID)
 async def nat_delete_by_id(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
 
     nat_id = message.text
 
     try:
         request = DeleteNatGatewayRequest(nat_gateway_id=nat_id)
-        response = client.delete_nat_gateway_async(request)
-        response.result()
-    except exceptions.ClientRequestException as exc:
+        await execute(client.delete_nat_gateway_async, request, resource='nat')
+    except exceptions.SdkException as exc:
         await message.answer(exc.error_msg)
 
         # TODO: ещё попытку
@@ -358,13 +372,12 @@ async def nat_show_id(call: CallbackQuery, state: FSMContext):
 @NAT.router.message(NatShowStates.ID)
 async def nat_show(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
 
     nat_id = message.text
     try:
         request = ShowNatGatewayRequest(nat_gateway_id=nat_id)
-        response = client.show_nat_gateway_async(request)
-        result = response.result()  # type: ShowNatGatewayResponse
+        result = await execute(client.show_nat_gateway_async, request, resource='nat')  # type: ShowNatGatewayResponse
 
         if result.nat_gateway is None:
             await message.answer('Ошибка!')
@@ -374,7 +387,7 @@ async def nat_show(message: types.Message, state: FSMContext):
 
         await message.answer(str(result))
 
-    except exceptions.ClientRequestException as exc:
+    except exceptions.SdkException as exc:
         await message.answer(exc.error_msg)
 
         # TODO: ещё попытку
@@ -428,7 +441,7 @@ async def nat_update_spec(message: types.Message, state: FSMContext):
 @NAT.router.message(NatUpdateStates.SPEC)
 async def nat_update_by_id(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
 
     spec = message.text
     try:
@@ -441,15 +454,14 @@ async def nat_update_by_id(message: types.Message, state: FSMContext):
         request = UpdateNatGatewayRequest(
             body=body, nat_gateway_id=data['nat_id'])
 
-        response = client.update_nat_gateway_async(request)
-        result = response.result()
+        result = await execute(client.update_nat_gateway_async, request, resource='nat')
 
         if result.nat_gateway is None:
             await message.answer('Ошибка!')
             await message.answer(str(result))
             await state.set_state(GlobalState.DEFAULT)
             return
-    except exceptions.ClientRequestException as exc:
+    except exceptions.SdkException as exc:
         await message.answer(exc.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -461,13 +473,22 @@ async def nat_update_by_id(message: types.Message, state: FSMContext):
 class NatUpdateCallback(CallbackData, prefix='nat_update'):
     action: str
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @NAT.router.callback_query(NatCallback.filter(F.action == Action.UPDATE))
 async def nat_update(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: NatAsyncClient
-    await call.message.edit_text('Выбери NAT для изменения', reply_markup=__create_nats_keyboard(client, NatUpdateCallback))
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
+    try:
+        markup = await __create_nats_keyboard(client, NatUpdateCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери NAT для изменения', reply_markup=markup)
     await call.answer()
 
 
@@ -483,3 +504,20 @@ async def nat_update_entry(call: CallbackQuery, state: FSMContext, callback_data
 async def nat_update_back(call: CallbackQuery):
     await call.message.edit_text('NAT', reply_markup=keyboard())
     await call.answer()
+
+
+@NAT.router.callback_query(NatShowCallback.filter(F.action == 'page'))
+@NAT.router.callback_query(NatDeleteCallback.filter(F.action == 'page'))
+@NAT.router.callback_query(NatUpdateCallback.filter(F.action == 'page'))
+async def nat_picker_page(call: CallbackQuery, state: FSMContext, callback_data: CallbackData):
+    data = await state.get_data()
+    client = get_client(SERVICE, data)  # type: NatAsyncClient
+    try:
+        markup = await __create_nats_keyboard(client, type(callback_data), callback_data.page, callback_data.marker)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_reply_markup(reply_markup=markup)
+    await call.answer()
@@ -0,0 +1,131 @@
+from enum import Enum
+
+from aiogram import F, Router, types
+from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
+from aiogram.types.callback_query import CallbackQuery
+from aiogram.types import BufferedInputFile
+from aiogram.filters.callback_data import CallbackData
+from aiogram.filters.state import StatesGroup, State
+from aiogram.fsm.context import FSMContext
+
+from huaweicloudsdkecs.v2 import ListServersDetailsRequest
+from huaweicloudsdkvpc.v2 import ListVpcsRequest, ListSubnetsRequest
+from huaweicloudsdknat.v2 import ListNatGatewaysRequest
+from huaweicloudsdkeps.v1 import ListEnterpriseProjectRequest
+from huaweicloudsdkims.v2 import ListImagesRequest
+
+from src.module import Module
+from src.pagination import OFFSET, PAGE
+from src.inventory import CSV, JSON, Source, export
+from src.changes import ChangeWatcher
+from src.utils import add_exit_button
+from src.globalstate import GlobalState
+from . import ecs, eps, ims, nat, subnet, vpc
+
+REPORT = Module(
+    name='Inventory Report',
+    router=Router(name='report')
+)
+
+SOURCES = [
+    Source('ecs', ecs.SERVICE, 'list_servers_details_async', ListServersDetailsRequest, 'servers', PAGE,
+           details=('flavor.name', 'created')),
+    Source('vpc', vpc.SERVICE, 'list_vpcs_async', ListVpcsRequest, 'vpcs', details=('cidr',)),
+    Source('subnet', subnet.SERVICE, 'list_subnets_async', ListSubnetsRequest, 'subnets',
+           details=('cidr', 'vpc_id', 'gateway_ip')),
+    Source('nat', nat.SERVICE, 'list_nat_gateways_async', ListNatGatewaysRequest, 'nat_gateways',
+           details=('spec', 'router_id')),
+    Source('eps', eps.SERVICE, 'list_enterprise_project_async', ListEnterpriseProjectRequest, 'enterprise_projects',
+           OFFSET),
+    # только собственные образы аккаунта: публичный каталог региона в инвентарь не входит
+    Source('ims', ims.SERVICE, 'list_images_async', lambda: ListImagesRequest(imagetype='private'), 'images',
+           details=('os_type', 'visibility', 'min_disk')),
+]
+
+
+CHANGES = ChangeWatcher(SOURCES)
+
+
+class Action(str, Enum):
+    CSV = CSV
+    JSON = JSON
+    SUBSCRIBE = 'subscribe changes'
+    UNSUBSCRIBE = 'unsubscribe changes'
+
+
+class ReportCallback(CallbackData, prefix='report'):
+    action: Action
+
+
+def keyboard() -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+
+    for action in Action:
+        builder.button(
+            text=action.value.title(),
+            callback_data=ReportCallback(action=action.value),
+        )
+
+    add_exit_button(builder)
+    builder.adjust(2)
+
+    return builder.as_markup()
+
+
+@REPORT.router.callback_query(F.data == REPORT.name)
+async def report_main(call: CallbackQuery, state: FSMContext):
+    await call.message.edit_reply_markup(reply_markup=keyboard())
+    await call.answer()
+
+
+@REPORT.router.callback_query(ReportCallback.filter(F.action.in_({Action.CSV, Action.JSON})))
+async def report_export(call: CallbackQuery, state: FSMContext, callback_data: ReportCallback):
+    await call.answer('Собираю отчёт')
+    data = await state.get_data()
+
+    document, count, errors = await export(SOURCES, data, callback_data.action.value)
+
+    caption = f'Ресурсов: {count}'
+    if errors:
+        caption += '\nНе удалось получить: ' + ', '.join(f'{resource} ({error})' for resource, error in errors.items())
+
+    filename = f'inventory.{callback_data.action.value}.gz'
+    await call.message.answer_document(BufferedInputFile(document, filename=filename), caption=caption[:1024])
+
+
+class ReportSubscribeStates(StatesGroup):
+    RESOURCES = State()
+
+
+@REPORT.router.callback_query(ReportCallback.filter(F.action == Action.SUBSCRIBE))
+async def report_subscribe_resources(call: CallbackQuery, state: FSMContext):
+    resources = ' '.join(source.resource for source in SOURCES)
+    await call.message.answer(f'Какие ресурсы отслеживать? Перечисли через пробел: <code>{resources}</code> '
+                              f'или <code>all</code>', parse_mode='html')
+    await state.set_state(ReportSubscribeStates.RESOURCES)
+    await call.answer()
+
+
+@REPORT.router.message(ReportSubscribeStates.RESOURCES)
+async def report_subscribe(message: types.Message, state: FSMContext):
+    known = [source.resource for source in SOURCES]
+    words = (message.text or '').lower().split()
+    resources = known if 'all' in words else [word for word in words if word in known]
+    if not resources:
+        await message.answer('Не понял, какие ресурсы. Например: ecs nat vpc')
+        return
+
+    data = await state.get_data()
+    credentials = {key: data[key] for key in ('ak', 'sk', 'project_id', 'account_id')}
+    CHANGES.subscribe(message.chat.id, credentials, resources)
+
+    await message.answer(f'Буду присылать изменения: {", ".join(resources)}')
+    await state.set_state(GlobalState.DEFAULT)
+
+
+@REPORT.router.callback_query(ReportCallback.filter(F.action == Action.UNSUBSCRIBE))
+async def report_unsubscribe(call: CallbackQuery, state: FSMContext):
+    if CHANGES.unsubscribe(call.message.chat.id):
+        await call.answer('Подписка удалена')
+    else:
+        await call.answer('Подписки нет')
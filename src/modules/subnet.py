@@ -1,6 +1,8 @@
 from enum import Enum
+from typing import Optional
 
 from aiogram import F, Router, types
+from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
 from aiogram.types.callback_query import CallbackQuery
 from aiogram.filters.callback_data import CallbackData
@@ -8,9 +10,7 @@ from aiogram.filters.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
 
-from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkcore.exceptions import exceptions
-from huaweicloudsdkcore.http.http_config import HttpConfig
 from huaweicloudsdkvpc.v2 import VpcAsyncClient
 from huaweicloudsdkvpc.v2 import CreateSubnetOption, CreateSubnetRequest, CreateSubnetRequestBody, CreateSubnetResponse
 from huaweicloudsdkvpc.v2 import ListSubnetsRequest, ListSubnetsResponse
@@ -19,11 +19,17 @@ from huaweicloudsdkvpc.v2 import ShowSubnetRequest, ShowSubnetResponse
 from huaweicloudsdkvpc.v2 import UpdateSubnetOption, UpdateSubnetRequest, UpdateSubnetRequestBody, UpdateSubnetResponse
 
 from src.module import Module
-from src.utils import add_exit_button
+from src.clients import Service, get_client
+from src.sdk import execute
+from src.pagination import items, picker_page
+from src.output import send_entries
+from src.render import Renderer
+from src.utils import add_exit_button, add_page_buttons
 from src.globalstate import GlobalState
 from src.terraform import TerraformCreate
 
 ENDPOINT = 'https://vpc.ru-moscow-1.hc.sbercloud.ru'
+SERVICE = Service('vpc', VpcAsyncClient, ENDPOINT)
 
 SUBNET = Module(
     name='Subnet',
@@ -64,25 +70,6 @@ def keyboard() -> InlineKeyboardMarkup:
 
 @SUBNET.router.callback_query(F.data == SUBNET.name)
 async def subnet_main(call: CallbackQuery, state: FSMContext):
-    config = HttpConfig.get_default_config()
-    config.ignore_ssl_verification = False
-
-    data = await state.get_data()
-
-    credentials = BasicCredentials(
-        ak=data['ak'],
-        sk=data['sk'],
-        project_id=data['project_id'],
-    )
-
-    client = VpcAsyncClient().new_builder() \
-        .with_http_config(config) \
-        .with_credentials(credentials) \
-        .with_endpoint(ENDPOINT) \
-        .build()
-
-    await state.update_data(client=client)
-
     await call.message.edit_reply_markup(reply_markup=keyboard())
     await call.answer()
 
@@ -158,7 +145,7 @@ async def subnet_create_vpc_id(message: types.Message, state: FSMContext):
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     try:
         sub = CreateSubnetOption(
@@ -171,14 +158,13 @@ async def subnet_create_vpc_id(message: types.Message, state: FSMContext):
 
         body = CreateSubnetRequestBody(sub)
         request = CreateSubnetRequest(body)
-        response = client.create_subnet_async(request)
-        result = response.result()  # type: CreateSubnetResponse
+        result = await execute(client.create_subnet_async, request, resource='subnet')  # type: CreateSubnetResponse
 
         if result.subnet is None:
             await message.answer('Ошибка!')
             await message.answer(str(result))
             await state.set_state(GlobalState.DEFAULT)
-    except exceptions.ClientRequestException as e:
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -187,31 +173,36 @@ async def subnet_create_vpc_id(message: types.Message, state: FSMContext):
     await state.set_state(GlobalState.DEFAULT)
 
 
-def __subnet_to_str(subnet) -> str:
-    text = f'<b>{subnet.name}</b>: {subnet.description}\n' + \
-           f'\t id: <code>{subnet.id}</code>\n' + \
-           f'\t cidr: <code>{subnet.cidr}</code>\n' + \
-           f'\t vpc_id: <code>{subnet.vpc_id}</code>\n' + \
-           f'\t gateway ip: {subnet.gateway_ip}\n' + \
-           f'\t status: <b>{subnet.status}</b>\n'
+SUBNET_VIEW = Renderer(
+    '<b>{name}</b>: {description}',
+    '\t id: <code>{id}</code>',
+    '\t cidr: <code>{cidr}</code>',
+    '\t vpc_id: <code>{vpc_id}</code>',
+    '\t gateway ip: {gateway_ip}',
+    '\t status: <b>{status}</b>',
+)
+
 
-    return text
+def __subnet_to_str(subnet) -> str:
+    return SUBNET_VIEW.render(subnet)
 
 
-def __create_subnets_keyboard(client, callbacktype):
+async def __create_subnets_keyboard(client, callbacktype, page=0, marker=None):
     request = ListSubnetsRequest()
-    response = client.list_subnets_async(request)
-    result = response.result()  # type: ListSubnetsResponse
+    subnets, has_next = await picker_page(client.list_subnets_async, request, 'subnets', page, resource='subnet', marker=marker)
 
     builder = InlineKeyboardBuilder()
 
-    for subnet in result.subnets:
+    for subnet in subnets:
         builder.button(
             text=subnet.name,
             callback_data=callbacktype(action='do', id=subnet.id),
         )
-    builder.button(text='Назад', callback_data=callbacktype(
-        action='back', id='____'))
+    builder.adjust(2)
+
+    add_page_buttons(builder, callbacktype, page, has_next, subnets[-1].id if subnets else None)
+    builder.row(InlineKeyboardButton(text='Назад', callback_data=callbacktype(
+        action='back', id='____').pack()))
 
     return builder.as_markup()
 
@@ -219,33 +210,40 @@ def __create_subnets_keyboard(client, callbacktype):
 @SUBNET.router.callback_query(SubnetCallback.filter(F.action == Action.LIST))
 async def subnet_list(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     try:
         request = ListSubnetsRequest()
-        response = client.list_subnets_async(request)
-        result = response.result()  # type: ListSubnetsResponse
-    except exceptions.ClientRequestException as e:
+        subnets = items(client.list_subnets_async, request, 'subnets', resource='subnet')
+        await send_entries(call.message, (__subnet_to_str(sub) async for sub in subnets), filename='subnets.txt')
+    except exceptions.SdkException as e:
         await call.message.answer(e.error_msg)
         await call.answer()
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    entries = [__subnet_to_str(sub) for sub in result.subnets]
-    await call.message.answer('\n'.join(entries), parse_mode='html')
     await call.answer()
 
 
 class SubnetShowCallback(CallbackData, prefix='subnet_show'):
     action: str  # show or go back
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @SUBNET.router.callback_query(SubnetCallback.filter(F.action == Action.SHOW))
 async def subnet_show_buttons(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
-    await call.message.edit_text('Выбери subnet', reply_markup=__create_subnets_keyboard(client, SubnetShowCallback))
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
+    try:
+        markup = await __create_subnets_keyboard(client, SubnetShowCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери subnet', reply_markup=markup)
     await call.answer()
 
 
@@ -258,13 +256,12 @@ async def subnet_show_buttons_back(call: CallbackQuery):
 @SUBNET.router.callback_query(SubnetShowCallback.filter(F.action == 'show'))
 async def subnet_show_buttons_entry(call: CallbackQuery, state: FSMContext, callback_data: SubnetShowCallback):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     try:
         request = ShowSubnetRequest(subnet_id=callback_data.id)
-        response = client.show_subnet_async(request)
-        result = response.result()  # type: ShowSubnetResponse
-    except exceptions.ClientRequestException as e:
+        result = await execute(client.show_subnet_async, request, resource='subnet')  # type: ShowSubnetResponse
+    except exceptions.SdkException as e:
         await call.message.answer(e.error_msg)
         await call.answer()
         await state.set_state(GlobalState.DEFAULT)
@@ -288,16 +285,15 @@ async def subnet_show_id(call: CallbackQuery, state: FSMContext):
 @SUBNET.router.message(SubnetShowStates.ID)
 async def subnet_show(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     subnet_id = message.text
     try:
         request = ShowSubnetRequest(subnet_id=subnet_id)
-        response = client.show_subnet_async(request)
-        result = response.result()  # type: ShowSubnetResponse
+        result = await execute(client.show_subnet_async, request, resource='subnet')  # type: ShowSubnetResponse
 
         await message.reply(__subnet_to_str(result.subnet), parse_mode='html')
-    except exceptions.ClientRequestException as exc:
+    except exceptions.SdkException as exc:
         await message.answer(exc.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -308,31 +304,38 @@ async def subnet_show(message: types.Message, state: FSMContext):
 class SubnetDeleteCallback(CallbackData, prefix='subnet_delete'):
     action: str
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @SUBNET.router.callback_query(SubnetCallback.filter(F.action == Action.DELETE))
 async def vpc_delete(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
-    await call.message.edit_text('Выбери VPC для удаления', reply_markup=__create_subnets_keyboard(client, SubnetDeleteCallback))
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
+    try:
+        markup = await __create_subnets_keyboard(client, SubnetDeleteCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери VPC для удаления', reply_markup=markup)
     await call.answer()
 
 
 @SUBNET.router.callback_query(SubnetDeleteCallback.filter(F.action == 'do'))
 async def vpc_delete_entry(call: CallbackQuery, state: FSMContext, callback_data: SubnetDeleteCallback):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     try:
         request = ShowSubnetRequest(subnet_id=callback_data.id)
-        response = client.show_subnet_async(request)
-        result = response.result()  # type: ShowSubnetResponse
+        result = await execute(client.show_subnet_async, request, resource='subnet')  # type: ShowSubnetResponse
 
         request = DeleteSubnetRequest(
             vpc_id=result.subnet.vpc_id, subnet_id=callback_data.id)
-        response = client.delete_subnet_async(request)
-        response.result()
-    except exceptions.ClientRequestException as exc:
+        await execute(client.delete_subnet_async, request, resource='subnet')
+    except exceptions.SdkException as exc:
         await call.message.answer(exc.error_msg)
         await call.answer()
         return
@@ -372,14 +375,13 @@ async def subnet_delete(message: types.Message, state: FSMContext):
     vpc_id = message.text
 
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     try:
         request = DeleteSubnetRequest(
             vpc_id=vpc_id, subnet_id=data['subnet_id'])
-        response = client.delete_subnet_async(request)
-        response.result()
-    except exceptions.ClientRequestException as exc:
+        await execute(client.delete_subnet_async, request, resource='subnet')
+    except exceptions.SdkException as exc:
         await message.answer(exc.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -432,7 +434,7 @@ async def subnet_update_desc(message: types.Message, state: FSMContext):
 @SUBNET.router.message(SubnetUpdateStates.DESCRIPTION)
 async def subnet_update_by_id(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     description = message.text
     try:
@@ -444,15 +446,14 @@ async def subnet_update_by_id(message: types.Message, state: FSMContext):
         request = UpdateSubnetRequest(
             body=body, subnet_id=data['subnet_id'], vpc_id=data['vpc_id'])
 
-        response = client.update_subnet_async(request)
-        result = response.result()  # type: UpdateSubnetResponse
+        result = await execute(client.update_subnet_async, request, resource='subnet')  # type: UpdateSubnetResponse
 
         if result.subnet is None:
             await message.answer('Ошибка!')
             await message.answer(str(result))
             await state.set_state(GlobalState.DEFAULT)
             return
-    except exceptions.ClientRequestException as exc:
+    except exceptions.SdkException as exc:
         await message.answer('Ошибка!')
         await message.answer(exc.error_msg)
         await state.set_state(GlobalState.DEFAULT)
@@ -465,13 +466,22 @@ async def subnet_update_by_id(message: types.Message, state: FSMContext):
 class SubnetUpdateCallback(CallbackData, prefix='subnet_update'):
     action: str
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @SUBNET.router.callback_query(SubnetCallback.filter(F.action == Action.UPDATE))
 async def subnet_update(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
-    await call.message.edit_text('Выбери Subnet для изменения', reply_markup=__create_subnets_keyboard(client, SubnetUpdateCallback))
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
+    try:
+        markup = await __create_subnets_keyboard(client, SubnetUpdateCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери Subnet для изменения', reply_markup=markup)
     await call.answer()
 
 
@@ -484,13 +494,12 @@ async def subnet_update_back(call: CallbackQuery):
 @SUBNET.router.callback_query(SubnetUpdateCallback.filter(F.action == 'do'))
 async def subnet_update_entry(call: CallbackQuery, state: FSMContext, callback_data: SubnetUpdateCallback):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     try:
         request = ShowSubnetRequest(subnet_id=callback_data.id)
-        response = client.show_subnet_async(request)
-        result = response.result()  # type: ShowSubnetResponse
-    except exceptions.ClientRequestException as e:
+        result = await execute(client.show_subnet_async, request, resource='subnet')  # type: ShowSubnetResponse
+    except exceptions.SdkException as e:
         await call.message.answer(e.error_msg)
         await call.answer()
         await state.set_state(GlobalState.DEFAULT)
@@ -502,3 +511,20 @@ async def subnet_update_entry(call: CallbackQuery, state: FSMContext, callback_d
     await call.message.answer('Введите новое имя (ЭТО SUBNET)')
     await call.answer()
     await state.set_state(SubnetUpdateStates.NAME)
+
+
+@SUBNET.router.callback_query(SubnetShowCallback.filter(F.action == 'page'))
+@SUBNET.router.callback_query(SubnetDeleteCallback.filter(F.action == 'page'))
+@SUBNET.router.callback_query(SubnetUpdateCallback.filter(F.action == 'page'))
+async def subnet_picker_page(call: CallbackQuery, state: FSMContext, callback_data: CallbackData):
+    data = await state.get_data()
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
+    try:
+        markup = await __create_subnets_keyboard(client, type(callback_data), callback_data.page, callback_data.marker)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_reply_markup(reply_markup=markup)
+    await call.answer()
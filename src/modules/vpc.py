@@ -1,6 +1,8 @@
 from enum import Enum
+from typing import Optional
 
 from aiogram import F, Router, types
+from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
 from aiogram.types.callback_query import CallbackQuery
 from aiogram.filters.callback_data import CallbackData
@@ -8,9 +10,7 @@ from aiogram.filters.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
 
-from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkcore.exceptions import exceptions
-from huaweicloudsdkcore.http.http_config import HttpConfig
 from huaweicloudsdkvpc.v2 import VpcAsyncClient, ListVpcsRequest, ListVpcsResponse
 from huaweicloudsdkvpc.v2 import ShowVpcRequest, ShowVpcResponse
 from huaweicloudsdkvpc.v2 import CreateVpcRequest, CreateVpcOption, CreateVpcRequestBody, CreateVpcResponse
@@ -19,10 +19,16 @@ from huaweicloudsdkvpc.v2 import DeleteVpcRequest
 
 from src.terraform import TerraformCreate
 from src.module import Module
-from src.utils import add_exit_button
+from src.clients import Service, get_client
+from src.sdk import execute
+from src.pagination import items, picker_page
+from src.output import send_entries
+from src.render import Renderer
+from src.utils import add_exit_button, add_page_buttons
 from src.globalstate import GlobalState
 
 ENDPOINT = 'https://vpc.ru-moscow-1.hc.sbercloud.ru'
+SERVICE = Service('vpc', VpcAsyncClient, ENDPOINT)
 
 VPC = Module(
     name='Virtual Private Cloud',
@@ -63,25 +69,6 @@ def keyboard() -> InlineKeyboardMarkup:
 
 @VPC.router.callback_query(F.data == VPC.name)
 async def vpc_main(call: CallbackQuery, state: FSMContext):
-    config = HttpConfig.get_default_config()
-    config.ignore_ssl_verification = False
-
-    data = await state.get_data()
-
-    credentials = BasicCredentials(
-        ak=data['ak'],
-        sk=data['sk'],
-        project_id=data['project_id'],
-    )
-
-    client = VpcAsyncClient().new_builder() \
-        .with_http_config(config) \
-        .with_credentials(credentials) \
-        .with_endpoint(ENDPOINT) \
-        .build()
-
-    await state.update_data(client=client)
-
     await call.message.edit_reply_markup(reply_markup=keyboard())
     await call.answer()
 
@@ -149,7 +136,7 @@ async def vpc_create_projid(message: types.Message, state: FSMContext):
         await state.set_state(GlobalState.DEFAULT)
         return
 
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     try:
         vpc = CreateVpcOption(
@@ -161,14 +148,13 @@ async def vpc_create_projid(message: types.Message, state: FSMContext):
 
         body = CreateVpcRequestBody(vpc)
         request = CreateVpcRequest(body)
-        response = client.create_vpc_async(request)
-        result = response.result()  # type: CreateVpcResponse
+        result = await execute(client.create_vpc_async, request, resource='vpc')  # type: CreateVpcResponse
 
         if result.vpc is None:
             await message.answer('Ошибка!')
             await message.answer(str(result))
             await state.set_state(GlobalState.DEFAULT)
-    except exceptions.ClientRequestException as e:
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -177,29 +163,34 @@ async def vpc_create_projid(message: types.Message, state: FSMContext):
     await state.set_state(GlobalState.DEFAULT)
 
 
-def __vpc_to_str(vpc) -> str:
-    text = f'<b>{vpc.name}</b>: {vpc.description}\n' + \
-        f'\t id: <code>{vpc.id}</code>\n' + \
-        f'\t cidr: <code>{vpc.cidr}</code>\n' + \
-        f'\t status: <b>{vpc.status}</b>\n'
+VPC_VIEW = Renderer(
+    '<b>{name}</b>: {description}',
+    '\t id: <code>{id}</code>',
+    '\t cidr: <code>{cidr}</code>',
+    '\t status: <b>{status}</b>',
+)
 
-    return text
+
+def __vpc_to_str(vpc) -> str:
+    return VPC_VIEW.render(vpc)
 
 
-def __create_vpcs_keyboard(client, callbacktype):
+async def __create_vpcs_keyboard(client, callbacktype, page=0, marker=None):
     request = ListVpcsRequest()
-    response = client.list_vpcs_async(request)
-    result = response.result()
+    vpcs, has_next = await picker_page(client.list_vpcs_async, request, 'vpcs', page, resource='vpc', marker=marker)
 
     builder = InlineKeyboardBuilder()
 
-    for vpc in result.vpcs:
+    for vpc in vpcs:
         builder.button(
             text=vpc.name,
             callback_data=callbacktype(action='do', id=vpc.id),
         )
-    builder.button(text='Назад', callback_data=callbacktype(
-        action='back', id='____'))
+    builder.adjust(2)
+
+    add_page_buttons(builder, callbacktype, page, has_next, vpcs[-1].id if vpcs else None)
+    builder.row(InlineKeyboardButton(text='Назад', callback_data=callbacktype(
+        action='back', id='____').pack()))
 
     return builder.as_markup()
 
@@ -207,27 +198,39 @@ def __create_vpcs_keyboard(client, callbacktype):
 @VPC.router.callback_query(VpcCallback.filter(F.action == Action.LIST))
 async def vpc_list(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
-    request = ListVpcsRequest()
-    response = client.list_vpcs_async(request)
-    result = response.result()  # type: ListVpcsResponse
+    try:
+        request = ListVpcsRequest()
+        vpcs = items(client.list_vpcs_async, request, 'vpcs', resource='vpc')
+        await send_entries(call.message, (__vpc_to_str(vpc) async for vpc in vpcs), filename='vpcs.txt')
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
 
-    entries = [__vpc_to_str(vpc) for vpc in result.vpcs]
-    await call.message.answer('\n'.join(entries), parse_mode='html')
     await call.answer()
 
 
 class VpcShowCallback(CallbackData, prefix='vpc_show'):
     action: str  # do or back
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @VPC.router.callback_query(VpcCallback.filter(F.action == Action.SHOW))
 async def vpc_show_buttons(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
-    await call.message.edit_text('Выбери VPC', reply_markup=__create_vpcs_keyboard(client, VpcShowCallback))
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
+    try:
+        markup = await __create_vpcs_keyboard(client, VpcShowCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери VPC', reply_markup=markup)
     await call.answer()
 
 
@@ -240,11 +243,15 @@ async def vpc_show_buttons_back(call: CallbackQuery):
 @VPC.router.callback_query(VpcShowCallback.filter(F.action == 'do'))
 async def vpc_show_buttons_entry(call: CallbackQuery, state: FSMContext, callback_data: VpcShowCallback):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
-    request = ShowVpcRequest(vpc_id=callback_data.id)
-    response = client.show_vpc_async(request)
-    result = response.result()
+    try:
+        request = ShowVpcRequest(vpc_id=callback_data.id)
+        result = await execute(client.show_vpc_async, request, resource='vpc')  # type: ShowVpcResponse
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
 
     await call.message.reply(__vpc_to_str(result.vpc), parse_mode='html')
     await call.answer()
@@ -253,26 +260,34 @@ async def vpc_show_buttons_entry(call: CallbackQuery, state: FSMContext, callbac
 class VpcDeleteCallback(CallbackData, prefix='vpc_delete'):
     action: str  # delete or back
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @VPC.router.callback_query(VpcCallback.filter(F.action == Action.DELETE))
 async def vpc_delete(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
-    await call.message.edit_text('Выбери VPC для удаления', reply_markup=__create_vpcs_keyboard(client, VpcDeleteCallback))
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
+    try:
+        markup = await __create_vpcs_keyboard(client, VpcDeleteCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери VPC для удаления', reply_markup=markup)
     await call.answer()
 
 
 @VPC.router.callback_query(VpcDeleteCallback.filter(F.action == 'do'))
 async def vpc_delete_entry(call: CallbackQuery, state: FSMContext, callback_data: VpcDeleteCallback):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     try:
         request = DeleteVpcRequest(vpc_id=callback_data.id)
-        response = client.delete_vpc_async(request)
-        response.result()
-    except exceptions.ClientRequestException as exc:
+        await execute(client.delete_vpc_async, request, resource='vpc')
+    except exceptions.SdkException as exc:
         await call.message.answer(exc.error_msg)
         await call.answer()
         return
@@ -302,15 +317,14 @@ async def vpc_delete_id(call: CallbackQuery, state: FSMContext):
 @VPC.router.message(VpcDeleteStates.ID)
 async def vpc_delete_by_id(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     vpc_id = message.text
 
     try:
         request = DeleteVpcRequest(vpc_id=vpc_id)
-        response = client.delete_vpc_async(request)
-        response.result()
-    except exceptions.ClientRequestException as exc:
+        await execute(client.delete_vpc_async, request, resource='vpc')
+    except exceptions.SdkException as exc:
         await message.answer(exc.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -333,16 +347,15 @@ async def vpc_show_id(call: CallbackQuery, state: FSMContext):
 @VPC.router.message(VpcShowStates.ID)
 async def vpc_show(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     vpc_id = message.text
     try:
         request = ShowVpcRequest(vpc_id=vpc_id)
-        response = client.show_vpc_async(request)
-        result = response.result()  # type: ShowVpcResponse
+        result = await execute(client.show_vpc_async, request, resource='vpc')  # type: ShowVpcResponse
 
-        await message.answer(text=__vpc_to_str(result.vpc))
-    except exceptions.ClientRequestException as exc:
+        await message.answer(text=__vpc_to_str(result.vpc), parse_mode='html')
+    except exceptions.SdkException as exc:
         await message.answer(exc.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -394,7 +407,7 @@ async def vpc_update_cidr(message: types.Message, state: FSMContext):
 @VPC.router.message(VpcUpdateStates.CIDR)
 async def vpc_update_by_id(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
 
     cidr = message.text
     try:
@@ -405,15 +418,14 @@ async def vpc_update_by_id(message: types.Message, state: FSMContext):
         )
         body = UpdateVpcRequestBody(vpc)
         request = UpdateVpcRequest(body=body, vpc_id=data['vpc_id'])
-        response = client.update_vpc_async(request)
-        result = response.result()  # type: UpdateVpcResponse
+        result = await execute(client.update_vpc_async, request, resource='vpc')  # type: UpdateVpcResponse
 
         if result.vpc is None:
             await message.answer('Ошибка!')
             await message.answer(str(result))
             await state.set_state(GlobalState.DEFAULT)
             return
-    except exceptions.ClientRequestException as e:
+    except exceptions.SdkException as e:
         await message.answer(e.error_msg)
         await state.set_state(GlobalState.DEFAULT)
         return
@@ -425,13 +437,22 @@ async def vpc_update_by_id(message: types.Message, state: FSMContext):
 class VpcUpdateCallback(CallbackData, prefix='vpc_update'):
     action: str
     id: str
+    page: int = 0
+    marker: Optional[str] = None
 
 
 @VPC.router.callback_query(VpcCallback.filter(F.action == Action.UPDATE))
 async def vpc_update(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    client = data['client']  # type: VpcAsyncClient
-    await call.message.edit_text('Выбери VPC для изменения', reply_markup=__create_vpcs_keyboard(client, VpcUpdateCallback))
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
+    try:
+        markup = await __create_vpcs_keyboard(client, VpcUpdateCallback)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_text('Выбери VPC для изменения', reply_markup=markup)
     await call.answer()
 
 
@@ -447,3 +468,20 @@ async def vpc_update_entry(call: CallbackQuery, state: FSMContext, callback_data
 async def vpc_update_back(call: CallbackQuery):
     await call.message.edit_text('Virtual Private Cloud', reply_markup=keyboard())
     await call.answer()
+
+
+@VPC.router.callback_query(VpcShowCallback.filter(F.action == 'page'))
+@VPC.router.callback_query(VpcDeleteCallback.filter(F.action == 'page'))
+@VPC.router.callback_query(VpcUpdateCallback.filter(F.action == 'page'))
+async def vpc_picker_page(call: CallbackQuery, state: FSMContext, callback_data: CallbackData):
+    data = await state.get_data()
+    client = get_client(SERVICE, data)  # type: VpcAsyncClient
+    try:
+        markup = await __create_vpcs_keyboard(client, type(callback_data), callback_data.page, callback_data.marker)
+    except exceptions.SdkException as e:
+        await call.message.answer(e.error_msg)
+        await call.answer()
+        return
+
+    await call.message.edit_reply_markup(reply_markup=markup)
+    await call.answer()
@@ -0,0 +1,177 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Hashable, Optional, Tuple, TypeVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+# Приоритеты: ответы пользователю раньше фоновых уведомлений
+INTERACTIVE = 0
+BACKGROUND = 1
+
+PRIORITY: ContextVar[int] = ContextVar('priority', default=INTERACTIVE)
+
+# Ограничения Telegram: около 30 сообщений в секунду на бота и около одного в секунду в чат
+RATE = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+
+# Столько раз запрос повторяется после RetryAfter, дальше ошибка уходит обработчику
+MAX_RETRIES = 3
+
+# Корзины стольких последних чатов храним; вытесненная корзина давно полна и равна новой
+MAX_CHATS = 10000
+
+T = TypeVar('T')
+
+
+class TokenBucket:
+    """`rate` токенов в секунду, не больше `burst` про запас; `pause` блокирует корзину до момента."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд можно будет взять токен."""
+        self._refill(now)
+        return max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class Outbound(BaseRequestMiddleware):
+    """
+    Очередь исходящих запросов к Telegram, подключается к сессии бота.
+
+    Запросы с `chat_id` (отправка и редактирование сообщений) ждут токен в общей
+    корзине бота и в корзине своего чата. Среди ожидающих первыми идут
+    интерактивные ответы, фоновые уведомления (`PRIORITY` = `BACKGROUND`) -
+    когда интерактивным нечего отправить. На RetryAfter чат замораживается на
+    `retry_after` секунд, и запрос повторяется. Остальные запросы
+    (answerCallbackQuery, getUpdates, ...) проходят без очереди.
+    """
+
+    def __init__(self, rate: float = RATE, chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(rate, max(rate, 1))
+        self._chats: 'OrderedDict[Hashable, TokenBucket]' = OrderedDict()
+        self._waiting: Tuple[Deque[Tuple[Hashable, asyncio.Future]], ...] = (deque(), deque())
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger(__name__)
+
+    def bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            while len(self._chats) > MAX_CHATS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+
+        return bucket
+
+    async def acquire(self, chat_id: Hashable, priority: int = INTERACTIVE):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[priority].append((chat_id, future))
+        self._wakeup.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+        await future
+
+    def _grant(self, now: float) -> Optional[float]:
+        """Выдаёт токен первому готовому запросу; иначе возвращает, сколько ждать (None - до нового)."""
+        soonest = None
+        for queue in self._waiting:
+            for index, (chat_id, future) in enumerate(queue):
+                if future.done():
+                    continue
+                delay = self.bucket(chat_id).delay(now)
+                if delay <= 0:
+                    del queue[index]
+                    self._global.take(now)
+                    self.bucket(chat_id).take(now)
+                    future.set_result(None)
+                    return 0
+                soonest = delay if soonest is None else min(soonest, delay)
+
+        return soonest
+
+    async def _run(self):
+        try:
+            while any(self._waiting):
+                for queue in self._waiting:
+                    while queue and queue[0][1].done():
+                        queue.popleft()
+
+                now = time.monotonic()
+                wait = self._global.delay(now)
+                if wait <= 0:
+                    wait = self._grant(now)
+                    if wait == 0:
+                        continue
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._task = None
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[T], bot: Bot,
+                       method: TelegramMethod[T]) -> Response[T]:
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self.acquire(chat_id, PRIORITY.get())
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                self._logger.warning('Flood control in chat %s, retry in %s s', chat_id, e.retry_after)
+                self.bucket(chat_id).pause(time.monotonic() + e.retry_after)
+
+
+def install(bot: Bot, workers: int = 1) -> Outbound:
+    """Подключает очередь к сессии `bot`; общий лимит бота делится между `workers` процессами."""
+    outbound = Outbound(rate=RATE / workers)
+    bot.session.middleware(outbound)
+
+    return outbound
+
+
+def background(send: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Отправка с фоновым приоритетом: уведомления пропускают вперёд ответы пользователям."""
+
+    async def wrapped(*args, **kwargs) -> T:
+        token = PRIORITY.set(BACKGROUND)
+        try:
+            return await send(*args, **kwargs)
+        finally:
+            PRIORITY.reset(token)
+
+    return wrapped
@@ -0,0 +1,69 @@
+import re
+import html
+from typing import AsyncIterable, Optional
+
+from aiogram.types import BufferedInputFile, Message
+
+# Ограничение Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+# После стольких сообщений остаток вывода уходит одним файлом
+MAX_MESSAGES = 5
+
+_TAGS = re.compile(r'<[^>]+>')
+
+
+def _plain(entry: str, parse_mode: Optional[str]) -> str:
+    if parse_mode == 'html':
+        return html.unescape(_TAGS.sub('', entry))
+
+    return entry
+
+
+async def send_entries(message: Message, entries: AsyncIterable[str], parse_mode: Optional[str] = 'html',
+                       separator: str = '\n', filename: str = 'list.txt', max_messages: int = MAX_MESSAGES,
+                       empty: str = 'Ничего не найдено') -> int:
+    """
+    Отправляет записи по мере их поступления из `entries`.
+
+    Сообщение уходит, как только следующая запись не влезает в лимит Telegram,
+    записи не разрезаются. Если вывод не уложился в `max_messages` сообщений
+    (или одна запись длиннее лимита), остаток отправляется документом.
+    Возвращает число отправленных записей.
+    """
+    chunk = []
+    size = 0
+    sent = 0
+    count = 0
+    document = None
+
+    async for entry in entries:
+        count += 1
+
+        if document is not None:
+            document.append(_plain(entry, parse_mode))
+            continue
+
+        extra = len(entry) + (len(separator) if chunk else 0)
+        if chunk and size + extra > MESSAGE_LIMIT:
+            await message.answer(separator.join(chunk), parse_mode=parse_mode)
+            sent += 1
+            chunk, size = [], 0
+            extra = len(entry)
+
+        if sent >= max_messages or extra > MESSAGE_LIMIT:
+            document = [_plain(entry, parse_mode)]
+            continue
+
+        chunk.append(entry)
+        size += extra
+
+    if chunk:
+        await message.answer(separator.join(chunk), parse_mode=parse_mode)
+    elif not count:
+        await message.answer(empty)
+
+    if document is not None:
+        data = separator.join(document).encode()
+        await message.answer_document(BufferedInputFile(data, filename=filename))
+
+    return count
@@ -0,0 +1,116 @@
+import copy
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, List, Optional, Set, Tuple
+
+from src.sdk import execute
+
+# Способы пагинации list операций SberCloud
+MARKER = 'marker'  # marker = id последнего ресурса страницы (VPC, Subnet, NAT, IMS, флейворы)
+PAGE = 'page'      # offset = номер страницы, начиная с 1 (ECS)
+OFFSET = 'offset'  # offset = число уже полученных записей (EPS)
+
+PAGE_SIZE = 100
+
+
+async def pages(method: Callable, request, field: str, paging: str = MARKER, limit: int = PAGE_SIZE,
+                resource: Optional[str] = None) -> AsyncIterator[List[Any]]:
+    """
+    Лениво отдаёт страницы list операции: следующая страница запрашивается только
+    тогда, когда потребитель дошёл до неё, так что в памяти живёт одна страница.
+
+    `field` - атрибут ответа со списком ресурсов (например, 'vpcs').
+    Пример: `async for page in pages(client.list_vpcs_async, ListVpcsRequest(), 'vpcs'): ...`
+    """
+    marker = None
+    offset = 1 if paging == PAGE else 0
+
+    while True:
+        request = copy.copy(request)
+        request.limit = limit
+        if paging == MARKER:
+            request.marker = marker
+        else:
+            request.offset = offset
+
+        result = await execute(method, request, resource=resource)
+        page = getattr(result, field) or []
+
+        if page:
+            yield page
+
+        if len(page) < limit:
+            return
+
+        if paging == MARKER:
+            marker = page[-1].id
+        elif paging == PAGE:
+            offset += 1
+        else:
+            offset += len(page)
+
+
+async def items(method: Callable, request, field: str, paging: str = MARKER, limit: int = PAGE_SIZE,
+                resource: Optional[str] = None) -> AsyncIterator[Any]:
+    """То же, что `pages`, но по одному ресурсу."""
+    async for page in pages(method, request, field, paging, limit, resource):
+        for item in page:
+            yield item
+
+
+PICKER_SIZE = 10
+
+_prefetches: Set[asyncio.Task] = set()
+
+
+async def _fetch(method: Callable, request, field: str, index: int, marker: Optional[str], paging: str,
+                 limit: int, resource: Optional[str]) -> Tuple[List[Any], bool]:
+    request = copy.copy(request)
+
+    if paging == PAGE:
+        request.limit = limit
+        request.offset = index + 1
+        page = getattr(await execute(method, request, resource=resource), field) or []
+        return page, len(page) == limit
+
+    # на один элемент больше, чтобы точно знать, есть ли следующая страница
+    request.limit = limit + 1
+    if paging == OFFSET:
+        request.offset = index * limit
+    else:
+        request.marker = marker or None
+
+    page = getattr(await execute(method, request, resource=resource), field) or []
+
+    return page[:limit], len(page) > limit
+
+
+async def picker_page(method: Callable, request, field: str, index: int, paging: str = MARKER,
+                      limit: int = PICKER_SIZE, resource: Optional[str] = None,
+                      marker: Optional[str] = None) -> Tuple[List[Any], bool]:
+    """
+    Возвращает страницу пикера и признак наличия следующей.
+
+    При `MARKER` страница начинается после ресурса `marker` (None - первая
+    страница), и её marker хранит сама кнопка пикера, так что любая страница -
+    один запрос, в каком бы процессе и после какого рестарта ни пришло нажатие.
+    При `PAGE` и `OFFSET` страница задаётся номером `index` (с нуля).
+
+    Запрашивается только показываемая страница; следующая подгружается в фоне,
+    чтобы с `resource` переход на неё отдавался из кэша.
+    """
+    result, has_next = await _fetch(method, request, field, index, marker, paging, limit, resource)
+
+    if has_next and resource is not None:
+        task = asyncio.ensure_future(
+            _fetch(method, request, field, index + 1, result[-1].id, paging, limit, resource))
+        _prefetches.add(task)
+        task.add_done_callback(_prefetched)
+
+    return result, has_next
+
+
+def _prefetched(task: asyncio.Task):
+    _prefetches.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.getLogger(__name__).debug('Page prefetch failed: %s', task.exception())
@@ -0,0 +1,92 @@
+import re
+import html
+from operator import attrgetter
+from typing import Any, Callable, Iterable, List, Optional, Union
+
+_FIELD = re.compile(r'\{([^{}]+)\}')
+_PATH = re.compile(r'\.?(\w+)|\[([^\]]+)\]')
+
+
+def _getter(path: str) -> Callable[[Any], Any]:
+    """`name`, `a.b` или `metadata[os_type]` -> функция, достающая значение из модели SDK."""
+    steps = [(attribute, key) for attribute, key in _PATH.findall(path)]
+    if all(attribute for attribute, _ in steps):
+        return attrgetter(path)
+
+    def get(model):
+        for attribute, key in steps:
+            model = getattr(model, attribute) if attribute else model[key]
+        return model
+
+    return get
+
+
+class Line:
+    """
+    Строка шаблона: текст с полями `{атрибут}`.
+
+    `optional` строка остаётся пустой, если хоть одно из её полей пустое.
+    """
+
+    def __init__(self, template: str, optional: bool = False):
+        self.optional = optional
+        self.literals: List[str] = []
+        self.fields: List[str] = []
+
+        position = 0
+        for match in _FIELD.finditer(template):
+            self.literals.append(template[position:match.start()])
+            self.fields.append(match.group(1))
+            position = match.end()
+        self.literals.append(template[position:])
+
+
+class Renderer:
+    """
+    Форматирует модели SDK по шаблону, читая только нужные атрибуты.
+
+    Шаблон разбирается один раз, а текст собирается в список кусков и склеивается
+    одним `join`, без промежуточных строк. Значения экранируются `escape`
+    (по умолчанию для parse_mode='html'). Вычисляемые поля передаются через `computed`.
+
+    Пример: `Renderer('<b>{name}</b>:', '\\t id: <code>{id}</code>').render(vpc)`
+    """
+
+    def __init__(self, *lines: Union[str, Line], escape: Optional[Callable[[str], str]] = html.escape,
+                 **computed: Callable[[Any], Any]):
+        self.lines = [line if isinstance(line, Line) else Line(line) for line in lines]
+        self.escape = escape or str
+        self._getters = {}
+        for line in self.lines:
+            for field in line.fields:
+                if field not in self._getters:
+                    self._getters[field] = computed.get(field) or _getter(field)
+
+    def render_into(self, parts: List[str], model: Any):
+        getters = self._getters
+        escape = self.escape
+
+        for line in self.lines:
+            values = [getters[field](model) for field in line.fields]
+            if not line.optional or all(values):
+                literals = line.literals
+                for index, value in enumerate(values):
+                    parts.append(literals[index])
+                    parts.append(escape(str(value)))
+                parts.append(literals[-1])
+            parts.append('\n')
+
+    def render(self, model: Any) -> str:
+        parts = []
+        self.render_into(parts, model)
+
+        return ''.join(parts)
+
+    def render_many(self, models: Iterable[Any], separator: str = '\n') -> str:
+        parts = []
+        for index, model in enumerate(models):
+            if index:
+                parts.append(separator)
+            self.render_into(parts, model)
+
+        return ''.join(parts)
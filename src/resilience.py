@@ -0,0 +1,162 @@
+import math
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from urllib.parse import urlparse
+
+from huaweicloudsdkcore.exceptions import exceptions
+
+THROTTLED = 429
+
+
+def retryable(error: BaseException) -> bool:
+    """Ошибки, после которых повтор может помочь: 5xx, троттлинг, сеть и таймауты."""
+    if isinstance(error, exceptions.ServiceResponseException):
+        return error.status_code == THROTTLED or error.status_code >= 500
+
+    return isinstance(error, (exceptions.ConnectionException, exceptions.RequestTimeoutException))
+
+
+def idempotency_token(request) -> Optional[str]:
+    """Токен идемпотентности запроса (`X-Client-Token` у создания ECS), если задан."""
+    return getattr(request, 'x_client_token', None) or getattr(request, 'client_token', None)
+
+
+def endpoint_key(method: Callable) -> Hashable:
+    """Хост endpoint'а клиента, которому принадлежит метод: у VPC и Subnet он общий."""
+    client = getattr(method, '__self__', None)
+    endpoints = getattr(client, '_endpoints', None)
+    if not endpoints:
+        return getattr(method, '__qualname__', repr(method))
+
+    return urlparse(endpoints[0]).netloc
+
+
+class CircuitOpen(exceptions.SdkException):
+    """Endpoint недоступен, вызов не отправлялся; модули показывают `error_msg`, как любую ошибку SDK."""
+
+    def __init__(self, endpoint: Hashable, retry_in: float):
+        super().__init__(f'Сервис {endpoint} временно недоступен, повторите через {math.ceil(retry_in)} с')
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def unavailable(error: BaseException) -> bool:
+    """Endpoint не ответил по существу: можно отдать закэшированный ответ."""
+    return isinstance(error, CircuitOpen) or retryable(error)
+
+
+class Breaker:
+    """
+    Circuit breaker одного endpoint'а.
+
+    После `threshold` сбоев подряд размыкается на `cooldown` секунд, затем
+    пропускает один пробный вызов: успех замыкает его, сбой размыкает снова.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened: Optional[float] = None
+        self.trial: Optional[float] = None
+
+    @property
+    def open(self) -> bool:
+        return self.opened is not None
+
+    def allow(self, now: float) -> float:
+        """0, если вызов можно отправить, иначе через сколько секунд пробовать."""
+        if self.opened is None:
+            return 0
+
+        remaining = self.opened + self.cooldown - now
+        if remaining > 0:
+            return remaining
+
+        # пробный вызов один; если он завис дольше cooldown, разрешаем следующий
+        if self.trial is not None and now - self.trial < self.cooldown:
+            return self.trial + self.cooldown - now
+
+        self.trial = now
+        return 0
+
+    def success(self):
+        self.failures = 0
+        self.opened = None
+        self.trial = None
+
+    def failure(self, now: float):
+        self.failures += 1
+        self.trial = None
+        if self.opened is not None or self.failures >= self.threshold:
+            self.opened = now
+
+
+class CallPolicy:
+    """
+    Повторы и circuit breaker для вызовов SDK.
+
+    Чтения и запросы с токеном идемпотентности повторяются при 5xx, троттлинге,
+    сетевых ошибках и таймаутах: до `attempts` попыток с паузой full jitter
+    между 0 и `base * 2^n` (не больше `cap`). Остальные записи (create без
+    токена, update, delete) повторяются только после 429: такой запрос сервис
+    не выполнял. Ответ с 4xx (и 429) значит, что endpoint жив, и сбоем не считается.
+    """
+
+    def __init__(self, attempts: int = 3, base: float = 0.2, cap: float = 5, threshold: int = 5,
+                 cooldown: float = 30):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._breakers: Dict[Hashable, Breaker] = {}
+        self._logger = logging.getLogger(__name__)
+
+    def breaker(self, endpoint: Hashable) -> Breaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = Breaker(self.threshold, self.cooldown)
+
+        return breaker
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    async def run(self, endpoint: Hashable, call: Callable[[], Awaitable[Any]], idempotent: bool) -> Any:
+        breaker = self.breaker(endpoint)
+
+        for attempt in range(self.attempts):
+            wait = breaker.allow(time.monotonic())
+            if wait > 0:
+                raise CircuitOpen(endpoint, wait)
+
+            try:
+                result = await call()
+            except Exception as e:
+                if not retryable(e):
+                    if isinstance(e, exceptions.ServiceResponseException):
+                        breaker.success()
+                    raise
+
+                throttled = getattr(e, 'status_code', None) == THROTTLED
+                if throttled:
+                    # троттлинг - ответ живого endpoint'а, обычно по лимитам одного аккаунта
+                    breaker.success()
+                else:
+                    breaker.failure(time.monotonic())
+                if attempt + 1 == self.attempts or not (idempotent or throttled):
+                    raise
+
+                self._logger.info('Retrying call to %s after %s', endpoint, e)
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+
+            breaker.success()
+            return result
+
+
+POLICY = CallPolicy()
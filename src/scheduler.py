@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Set
+
+# Не больше стольких обновлений обрабатывается одновременно во всём процессе
+CONCURRENCY = 64
+
+# Не больше стольких обновлений одного чата ждут и выполняются, остальные отбрасываются
+DEPTH = 16
+
+
+class Scheduler:
+    """
+    Очереди обновлений по чатам.
+
+    Обновления одного чата выполняются строго по порядку: следующий шаг
+    мастера не начнётся, пока предыдущий не дописал `state.update_data`. Разные
+    чаты идут параллельно, но не больше `concurrency` сразу. В очереди чата
+    (вместе с выполняемым) не больше `depth` обновлений: лишние клики
+    отбрасываются, а не копятся.
+    """
+
+    def __init__(self, handle: Callable[[Any], Awaitable], concurrency: int = CONCURRENCY, depth: int = DEPTH):
+        self.handle = handle
+        self.depth = depth
+        self._slots = asyncio.Semaphore(concurrency)
+        self._queues: Dict[Hashable, Deque[Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._logger = logging.getLogger(__name__)
+
+    def submit(self, key: Hashable, update: Any) -> bool:
+        """Ставит обновление в очередь чата `key`; False, если очередь полна."""
+        queue = self._queues.get(key)
+        if queue is not None:
+            if len(queue) >= self.depth:
+                return False
+            queue.append(update)
+            return True
+
+        self._queues[key] = deque([update])
+        task = asyncio.ensure_future(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return True
+
+    async def _drain(self, key: Hashable):
+        queue = self._queues[key]
+        try:
+            while queue:
+                async with self._slots:
+                    try:
+                        await self.handle(queue[0])
+                    except Exception as e:
+                        self._logger.exception('Update handling failed: %s', e)
+                queue.popleft()
+        finally:
+            del self._queues[key]
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def join(self):
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
@@ -0,0 +1,145 @@
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import requests
+from huaweicloudsdkcore.exceptions import exceptions
+from huaweicloudsdkcore.sdk_response import FutureSdkResponse
+
+from src.cache import CACHE, MISS
+from src.limits import LIMITER
+from src.resilience import POLICY, endpoint_key, idempotency_token, unavailable
+
+READ_PREFIXES = ('list_', 'show_', 'batch_list_')
+
+
+class SingleFlight:
+    """Одинаковые вызовы, идущие одновременно, разделяют один запрос и его результат."""
+
+    def __init__(self):
+        self.hits = 0
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._calls[key] = future
+
+            def forget(done):
+                if self._calls.get(key) is done:
+                    del self._calls[key]
+
+            future.add_done_callback(forget)
+        else:
+            self.hits += 1
+
+        # отмена одного из ждущих не должна отменять запрос для остальных
+        return await asyncio.shield(future)
+
+
+FLIGHTS = SingleFlight()
+
+
+def _run(method: Callable[[Any], FutureSdkResponse], request) -> Any:
+    # асинхронный клиент SDK отдаёт сетевые ошибки как есть, а модули и POLICY ждут SdkException
+    try:
+        return method(request).result()
+    except requests.Timeout as e:
+        raise exceptions.RequestTimeoutException(str(e)) from e
+    except requests.RequestException as e:
+        raise exceptions.ConnectionException(str(e)) from e
+
+
+def _operation(method: Callable) -> str:
+    return getattr(method, '__name__', repr(method)).removesuffix('_async')
+
+
+def lane_key(method: Callable) -> Hashable:
+    """Ключ (аккаунт, сервис) для лимитов: ak из credentials клиента и тип клиента."""
+    client = getattr(method, '__self__', None)
+    if client is None:
+        return (None, getattr(method, '__qualname__', repr(method)))
+
+    credentials = client.get_credentials()
+
+    return (getattr(credentials, 'ak', None), type(client).__name__)
+
+
+def account_key(method: Callable) -> Hashable:
+    """Ключ credentials клиента, которому принадлежит метод: ak, хэш sk и project/domain id."""
+    client = getattr(method, '__self__', None)
+    credentials = client.get_credentials() if client is not None else None
+
+    secret = getattr(credentials, 'sk', None) or ''
+    scope = getattr(credentials, 'project_id', None) or getattr(credentials, 'domain_id', None)
+
+    return (getattr(credentials, 'ak', None), hashlib.sha256(secret.encode()).hexdigest(), scope)
+
+
+def call_key(method: Callable, request) -> Hashable:
+    """Ключ (credentials, операция, параметры) для склейки одинаковых чтений."""
+    client = getattr(method, '__self__', None)
+    params = request.to_dict() if hasattr(request, 'to_dict') else request
+
+    return account_key(method) + (
+        type(client).__name__,
+        _operation(method),
+        json.dumps(params, sort_keys=True, default=str),
+    )
+
+
+def is_read(method: Callable) -> bool:
+    return _operation(method).startswith(READ_PREFIXES)
+
+
+async def execute(method: Callable[[Any], FutureSdkResponse], request, resource: Optional[str] = None) -> Any:
+    """
+    Выполняет `client.<operation>_async(request)` и ждёт ответа, не блокируя event loop.
+
+    Вызов проходит через `LIMITER`: выделенный пул потоков, лимит одновременных
+    вызовов и token bucket на пару (аккаунт, сервис). Одинаковые list/show вызовы,
+    идущие одновременно, склеиваются в один запрос.
+
+    Если указан `resource`, чтения этого типа ресурса кэшируются на TTL из
+    `src.cache.TTLS`, а успешная запись сбрасывает их для аккаунта.
+
+    Сбои повторяются и учитываются по правилам `src.resilience.POLICY`; пока
+    endpoint недоступен, закэшированные чтения отдаются и после TTL.
+
+    Пример: `result = await execute(client.list_vpcs_async, ListVpcsRequest(), resource='vpc')`
+    """
+    def attempt():
+        return LIMITER.run(lane_key(method), _run, method, request)
+
+    def call():
+        return POLICY.run(endpoint_key(method), attempt, is_read(method) or idempotency_token(request) is not None)
+
+    if not is_read(method):
+        result = await call()
+        if resource is not None:
+            CACHE.invalidate(account_key(method), resource)
+        return result
+
+    key = call_key(method, request)
+    if resource is None:
+        return await FLIGHTS.do(key, call)
+
+    account = account_key(method)
+    generation = CACHE.generation(account, resource)
+
+    result = CACHE.get(key)
+    if result is MISS:
+        # поколение в ключе: запрос после записи не присоединится к запросу, начатому до неё
+        try:
+            result = await FLIGHTS.do(key + (generation,), call)
+        except Exception as e:
+            # endpoint недоступен: лучше устаревший ответ, чем ошибка
+            stale = CACHE.stale(key) if unavailable(e) else MISS
+            if stale is MISS:
+                raise
+            return stale
+        CACHE.put(account, resource, key, result, generation)
+
+    return result
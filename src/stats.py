@@ -0,0 +1,77 @@
+import heapq
+import math
+from array import array
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from src.metrics import Series
+
+# Периоды агрегации Cloud Eye в секундах; '1' - сырые данные, примерно точка в минуту
+PERIODS = ((60, '1'), (300, '300'), (1200, '1200'), (3600, '3600'), (14400, '14400'), (86400, '86400'))
+
+# Не больше стольких точек на серию за окно
+MAX_POINTS = 300
+
+SPARKS = '▁▂▃▄▅▆▇█'
+
+
+def resolution(seconds: float, max_points: int = MAX_POINTS) -> str:
+    """Самый мелкий период CES, при котором окно в `seconds` даёт не больше `max_points` точек."""
+    for length, period in PERIODS:
+        if seconds / length <= max_points:
+            return period
+
+    return PERIODS[-1][1]
+
+
+def downsample(values: np.ndarray, points: int) -> np.ndarray:
+    """Средние по `points` почти равным корзинам, если точек больше."""
+    if len(values) <= points:
+        return values
+
+    edges = np.linspace(0, len(values), points + 1).astype(int)
+
+    return np.add.reduceat(values, edges[:-1]) / np.diff(edges)
+
+
+def sparkline(values: np.ndarray, width: int = 24) -> str:
+    values = downsample(values, width)
+    low, high = values.min(), values.max()
+    if high == low:
+        return SPARKS[0] * len(values)
+
+    levels = ((values - low) / (high - low) * (len(SPARKS) - 1)).round().astype(int)
+
+    return ''.join(SPARKS[level] for level in levels)
+
+
+@dataclass
+class Summary:
+    metric_name: str
+    unit: Optional[str]
+    count: int
+    min: float
+    max: float
+    mean: float
+    p95: float
+    last: float
+    sparkline: str
+
+
+def summarize(series: Series) -> Optional[Summary]:
+    """min, max, mean, p95 и last по серии; None, если точек нет."""
+    values = np.array([value for value in series.values if value is not None], dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+
+    return Summary(series.metric_name, series.unit, len(values), float(values.min()), float(values.max()),
+                   float(values.mean()), float(np.percentile(values, 95)), float(values[-1]), sparkline(values))
+
+
+def top(values: array, n: int) -> List[int]:
+    """Индексы `n` наибольших значений (NaN пропускаются), выбор через кучу за O(len * log n)."""
+    return heapq.nlargest(n, (index for index, value in enumerate(values) if not math.isnan(value)),
+                          key=values.__getitem__)
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+# Сессии, которых не трогали дольше, удаляются при открытии базы
+SESSION_TTL = 90 * 24 * 3600
+
+
+def dumps(data: Dict[str, Any]) -> bytes:
+    """Компактный JSON; объекты вроде клиентов SDK сюда не попадают - будет TypeError."""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def loads(raw: Optional[bytes]) -> Dict[str, Any]:
+    return json.loads(raw) if raw else {}
+
+
+def _key(key: StorageKey) -> str:
+    return f'{key.bot_id}:{key.chat_id}:{key.user_id}:{key.destiny}'
+
+
+def _state(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage в SQLite: сессии переживают рестарт бота.
+
+    Все запросы идут через одно соединение в отдельном потоке, поэтому event loop
+    не блокируется, а запись не требует блокировок. Пустые сессии (без состояния
+    и данных) удаляются, так что размер базы растёт с числом активных пользователей.
+    """
+
+    def __init__(self, path: str = 'fsm.sqlite3', ttl: float = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='fsm')
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            new = not os.path.exists(self.path)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            if new and self.path != ':memory:':
+                # в данных лежат ak/sk пользователей
+                os.chmod(self.path, 0o600)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS fsm '
+                                     '(key TEXT PRIMARY KEY, state TEXT, data BLOB, updated REAL NOT NULL)')
+            self._connection.execute('DELETE FROM fsm WHERE updated < ?', (time.time() - self.ttl,))
+
+        return self._connection
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _read(self, key: str):
+        row = self._connect().execute('SELECT state, data FROM fsm WHERE key = ?', (key,)).fetchone()
+        return row if row is not None else (None, None)
+
+    def _write(self, key: str, state: Optional[str], data: Optional[bytes]):
+        connection = self._connect()
+        if state is None and not data:
+            connection.execute('DELETE FROM fsm WHERE key = ?', (key,))
+        else:
+            connection.execute('INSERT INTO fsm (key, state, data, updated) VALUES (?, ?, ?, ?) '
+                               'ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, '
+                               'updated = excluded.updated', (key, state, data, time.time()))
+
+    def _set_state(self, key: str, state: Optional[str]):
+        _, data = self._read(key)
+        self._write(key, state, data)
+
+    def _set_data(self, key: str, data: bytes):
+        state, _ = self._read(key)
+        self._write(key, state, data)
+
+    def _update_data(self, key: str, update: Dict[str, Any]) -> Dict[str, Any]:
+        state, raw = self._read(key)
+        data = loads(raw)
+        data.update(update)
+        self._write(key, state, dumps(data) if data else None)
+        return data
+
+    async def set_state(self, bot: Bot, key: StorageKey, state: StateType = None) -> None:
+        await self._run(self._set_state, _key(key), _state(state))
+
+    async def get_state(self, bot: Bot, key: StorageKey) -> Optional[str]:
+        state, _ = await self._run(self._read, _key(key))
+        return state
+
+    async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._run(self._set_data, _key(key), dumps(data) if data else None)
+
+    async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+        _, raw = await self._run(self._read, _key(key))
+        return loads(raw)
+
+    async def update_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # чтение и запись в одном задании потока: параллельные update_data не теряют ключи
+        dumps(data)
+        return (await self._run(self._update_data, _key(key), data)).copy()
+
+    async def close(self) -> None:
+        def close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await self._run(close)
+        self._executor.shutdown(wait=False)
+
+
+def create_storage() -> BaseStorage:
+    """
+    Storage для Dispatcher: Redis, если задан `REDIS_URL` (нужен пакет redis),
+    иначе SQLite в файле `FSM_DB` (по умолчанию fsm.sqlite3).
+    """
+    url = os.getenv('REDIS_URL')
+    if url:
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(url, data_ttl=SESSION_TTL, state_ttl=SESSION_TTL)
+
+    return SQLiteStorage(os.getenv('FSM_DB', 'fsm.sqlite3'))
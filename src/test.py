@@ -1,9 +1,40 @@
 from src.modules import modules
+from src.sdk import execute, FLIGHTS
+from src.clients import ClientPool, Service
+from src.transport import TRANSPORT
+from src.limits import Limiter
+from src.cache import ResourceCache, MISS, CACHE
+from src.pagination import items, pages, picker_page
+from src.output import send_entries, MESSAGE_LIMIT
+from src.catalog import FlavorCatalog, ImageCatalog, flavor_catalog
+from src.render import Renderer, Line
+from src.metrics import MetricStore
+from src.alerts import Rule, Watcher
+from src.stats import resolution, summarize, sparkline, top
+from src.charts import ChartRenderer, ChartsBusy
+from src.inventory import Source, export
+from src.changes import ChangeWatcher
+from src.storage import SQLiteStorage
+from src.globalstate import GlobalState
+from src.workers import Worker, encode, shard
+from src.scheduler import Scheduler
+from src.resilience import POLICY, CircuitOpen
+from src.outbound import Outbound, background
+from src.webhook import WebhookHandler, SECRET_HEADER
 import os
+import json
+import pytest
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
 from aiogram import Bot
 from huaweicloudsdkcore.auth.credentials import BasicCredentials, GlobalCredentials
 from huaweicloudsdkcore.http.http_config import HttpConfig
+from huaweicloudsdkcore.exceptions.exceptions import ServerResponseException
 from huaweicloudsdkvpc.v2 import *
 from huaweicloudsdkeps.v1 import (EpsAsyncClient)
 
@@ -56,3 +87,1195 @@ def test_auth_eps():
 
     request = ListVpcsRequest(limit=1)
     eps_client.list_enterprise_project_async(request)
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.5
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        time.sleep(self.delay)
+        body = b'{"vpcs": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def _local_endpoint(handler=_SlowHandler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_execute_overlaps_slow_calls():
+    with _local_endpoint() as endpoint:
+        client = VpcAsyncClient.new_builder() \
+            .with_http_config(HttpConfig.get_default_config()) \
+            .with_credentials(BasicCredentials('ak', 'sk', 'project')) \
+            .with_endpoint(endpoint) \
+            .build()
+
+        async def main():
+            started = time.monotonic()
+            results = await asyncio.gather(
+                execute(client.list_vpcs_async, ListVpcsRequest()),
+                execute(client.list_vpcs_async, ListVpcsRequest()),
+            )
+            return results, time.monotonic() - started
+
+        results, elapsed = asyncio.run(main())
+
+    assert all(result.vpcs == [] for result in results)
+    assert elapsed < 2 * _SlowHandler.delay
+
+
+def test_client_pool_reuse_and_eviction():
+    service = Service('vpc', VpcAsyncClient, 'https://vpc.ru-moscow-1.hc.sbercloud.ru')
+    data = {'ak': 'ak', 'sk': 'sk', 'project_id': 'project', 'account_id': 'account'}
+    pool = ClientPool(idle_ttl=60)
+
+    client = pool.get(service, data)
+    assert pool.get(service, dict(data)) is client
+    assert pool.get(service, dict(data, sk='other')) is not client
+    assert len(pool) == 2
+
+    pool.evict(time.monotonic() + 120)
+    assert len(pool) == 0
+    assert pool.get(service, data) is not client
+
+
+def test_transport_reuses_connections():
+    class Handler(_SlowHandler):
+        delay = 0
+
+    data = {'ak': 'ak', 'sk': 'sk', 'project_id': 'project'}
+    with _local_endpoint(Handler) as endpoint:
+        first = Service('vpc', VpcAsyncClient, endpoint).build(data)
+        second = Service('subnet', VpcAsyncClient, endpoint).build(data)
+
+        for client in (first, second, first):
+            client.list_vpcs_async(ListVpcsRequest()).result()
+
+        stats = TRANSPORT.stats()[endpoint.split('://')[1]]
+
+    assert stats['requests'] == 3
+    assert stats['connections'] == 1
+    assert stats['reused'] == 2
+
+
+def test_transport_attach_matches_sdk_http_client(monkeypatch):
+    import socket
+    from huaweicloudsdkcore.http.http_client import HttpClient
+    from src.transport import KeepAliveAdapter, TransportConfig
+
+    # attach подменяет эти атрибуты HttpClient; тест падает, если SDK их переименует
+    client = Service('vpc', VpcAsyncClient, 'https://vpc.ru-moscow-1.hc.sbercloud.ru').build(
+        {'ak': 'ak', 'sk': 'sk', 'project_id': 'project'})
+    http_client = client.get_http_client()
+    assert type(http_client) is HttpClient
+    assert http_client._session is TRANSPORT.session('https://vpc.ru-moscow-1.hc.sbercloud.ru', TransportConfig())
+    assert http_client._closed is True
+
+    closed = []
+    monkeypatch.setattr(http_client._session, 'close', lambda: closed.append(True))
+    http_client.close()
+    assert not closed
+
+    adapter = KeepAliveAdapter(TransportConfig(keepalive=60, keepalive_interval=5, keepalive_probes=4))
+    options = {(level, name): value
+               for level, name, value in adapter.poolmanager.connection_pool_kw['socket_options']}
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        assert options[(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE)] == 60
+        assert options[(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL)] == 5
+        assert options[(socket.IPPROTO_TCP, socket.TCP_KEEPCNT)] == 4
+
+
+def test_limiter_caps_concurrency_per_lane():
+    limiter = Limiter(workers=4, concurrency=1, rate=100, burst=100)
+
+    async def main():
+        started = time.monotonic()
+        await asyncio.gather(
+            limiter.run(('a', 'vpc'), time.sleep, 0.2),
+            limiter.run(('a', 'vpc'), time.sleep, 0.2),
+            limiter.run(('b', 'vpc'), time.sleep, 0.2),
+        )
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(main())
+    stats = limiter.stats()
+
+    assert 0.4 <= elapsed < 0.6
+    assert stats[('a', 'vpc')].calls == 2
+    assert stats[('a', 'vpc')].wait_max >= 0.2
+    assert stats[('b', 'vpc')].wait_max < 0.1
+    assert limiter.queued == 0
+
+
+def test_execute_coalesces_identical_reads():
+    class Handler(_SlowHandler):
+        delay = 0.3
+        hits = 0
+
+    with _local_endpoint(Handler) as endpoint:
+        client = Service('vpc', VpcAsyncClient, endpoint).build(
+            {'ak': 'coalesce', 'sk': 'sk', 'project_id': 'project'})
+
+        async def main():
+            return await asyncio.gather(
+                *(execute(client.list_vpcs_async, ListVpcsRequest()) for _ in range(3)),
+                execute(client.list_vpcs_async, ListVpcsRequest(limit=1)),
+            )
+
+        hits = FLIGHTS.hits
+        results = asyncio.run(main())
+
+    assert Handler.hits == 2
+    assert FLIGHTS.hits - hits == 2
+    assert results[0] is results[1] is results[2]
+
+
+def test_execute_caches_reads_until_write():
+    class Handler(_SlowHandler):
+        delay = 0
+        hits = 0
+
+        def do_DELETE(self):
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    with _local_endpoint(Handler) as endpoint:
+        client = Service('vpc', VpcAsyncClient, endpoint).build(
+            {'ak': 'cache', 'sk': 'sk', 'project_id': 'project'})
+
+        async def main():
+            await execute(client.list_vpcs_async, ListVpcsRequest(), resource='vpc')
+            await execute(client.list_vpcs_async, ListVpcsRequest(), resource='vpc')
+            assert Handler.hits == 1
+
+            await execute(client.delete_vpc_async, DeleteVpcRequest(vpc_id='id'), resource='vpc')
+            await execute(client.list_vpcs_async, ListVpcsRequest(), resource='vpc')
+            assert Handler.hits == 2
+
+        asyncio.run(main())
+
+
+def test_cache_skips_results_started_before_invalidation():
+    cache = ResourceCache({'vpc': 60})
+    generation = cache.generation('account', 'vpc')
+
+    cache.invalidate('account', 'vpc')
+    cache.put('account', 'vpc', 'key', 'stale', generation)
+    assert cache.get('key') is MISS
+
+    cache.put('account', 'vpc', 'key', 'fresh', cache.generation('account', 'vpc'))
+    assert cache.get('key') == 'fresh'
+
+
+class _PagedVpcsHandler(_SlowHandler):
+    delay = 0
+    hits = 0
+    ids = [f'vpc-{i}' for i in range(5)]
+
+    def do_GET(self):
+        type(self).hits += 1
+        query = parse_qs(urlparse(self.path).query)
+        limit = int(query['limit'][0])
+        marker = query.get('marker', [None])[0]
+        start = self.ids.index(marker) + 1 if marker else 0
+
+        vpcs = [{'id': id_, 'name': id_} for id_ in self.ids[start:start + limit]]
+        body = json.dumps({'vpcs': vpcs}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_pagination_streams_marker_pages_lazily():
+    with _local_endpoint(_PagedVpcsHandler) as endpoint:
+        client = Service('vpc', VpcAsyncClient, endpoint).build(
+            {'ak': 'pages', 'sk': 'sk', 'project_id': 'project'})
+
+        async def first_page():
+            async for page in pages(client.list_vpcs_async, ListVpcsRequest(), 'vpcs', limit=2):
+                return [vpc.id for vpc in page]
+
+        async def everything():
+            return [vpc.id async for vpc in items(client.list_vpcs_async, ListVpcsRequest(), 'vpcs', limit=2)]
+
+        assert asyncio.run(first_page()) == ['vpc-0', 'vpc-1']
+        assert _PagedVpcsHandler.hits == 1
+
+        assert asyncio.run(everything()) == _PagedVpcsHandler.ids
+        assert _PagedVpcsHandler.hits == 4
+
+
+def test_picker_page_fetches_only_requested_page():
+    from aiogram.utils.keyboard import InlineKeyboardBuilder
+    from src.modules.subnet import SubnetUpdateCallback
+    from src.utils import add_page_buttons
+
+    class Handler(_PagedVpcsHandler):
+        hits = 0
+
+    with _local_endpoint(Handler) as endpoint:
+        client = Service('vpc', VpcAsyncClient, endpoint).build(
+            {'ak': 'picker', 'sk': 'sk', 'project_id': 'project'})
+
+        async def main():
+            first, has_next = await picker_page(client.list_vpcs_async, ListVpcsRequest(), 'vpcs', 0, limit=2)
+            assert [vpc.id for vpc in first] == ['vpc-0', 'vpc-1'] and has_next
+            assert Handler.hits == 1
+
+            # marker страницы приходит из кнопки: третья страница - один запрос без обхода с начала
+            last, has_next = await picker_page(client.list_vpcs_async, ListVpcsRequest(), 'vpcs', 2, limit=2,
+                                               marker='vpc-3')
+            assert [vpc.id for vpc in last] == ['vpc-4'] and not has_next
+            assert Handler.hits == 2
+
+        asyncio.run(main())
+
+    builder = InlineKeyboardBuilder()
+    add_page_buttons(builder, SubnetUpdateCallback, 99, True, '0b2f6a0e-1111-2222-3333-444455556666')
+    back, forward = builder.export()[0]
+    assert SubnetUpdateCallback.unpack(back.callback_data).page == 0
+    assert len(forward.callback_data.encode()) <= 64
+    assert SubnetUpdateCallback.unpack(forward.callback_data).marker == '0b2f6a0e-1111-2222-3333-444455556666'
+
+
+class _FakeMessage:
+    def __init__(self):
+        self.texts = []
+        self.documents = []
+
+    async def answer(self, text, parse_mode=None):
+        self.texts.append(text)
+
+    async def answer_document(self, document):
+        self.documents.append(document.data.decode())
+
+
+async def _entries(count, size):
+    for i in range(count):
+        yield f'<b>{i}</b>' + 'x' * (size - 7 - len(str(i)))
+
+
+def test_send_entries_splits_on_entry_boundaries():
+    message = _FakeMessage()
+    asyncio.run(send_entries(message, _entries(10, 1000)))
+
+    assert [len(text) for text in message.texts] == [4003, 4003, 2001]
+    assert all(len(text) <= MESSAGE_LIMIT for text in message.texts)
+    assert not message.documents
+
+
+def test_send_entries_falls_back_to_document():
+    message = _FakeMessage()
+    count = asyncio.run(send_entries(message, _entries(10, 1000), max_messages=2))
+
+    assert count == 10
+    assert len(message.texts) == 2
+    assert message.documents[0].startswith('8x') and '<b>' not in message.documents[0]
+
+
+def test_flavor_catalog_indexes_and_refreshes_once():
+    from types import SimpleNamespace
+    loads = []
+
+    def loader():
+        async def flavors():
+            loads.append(1)
+            await asyncio.sleep(0.01)
+            for name, vcpus, ram in [('s6.large.2', '2', 4096), ('s6.xlarge.2', '4', 8192),
+                                     ('m6.xlarge.8', '4', 32768), ('s6.2xlarge.2', '8', 16384)]:
+                yield SimpleNamespace(name=name, vcpus=vcpus, ram=ram)
+        return flavors()
+
+    async def run():
+        catalog = FlavorCatalog(ttl=60)
+        await asyncio.gather(*(catalog.ensure(loader) for _ in range(5)))
+        return catalog
+
+    catalog = asyncio.run(run())
+
+    assert len(loads) == 1
+    assert 's6.xlarge.2' in catalog and catalog.get('nope') is None
+    assert [f.name for f in catalog.query(min_vcpus=4, min_ram=8192)] == ['s6.xlarge.2', 'm6.xlarge.8', 's6.2xlarge.2']
+    assert [f.name for f in catalog.query(min_ram=16384)] == ['m6.xlarge.8', 's6.2xlarge.2']
+    assert [f.name for f in catalog.sorted()][0] == 's6.large.2'
+
+    async def projects():
+        return [await flavor_catalog(('region', 'ak', project), loader) for project in ('a', 'b', 'a')]
+
+    first, second, again = asyncio.run(projects())
+    assert first is again and first is not second
+    assert len(loads) == 3 and first.ttl == CACHE.ttls['flavor']
+
+
+def test_image_catalog_searches_and_refreshes_incrementally():
+    from types import SimpleNamespace
+
+    def image(id, name, updated_at, os_type='Linux', visibility='public', min_disk=40):
+        return SimpleNamespace(id=id, name=name, os_version=None, os_type=os_type, visibility=visibility,
+                               status='active', min_disk=min_disk, updated_at=updated_at)
+
+    full = [image('1', 'Ubuntu 22.04 server 64bit', '2023-01-01T00:00:00Z'),
+            image('2', 'Ubuntu 20.04 server 64bit', '2023-01-02T00:00:00Z'),
+            image('3', 'Windows Server 2022', '2023-01-03T00:00:00Z', os_type='Windows', min_disk=60),
+            image('4', 'my-ubuntu-22', '2023-01-04T00:00:00Z', visibility='private')]
+    changed = [image('2', 'Debian 12', '2023-02-01T00:00:00Z')]
+    calls = []
+
+    def loader(since):
+        async def images():
+            calls.append(since)
+            for item in (changed if since else full):
+                yield item
+        return images()
+
+    catalog = ImageCatalog(ttl=0)
+    asyncio.run(catalog.refresh(loader))
+
+    assert [i.id for i in catalog.search('ubuntu 22')] == ['1', '4']
+    assert [i.id for i in catalog.search('ubu')] == ['2', '1', '4']
+    assert [i.id for i in catalog.search('ubuntu', visibility='PRIVATE')] == ['4']
+    assert [i.id for i in catalog.search(os_type='windows', disk=40)] == []
+
+    asyncio.run(catalog.refresh(loader))
+
+    assert calls == [None, '2023-01-04T00:00:00Z']
+    assert len(catalog) == 4
+    assert [i.id for i in catalog.search('ubuntu')] == ['1', '4']
+    assert [i.id for i in catalog.search('debian')] == ['2']
+
+
+class _FakeState:
+    def __init__(self):
+        self.data, self.state = {}, None
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def update_data(self, **data):
+        self.data.update(data)
+
+    async def set_state(self, state):
+        self.state = state
+
+
+def test_ecs_image_step_accepts_status_filter_and_fresh_ids(monkeypatch):
+    from types import SimpleNamespace
+    from src.modules import ecs, ims
+
+    fresh = '0b4f3c2e-1a2b-4c3d-8e9f-001122334455'
+    catalog = ImageCatalog(ttl=3600)
+
+    def loader(since):
+        async def images():
+            for status in ('active', 'queued'):
+                yield SimpleNamespace(id=status, name=f'Ubuntu 22.04 {status}', os_version=None, os_type='Linux',
+                                      visibility='public', status=status, min_disk=40, updated_at=None)
+        return images()
+
+    async def images(client):
+        return catalog
+
+    async def find_image(client, image_id):
+        return SimpleNamespace(id=image_id) if image_id == fresh else None
+
+    monkeypatch.setattr(ecs, 'get_client', lambda service, data: None)
+    monkeypatch.setattr(ims, 'images', images)
+    monkeypatch.setattr(ims, 'find_image', find_image)
+
+    class Message(_FakeMessage):
+        def __init__(self, text):
+            super().__init__()
+            self.text, self.markups = text, []
+
+        async def answer(self, text, parse_mode=None, reply_markup=None):
+            self.texts.append(text)
+            self.markups.append(reply_markup)
+
+    async def step(text):
+        message, state = Message(text), _FakeState()
+        await ecs.ecs_create_image_id(message, state)
+        return message, state
+
+    async def run():
+        await catalog.refresh(loader)
+        return await step('ubuntu status:queued'), await step('ubuntu'), await step(fresh)
+
+    (queued, _), (active, _), (_, picked) = asyncio.run(run())
+
+    def ids(message):
+        return [button.callback_data for row in message.markups[-1].inline_keyboard for button in row]
+
+    assert ids(queued) == ['ecs_image:queued']
+    assert ids(active) == ['ecs_image:active']
+    assert picked.data == {'image_id': fresh} and picked.state == ecs.EcsCreateStates.VPC_ID
+
+
+def test_renderer_reads_attributes_and_escapes():
+    from types import SimpleNamespace
+
+    view = Renderer('<b>{name}</b>: {description}', '\t os: {metadata[os_type]}', Line('\t tag: {tag}', optional=True),
+                    '\t status: <b>{status}</b>', status=lambda model: 'enabled' if model.status == 1 else 'disabled')
+    server = SimpleNamespace(name='a<b>', description='x & y', metadata={'os_type': 'Linux'}, tag=None, status=1)
+
+    assert view.render(server) == '<b>a&lt;b&gt;</b>: x &amp; y\n\t os: Linux\n\n\t status: <b>enabled</b>\n'
+    assert view.render_many([server, server], separator='--') == view.render(server) + '--' + view.render(server)
+
+
+class _FakeCes:
+    """Отдаёт точку на каждую минуту окна [from, to] для каждой запрошенной метрики."""
+
+    def __init__(self):
+        self.requests = []
+
+    def get_credentials(self):
+        from types import SimpleNamespace
+        return SimpleNamespace(ak='ak', sk='sk', project_id='project')
+
+    def batch_list_metric_data_async(self, request):
+        from types import SimpleNamespace
+        body = request.body
+        self.requests.append(body)
+        start = -(-body._from // 60000) * 60000
+        metrics = [SimpleNamespace(namespace=m.namespace, metric_name=m.metric_name, dimensions=m.dimensions, unit='%',
+                                   datapoints=[SimpleNamespace(timestamp=t, average=t / 60000)
+                                               for t in range(start, body.to + 1, 60000)])
+                   for m in body.metrics]
+        return SimpleNamespace(result=lambda: SimpleNamespace(metrics=metrics))
+
+
+def test_metric_store_fetches_only_new_datapoints():
+    from huaweicloudsdkces.v1 import MetricInfoList, MetricsDimension
+
+    client = _FakeCes()
+    store = MetricStore(capacity=100)
+    metrics = [MetricInfoList(namespace='SYS.ECS', metric_name=name,
+                              dimensions=[MetricsDimension(name='instance_id', value='vm')])
+               for name in ('cpu_util', 'mem_util')]
+    minute = 60000
+
+    first = asyncio.run(store.fetch(client, metrics, '1', 'average', 0, 10 * minute))
+    second = asyncio.run(store.fetch(client, metrics, '1', 'average', 2 * minute, 12 * minute))
+
+    assert [len(series.values) for series in first] == [11, 11]
+    assert len(client.requests) == 2 and len(client.requests[1].metrics) == 2
+    assert client.requests[1]._from == 10 * minute
+    assert second[0].values == [float(i) for i in range(2, 13)] and second[1].unit == '%'
+
+    asyncio.run(store.fetch(client, metrics, '1', 'average', 0, 5 * minute))
+    assert len(client.requests) == 2
+
+
+def test_watcher_batches_series_and_alerts_with_hysteresis():
+    values = {'cpu_util': 95.0}
+
+    class Ces(_FakeCes):
+        def batch_list_metric_data_async(self, request):
+            response = super().batch_list_metric_data_async(request).result()
+            for metric in response.metrics:
+                for point in metric.datapoints:
+                    point.average = values[metric.metric_name]
+            from types import SimpleNamespace
+            return SimpleNamespace(result=lambda: response)
+
+    client = Ces()
+
+    class TestWatcher(Watcher):
+        def client(self, credentials):
+            return client
+
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append((chat_id, text))
+
+    async def run():
+        watcher = TestWatcher(service=None, store=MetricStore())
+        watcher.send = send
+        rule = Rule('SYS.ECS', 'instance_id', 'vm', 'cpu_util', '>', 90, 10)
+        for chat_id in (1, 2, 2):
+            watcher.subscribe(chat_id, rule, {})
+
+        minute = 60
+        await watcher.poll(now=100 * minute)
+        await watcher.poll(now=101 * minute)
+        values['cpu_util'] = 85.0
+        await watcher.poll(now=102 * minute)
+        values['cpu_util'] = 50.0
+        await watcher.poll(now=103 * minute)
+
+    asyncio.run(run())
+
+    assert [len(body.metrics) for body in client.requests] == [1, 1, 1, 1]
+    assert [(chat_id, text.split('</b>')[0]) for chat_id, text in sent] == \
+           [(1, '<b>Сработал алерт'), (2, '<b>Сработал алерт'), (1, '<b>Алерт снят'), (2, '<b>Алерт снят')]
+
+
+def test_rule_fires_only_on_a_covered_window():
+    rule = Rule('SYS.ECS', 'instance_id', 'vm', 'cpu_util', '>', 90, 10)
+    minute = 60 * 1000
+    since = 100 * minute
+    full = [since + i * minute for i in range(11)]
+
+    assert rule.samples == 10
+    assert rule.breached(full, [95.0] * 11, since)
+    assert not rule.breached(full, [95.0] * 10 + [80.0], since)
+    # после пропуска данных одна свежая точка - не «10 минут подряд»
+    assert not rule.breached(full[-1:], [95.0], since)
+    assert not rule.breached(full[3:], [95.0] * 8, since)
+    # окно покрыто от начала, но с дырой посередине
+    assert not rule.breached(full[:3] + full[-3:], [95.0] * 6, since)
+    assert Rule('SYS.ECS', 'instance_id', 'vm', 'cpu_util', '>', 90, 60, '300').samples == 12
+
+
+def test_stats_summarize_and_pick_resolution():
+    from src.metrics import Series
+    import numpy as np
+
+    series = Series('SYS.ECS', (), 'cpu_util', '%', list(range(101)), [float(i) for i in range(100)] + [None])
+    summary = summarize(series)
+
+    assert (summary.count, summary.min, summary.max, summary.mean, summary.last) == (100, 0, 99, 49.5, 99)
+    assert round(summary.p95, 2) == 94.05
+    assert summary.sparkline[0] == '▁' and summary.sparkline[-1] == '█' and len(summary.sparkline) == 24
+    assert summarize(Series('SYS.ECS', (), 'cpu_util', '%', [], [])) is None
+    assert sparkline(np.array([3.0, 3.0])) == '▁▁'
+
+    assert resolution(60 * 60) == '1'
+    assert resolution(7 * 24 * 3600) == '3600'
+    assert resolution(10 * 365 * 24 * 3600) == '86400'
+
+
+def test_charts_render_in_pool_and_cache_by_bucket():
+    from src.metrics import Series
+
+    series = [Series('SYS.ECS', (), 'cpu_util', '%', [0, 60000, 120000], [1.0, None, 3.0])]
+    charts = ChartRenderer(workers=1, bucket=60)
+
+    async def run():
+        first = await charts.render('vm', 'SYS.ECS vm', series, to=120000)
+        cached = await charts.render('vm', 'SYS.ECS vm', series, to=150000)
+        charts.queue_size = 0
+        try:
+            await charts.render('vm', 'SYS.ECS vm', series, to=180000)
+        except ChartsBusy:
+            return first, cached, True
+        return first, cached, False
+
+    try:
+        first, cached, busy = asyncio.run(run())
+    finally:
+        charts.close()
+
+    assert first.startswith(b'\x89PNG') and cached is first and busy
+
+
+def test_fleet_metrics_split_batches_and_rank_top():
+    from array import array
+    from huaweicloudsdkces.v1 import MetricInfoList, MetricsDimension
+
+    client = _FakeCes()
+    metrics = [MetricInfoList(namespace='SYS.ECS', metric_name='cpu_util',
+                              dimensions=[MetricsDimension(name='instance_id', value=str(i))])
+               for i in range(1200)]
+
+    series = asyncio.run(MetricStore(max_series=2000).fetch(client, metrics, '1', 'average', 0, 60000))
+
+    assert [len(body.metrics) for body in client.requests] == [500, 500, 200]
+    assert len(series) == 1200 and all(one.values for one in series)
+
+    values = array('d', [float(i % 97) for i in range(10000)])
+    values[5] = float('nan')
+    assert [values[i] for i in top(values, 3)] == [96.0, 96.0, 96.0]
+    assert top(array('d', [float('nan')]), 3) == []
+
+
+class _FakeSource(Source):
+    def pages(self, data):
+        from types import SimpleNamespace
+
+        async def generate():
+            if self.field == 'broken':
+                raise RuntimeError('denied')
+            for page in range(3):
+                yield [SimpleNamespace(id=f'{self.resource}-{page}-{i}', name=f'n{i}', status='ACTIVE',
+                                       cidr='10.0.0.0/8') for i in range(100)]
+        return generate()
+
+
+def test_inventory_export_streams_gzip_csv_and_json():
+    import csv
+    import gzip
+
+    sources = [_FakeSource('vpc', None, '', None, 'vpcs', details=('cidr',)),
+               _FakeSource('nat', None, '', None, 'nats'),
+               _FakeSource('eps', None, '', None, 'broken')]
+
+    document, count, errors = asyncio.run(export(sources, {}, 'csv', concurrency=1, queue_size=1))
+    rows = list(csv.reader(gzip.decompress(document).decode().splitlines()))
+
+    assert count == 600 and errors == {'eps': 'denied'}
+    assert rows[0] == ['resource', 'id', 'name', 'status', 'details'] and len(rows) == 601
+    assert rows[1][:2] == ['vpc', 'vpc-0-0'] and rows[1][4] == 'cidr=10.0.0.0/8'
+
+    document, count, _ = asyncio.run(export(sources, {}, 'json'))
+    objects = json.loads(gzip.decompress(document))
+    assert len(objects) == count == 600 and {o['resource'] for o in objects} == {'vpc', 'nat'}
+
+    class Unwritable(_FakeSource):
+        def row(self, item):
+            raise ValueError('bad row')
+
+    async def failing():
+        try:
+            await asyncio.wait_for(export([Unwritable('vpc', None, '', None, 'vpcs')] + sources, {}, 'csv',
+                                          queue_size=1), 5)
+        except ValueError as e:
+            return str(e), [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(failing()) == ('bad row', [])
+
+
+def test_change_watcher_pushes_only_deltas():
+    from types import SimpleNamespace
+
+    servers = {str(i): SimpleNamespace(id=str(i), name=f'vm{i}', status='ACTIVE') for i in range(1000)}
+
+    class Servers(Source):
+        def pages(self, data):
+            async def generate():
+                yield list(servers.values())
+            return generate()
+
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append((chat_id, text))
+
+    async def run():
+        watcher = ChangeWatcher([Servers('ecs', None, '', None, 'servers'), Servers('nat', None, '', None, 'nats')])
+        watcher.send = send
+        watcher.subscribe(1, {'ak': 'ak', 'sk': 'sk'}, ['ecs'])
+        watcher.subscribe(2, {'ak': 'ak', 'sk': 'sk'}, ['ecs', 'unknown'])
+
+        first = await watcher.poll()
+        servers['5'] = SimpleNamespace(id='5', name='vm5', status='SHUTOFF')
+        servers['7'] = SimpleNamespace(id='7', name='vm7', status='ACTIVE', tags=['x'])
+        del servers['9']
+        servers['new'] = SimpleNamespace(id='new', name='vm<new>', status='BUILD')
+        second = await watcher.poll()
+        third = await watcher.poll()
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert first == {} and third == {}
+    assert sorted((c.kind, c.id) for c in second[1]) == [('changed', '7'), ('created', 'new'), ('deleted', '9'),
+                                                         ('status', '5')]
+    assert [chat_id for chat_id, _ in sent] == [1, 2]
+    assert 'ACTIVE → SHUTOFF' in sent[0][1] and 'vm&lt;new&gt;' in sent[0][1]
+
+
+def test_sqlite_storage_persists_sessions(tmp_path):
+    from aiogram.fsm.storage.base import StorageKey
+
+    path = str(tmp_path / 'fsm.sqlite3')
+    key = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+    async def first():
+        storage = SQLiteStorage(path)
+        await storage.set_state(None, key, 'GlobalState:DEFAULT')
+        await asyncio.gather(*(storage.update_data(None, key, {f'k{i}': i}) for i in range(20)))
+        await storage.update_data(None, key, {'ak': 'ключ'})
+        try:
+            await storage.update_data(None, key, {'client': object()})
+        except TypeError:
+            pass
+        await storage.close()
+
+    async def second():
+        storage = SQLiteStorage(path)
+        state, data = await storage.get_state(None, key), await storage.get_data(None, key)
+        await storage.set_state(None, key, None)
+        await storage.set_data(None, key, {})
+        empty = await storage._run(lambda: storage._connect().execute('SELECT COUNT(*) FROM fsm').fetchone()[0])
+        await storage.close()
+        return state, data, empty
+
+    asyncio.run(first())
+    state, data, empty = asyncio.run(second())
+
+    assert state == 'GlobalState:DEFAULT'
+    assert data == {**{f'k{i}': i for i in range(20)}, 'ak': 'ключ'}
+    assert empty == 0
+
+
+def test_workers_keep_user_order_and_route_stably():
+    from aiogram.types import Update
+
+    def update(update_id, user):
+        return Update.parse_obj({'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': 0, 'text': str(update_id), 'chat': {'id': user, 'type': 'private'},
+            'from': {'id': user, 'is_bot': False, 'first_name': 'u'}}})
+
+    class Dispatcher:
+        def __init__(self):
+            self.log = []
+
+        async def feed_update(self, bot, event):
+            user = event.message.from_user.id
+            # первое обновление пользователя 1 самое медленное
+            await asyncio.sleep(0.05 if event.update_id == 1 else 0)
+            self.log.append((user, event.update_id))
+
+    async def run():
+        dispatcher = Dispatcher()
+        worker = Worker(dispatcher, None)
+        for update_id, user in ((1, 1), (2, 2), (3, 1), (4, 2), (5, 1)):
+            worker.feed(Update.parse_raw(encode(update(update_id, user))))
+        await worker.join()
+        return dispatcher.log
+
+    log = asyncio.run(run())
+
+    assert [u for user, u in log if user == 1] == [1, 3, 5]
+    assert log.index((2, 4)) < log.index((1, 1))
+    assert len({shard(update(i, 7), 4) for i in range(10)}) == 1
+    assert len({shard(update(0, user), 4) for user in range(100)}) == 4
+
+
+def test_shards_pin_subscriptions_to_background_process():
+    from aiogram.types import Update
+    from src.workers import BACKGROUND, Shards
+
+    def press(update_id, user, data):
+        return Update.parse_obj({'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'chat_instance': '1', 'data': data,
+            'from': {'id': user, 'is_bot': False, 'first_name': 'u'}}})
+
+    def text(update_id, user):
+        return Update.parse_obj({'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': 0, 'text': 'ecs id cpu_util > 90 10',
+            'chat': {'id': user, 'type': 'private'}, 'from': {'id': user, 'is_bot': False, 'first_name': 'u'}}})
+
+    shards = Shards('token', 4, pinned=('ces', 'ces_alert'))
+    processes = [next(user for user in range(100) if shard(text(0, user), 4) == index) for index in range(4)]
+
+    # только процесс BACKGROUND запускает фоновые сервисы
+    assert [process._args[3] for process in shards.processes] == [index == BACKGROUND for index in range(4)]
+
+    user = processes[2]
+    assert shards.route(press(1, user, 'vpc:list')) == 2
+    assert shards.route(press(2, user, 'ces:subscribe alert')) == BACKGROUND
+    assert shards.route(text(3, user)) == BACKGROUND
+    assert shards.route(press(4, user, 'ces_alert:1')) == BACKGROUND
+    assert shards.route(press(5, user, 'vpc:list')) == 2
+    assert shards.route(text(6, user)) == 2
+
+
+def test_shards_restart_dead_workers_and_never_block_polling(monkeypatch):
+    from aiogram.types import Update
+    from src import workers
+    from src.workers import Shards
+
+    class Process:
+        def __init__(self, index, queue):
+            self.name, self.queue, self.exitcode = f'worker-{index}', queue, None
+            self.alive = False
+
+        def start(self):
+            self.alive = True
+
+        def is_alive(self):
+            return self.alive
+
+    class FakeShards(Shards):
+        def _spawn(self, index, queue):
+            return Process(index, queue)
+
+    def update(update_id):
+        return Update.parse_obj({'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': 0, 'text': 'x', 'chat': {'id': 1, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'u'}}})
+
+    monkeypatch.setattr(workers, 'QUEUE_SIZE', 1)
+    monkeypatch.setattr(workers, 'PUT_TIMEOUT', 0.1)
+    shards = FakeShards('token', 1)
+    shards.start()
+
+    async def run():
+        await shards.put(update(1))
+        # процесс не разбирает очередь: обновление отбрасывается, а не блокирует опрос
+        started = time.monotonic()
+        await shards.put(update(2))
+        elapsed = time.monotonic() - started
+
+        dead = shards.processes[0]
+        dead.alive, dead.exitcode = False, 1
+        await shards.put(update(3))
+        return dead, elapsed
+
+    dead, elapsed = asyncio.run(run())
+
+    assert elapsed < 1
+    assert shards.processes[0] is not dead and shards.processes[0].is_alive()
+    assert Update.parse_raw(shards.queues[0].get(timeout=1)).update_id == 3
+
+
+def test_limiter_shares_limits_between_processes():
+    limiter = Limiter(workers=4, concurrency=4, rate=10, burst=20)
+    limiter.share(4)
+
+    assert (limiter.concurrency, limiter.rate, limiter.burst) == (1, 2.5, 5)
+    limiter.share(8)
+    assert limiter.concurrency == 1
+
+
+def test_webhook_accepts_recorded_updates_with_secret():
+    from aiohttp import ClientSession, web
+
+    recorded = {'update_id': 10, 'callback_query': {
+        'id': '1', 'chat_instance': '1', 'data': 'ecs', 'from': {'id': 5, 'is_bot': False, 'first_name': 'u'}}}
+    received = []
+
+    async def feed(update):
+        received.append(update.update_id)
+
+    async def run():
+        handler = WebhookHandler(feed, 'secret', ['message', 'callback_query'])
+        runner = web.AppRunner(handler.application('/hook'))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        url = f'http://127.0.0.1:{runner.addresses[0][1]}/hook'
+
+        statuses = []
+        async with ClientSession() as session:
+            for headers, body in (({SECRET_HEADER: 'secret'}, recorded),
+                                  ({SECRET_HEADER: 'wrong'}, recorded),
+                                  ({}, recorded),
+                                  ({SECRET_HEADER: 'secret'}, {'update_id': 11, 'poll': {}}),
+                                  ({SECRET_HEADER: 'secret'}, [1])):
+                async with session.post(url, json=body, headers=headers) as response:
+                    statuses.append(response.status)
+
+        await runner.cleanup()
+        return statuses
+
+    assert asyncio.run(run()) == [200, 401, 401, 200, 400]
+    assert received == [10]
+
+
+def test_scheduler_orders_chats_and_bounds_concurrency():
+    running, peak, log = [0], [0], []
+
+    async def handle(update):
+        chat, number = update
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01 if number == 0 else 0)
+        running[0] -= 1
+        log.append(update)
+
+    async def run():
+        scheduler = Scheduler(handle, concurrency=3, depth=4)
+        accepted = [scheduler.submit(chat, (chat, number)) for number in range(5) for chat in range(6)]
+        pending = scheduler.pending
+        await scheduler.join()
+        return accepted, pending, scheduler.pending
+
+    accepted, pending, left = asyncio.run(run())
+
+    assert accepted.count(False) == 6 and not any(accepted[-6:])
+    assert pending == 24 and left == 0
+    assert peak[0] == 3
+    for chat in range(6):
+        assert [number for one, number in log if one == chat] == [0, 1, 2, 3]
+
+
+def test_outbound_limits_chats_prefers_replies_and_honors_retry_after():
+    from aiogram.exceptions import TelegramRetryAfter
+    from aiogram.methods import AnswerCallbackQuery, SendMessage
+
+    sent, flooded = [], []
+
+    async def make_request(bot, method):
+        if isinstance(method, AnswerCallbackQuery):
+            return
+        if method.text == 'flood' and not flooded:
+            flooded.append(time.monotonic())
+            raise TelegramRetryAfter(method, 'Too Many Requests', 0.1)
+        sent.append((method.chat_id, method.text, time.monotonic()))
+
+    async def run():
+        outbound = Outbound(rate=20, chat_rate=20, chat_burst=1)
+        send = lambda chat_id, text: outbound(make_request, None, SendMessage(chat_id=chat_id, text=text))
+        notify = background(send)
+
+        await outbound(make_request, None, AnswerCallbackQuery(callback_query_id='1'))
+        await asyncio.gather(*(notify(chat_id, 'alert') for chat_id in range(3)),
+                             send(10, 'reply'), send(11, 'reply'))
+        await asyncio.gather(send(1, 'one'), send(1, 'two'), send(1, 'three'))
+        await send(2, 'flood')
+
+    asyncio.run(run())
+
+    texts = [text for chat_id, text, at in sent]
+    assert texts[:5] == ['reply', 'reply', 'alert', 'alert', 'alert']
+    same = [at for chat_id, text, at in sent if chat_id == 1 and text != 'alert']
+    assert same[2] - same[0] >= 0.09
+    assert sent[-1][1] == 'flood' and sent[-1][2] - flooded[0] >= 0.09
+
+
+def test_policy_retries_reads_not_writes_and_serves_stale_when_open(monkeypatch):
+    class Handler(_SlowHandler):
+        delay = 0
+        hits = 0
+        failing = 2
+
+        def _fail(self):
+            type(self).failing -= 1
+            body = b'{"error_code": "VPC.500", "error_msg": "internal"}'
+            self.send_response(500)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if not self.failing:
+                return super().do_GET()
+            type(self).hits += 1
+            self._fail()
+
+        def do_DELETE(self):
+            type(self).hits += 1
+            self._fail()
+
+    monkeypatch.setattr(POLICY, 'base', 0.01)
+    monkeypatch.setattr(POLICY, 'threshold', 4)
+    monkeypatch.setattr(POLICY, '_breakers', {})
+    monkeypatch.setitem(CACHE.ttls, 'flaky', 0.05)
+
+    with _local_endpoint(Handler) as endpoint:
+        client = Service('vpc', VpcAsyncClient, endpoint).build(
+            {'ak': 'flaky', 'sk': 'sk', 'project_id': 'project'})
+        breaker = POLICY.breaker(endpoint.split('://')[1])
+
+        async def main():
+            first = await execute(client.list_vpcs_async, ListVpcsRequest(), resource='flaky')
+            assert Handler.hits == 3 and breaker.failures == 0
+
+            Handler.hits, Handler.failing = 0, 100
+            with pytest.raises(ServerResponseException):
+                await execute(client.delete_vpc_async, DeleteVpcRequest(vpc_id='id'))
+            assert Handler.hits == 1
+
+            await asyncio.sleep(0.1)
+            stale = await execute(client.list_vpcs_async, ListVpcsRequest(), resource='flaky')
+            assert breaker.open and Handler.hits == 4
+
+            # пока breaker разомкнут, запросы до сервера не доходят
+            with pytest.raises(CircuitOpen) as error:
+                await execute(client.list_vpcs_async, ListVpcsRequest(limit=1))
+            assert 'недоступен' in error.value.error_msg
+            again = await execute(client.list_vpcs_async, ListVpcsRequest(), resource='flaky')
+            assert Handler.hits == 4
+
+            return first, stale, again
+
+        first, stale, again = asyncio.run(main())
+
+    assert stale is first and again is first
+
+
+def test_policy_owns_throttling_responses(monkeypatch):
+    from huaweicloudsdkcore.exceptions.exceptions import ClientRequestException
+
+    class Handler(_SlowHandler):
+        delay = 0
+        hits = 0
+
+        def do_GET(self):
+            type(self).hits += 1
+            body = b'{"error_code": "APIGW.0308", "error_msg": "throttled"}'
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    monkeypatch.setattr(POLICY, 'base', 0.01)
+    monkeypatch.setattr(POLICY, '_breakers', {})
+    monkeypatch.setitem(CACHE.ttls, 'throttled', 0.05)
+
+    with _local_endpoint(Handler) as endpoint:
+        client = Service('vpc', VpcAsyncClient, endpoint).build(
+            {'ak': 'throttled', 'sk': 'sk', 'project_id': 'project'})
+        breaker = POLICY.breaker(endpoint.split('://')[1])
+
+        async def main():
+            with pytest.raises(ClientRequestException) as error:
+                await execute(client.list_vpcs_async, ListVpcsRequest())
+            return error.value
+
+        error = asyncio.run(main())
+
+    # одна попытка - один запрос: транспорт 429 не повторяет, повторы только у POLICY
+    assert error.status_code == 429 and Handler.hits == POLICY.attempts
+    assert not breaker.open and breaker.failures == 0
+
+
+def test_handlers_answer_on_server_errors(monkeypatch):
+    from huaweicloudsdkcore.exceptions.exceptions import ConnectionException, SdkError
+    from src.modules import ecs
+
+    class Message(_FakeMessage):
+        text = 's6.large.2'
+
+    async def flavors(client):
+        raise next(errors)
+
+    errors = iter([ServerResponseException(500, SdkError(error_msg='internal')),
+                   ConnectionException('connection reset'), CircuitOpen('ecs.example', 10)])
+    monkeypatch.setattr(ecs, 'get_client', lambda service, data: None)
+    monkeypatch.setattr(ecs, 'flavors', flavors)
+
+    async def run():
+        replies = []
+        for _ in range(3):
+            message, state = Message(), _FakeState()
+            await ecs.ecs_create_flavor(message, state)
+            replies.append((message.texts, state.state))
+        return replies
+
+    replies = asyncio.run(run())
+
+    assert [texts for texts, _ in replies] == [['internal'], ['connection reset'],
+                                              ['Сервис ecs.example временно недоступен, повторите через 10 с']]
+    assert {state for _, state in replies} == {GlobalState.DEFAULT}
+
+
+def test_policy_reports_write_timeouts_as_sdk_errors(monkeypatch):
+    from huaweicloudsdkcore.exceptions.exceptions import RequestTimeoutException
+    from src.transport import TransportConfig
+
+    class Handler(_SlowHandler):
+        hits = 0
+
+        def do_POST(self):
+            type(self).hits += 1
+            time.sleep(1)
+
+    monkeypatch.setattr(POLICY, '_breakers', {})
+
+    with _local_endpoint(Handler) as endpoint:
+        client = Service('vpc', VpcAsyncClient, endpoint, transport=TransportConfig(read_timeout=0.2)).build(
+            {'ak': 'timeout', 'sk': 'sk', 'project_id': 'project'})
+        breaker = POLICY.breaker(endpoint.split('://')[1])
+
+        async def main():
+            with pytest.raises(RequestTimeoutException):
+                await execute(client.create_vpc_async, CreateVpcRequest(CreateVpcRequestBody(CreateVpcOption())))
+
+        asyncio.run(main())
+
+    # запись без токена идемпотентности не повторяется, но сбой breaker учитывает
+    assert Handler.hits == 1 and breaker.failures == 1
+
+
+def test_transport_leaves_read_timeouts_to_policy(monkeypatch):
+    from huaweicloudsdkcore.exceptions.exceptions import RequestTimeoutException
+    from src.transport import TransportConfig
+
+    class Handler(_SlowHandler):
+        hits = 0
+
+        def do_GET(self):
+            type(self).hits += 1
+            time.sleep(1)
+
+    monkeypatch.setattr(POLICY, 'base', 0.01)
+    monkeypatch.setattr(POLICY, '_breakers', {})
+
+    with _local_endpoint(Handler) as endpoint:
+        client = Service('vpc', VpcAsyncClient, endpoint, transport=TransportConfig(read_timeout=0.2)).build(
+            {'ak': 'read-timeout', 'sk': 'sk', 'project_id': 'project'})
+        breaker = POLICY.breaker(endpoint.split('://')[1])
+
+        async def main():
+            with pytest.raises(RequestTimeoutException):
+                await execute(client.list_vpcs_async, ListVpcsRequest())
+
+        asyncio.run(main())
+
+    # каждая попытка POLICY - ровно один запрос, и каждый сбой виден breaker'у
+    assert Handler.hits == POLICY.attempts and breaker.failures == POLICY.attempts
+
+
+def test_picker_handlers_answer_when_circuit_open(monkeypatch):
+    from src.modules import vpc
+
+    class Call:
+        def __init__(self):
+            self.message, self.answers = _FakeMessage(), 0
+
+        async def answer(self, text=None):
+            self.answers += 1
+
+    async def unavailable(*args, **kwargs):
+        raise CircuitOpen('vpc.example', 10)
+
+    async def listing(*args, **kwargs):
+        raise CircuitOpen('vpc.example', 10)
+        yield
+
+    monkeypatch.setattr(vpc, 'get_client', lambda service, data: VpcAsyncClient())
+    monkeypatch.setattr(vpc, 'picker_page', unavailable)
+    monkeypatch.setattr(vpc, 'execute', unavailable)
+    monkeypatch.setattr(vpc, 'items', listing)
+
+    async def run():
+        calls = []
+        for handler, args in ((vpc.vpc_list, ()), (vpc.vpc_show_buttons, ()), (vpc.vpc_delete, ()),
+                              (vpc.vpc_update, ()),
+                              (vpc.vpc_show_buttons_entry, (vpc.VpcShowCallback(action='do', id='id'),)),
+                              (vpc.vpc_picker_page, (vpc.VpcShowCallback(action='page', id='____', page=1),))):
+            call = Call()
+            await handler(call, _FakeState(), *args)
+            calls.append(call)
+        return calls
+
+    calls = asyncio.run(run())
+
+    assert all(call.answers == 1 for call in calls)
+    assert all(call.message.texts == ['Сервис vpc.example временно недоступен, повторите через 10 с']
+               for call in calls)
+
+
+def test_inventory_lists_only_private_images():
+    from src.modules.report import SOURCES
+
+    source = next(source for source in SOURCES if source.resource == 'ims')
+
+    assert source.request().imagetype == 'private'
@@ -0,0 +1,144 @@
+import socket
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+@dataclass(frozen=True)
+class TransportConfig:
+    """
+    Настройки HTTP транспорта сервиса.
+
+    `keepalive` - через сколько секунд простоя TCP соединения ядро начинает
+    слать keep-alive пробы (None - не включать SO_KEEPALIVE), дальше пробы идут
+    каждые `keepalive_interval` секунд, и после `keepalive_probes` без ответа
+    соединение считается мёртвым.
+    """
+    pool_connections: int = 4
+    pool_maxsize: int = 16
+    keepalive: Optional[int] = 60
+    keepalive_interval: int = 10
+    keepalive_probes: int = 3
+    connect_timeout: float = 10
+    read_timeout: float = 60
+    retries: int = 2
+    backoff_factor: float = 0.5
+
+    @property
+    def timeout(self) -> tuple:
+        return (self.connect_timeout, self.read_timeout)
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    def __init__(self, config: TransportConfig):
+        self.settings = config
+        # только неудавшиеся подключения: запрос до сервера не дошёл. Таймауты ответа, 429 и 5xx
+        # повторяет src.resilience.POLICY, иначе попытки умножаются, а breaker видит лишь часть сбоев
+        retry = Retry(total=config.retries, connect=config.retries, read=False, status=0,
+                      status_forcelist=[], respect_retry_after_header=False,
+                      backoff_factor=config.backoff_factor)
+        super().__init__(pool_connections=config.pool_connections, pool_maxsize=config.pool_maxsize,
+                         max_retries=retry)
+
+    def init_poolmanager(self, *args, **kwargs):
+        options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+        if self.settings.keepalive is not None:
+            options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.settings.keepalive))
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, self.settings.keepalive_interval))
+            if hasattr(socket, 'TCP_KEEPCNT'):
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, self.settings.keepalive_probes))
+        kwargs['socket_options'] = options
+
+        super().init_poolmanager(*args, **kwargs)
+
+
+class Transport:
+    """
+    Общие на процесс `requests.Session` с пулом keep-alive соединений, по одной на хост.
+
+    Все клиенты одного endpoint'а (например, VPC и Subnet) ходят через одну сессию,
+    поэтому TCP и TLS хендшейки амортизируются между клиентами и пользователями.
+    Для хоста действуют настройки сервиса, первым обратившегося к нему.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session(self, endpoint: str, config: TransportConfig) -> requests.Session:
+        host = urlparse(endpoint).netloc
+
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = KeepAliveAdapter(config)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+
+        return session
+
+    def attach(self, client, endpoint: str, config: TransportConfig):
+        """
+        Переключает собранный SDK клиент на общую сессию хоста.
+
+        Публичного способа передать клиенту свою сессию в SDK нет, поэтому
+        подменяются `HttpClient._session` и `_closed`; версия SDK закреплена в
+        requirements.txt, а при смене этих атрибутов падаем сразу, а не тихо
+        ходим через собственную сессию клиента.
+        """
+        http_client = client.get_http_client()
+        if not isinstance(getattr(http_client, '_session', None), requests.Session) \
+                or not isinstance(getattr(http_client, '_closed', None), bool):
+            raise RuntimeError(f'Unsupported huaweicloudsdkcore HttpClient: {type(http_client)!r}')
+        http_client.close()
+        http_client._session = self.session(endpoint, config)
+        http_client._closed = True  # закрывать общую сессию при закрытии клиента нельзя
+
+        return client
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Счётчики по хостам: `requests` - сколько запросов отправлено,
+        `connections` - сколько соединений пришлось открыть (т.е. хендшейков),
+        `reused` - сколько запросов ушло по уже открытому соединению.
+        """
+        result = {}
+
+        with self._lock:
+            sessions = list(self._sessions.items())
+
+        for host, session in sessions:
+            requests_, connections = 0, 0
+            for adapter in set(session.adapters.values()):
+                for key in list(adapter.poolmanager.pools.keys()):
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_ += pool.num_requests
+                    connections += pool.num_connections
+
+            result[host] = {
+                'requests': requests_,
+                'connections': connections,
+                'reused': max(requests_ - connections, 0),
+            }
+
+        return result
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+TRANSPORT = Transport()
@@ -1,5 +1,31 @@
+from typing import Optional
+
+from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 
 def add_exit_button(builder: InlineKeyboardBuilder):
     builder.button(text='В главное меню', callback_data='exit')
+
+
+def add_page_buttons(builder: InlineKeyboardBuilder, callbacktype, page: int, has_next: bool,
+                     next_marker: Optional[str] = None):
+    """
+    Кнопки листания пикера. С marker-пагинацией (`next_marker` - id последнего
+    ресурса страницы) кнопка вперёд несёт marker следующей страницы, а назад
+    ведёт к первой: marker предыдущей в 64 байта callback data уже не помещается.
+    """
+    buttons = []
+    if page > 0 and next_marker is not None:
+        buttons.append(InlineKeyboardButton(
+            text='«', callback_data=callbacktype(action='page', id='____', page=0).pack()))
+    elif page > 0:
+        buttons.append(InlineKeyboardButton(
+            text='←', callback_data=callbacktype(action='page', id='____', page=page - 1).pack()))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            text='→', callback_data=callbacktype(action='page', id='____', page=page + 1,
+                                                 **({} if next_marker is None else {'marker': next_marker})).pack()))
+
+    if buttons:
+        builder.row(*buttons)
@@ -0,0 +1,68 @@
+import hmac
+import asyncio
+from typing import Awaitable, Callable, Iterable
+from urllib.parse import urlparse
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.types import Update
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookHandler:
+    """
+    Принимает обновления от Telegram по HTTP.
+
+    Запрос без верного секрета отклоняется с 401. Обновление отдаётся в `feed`,
+    и Telegram сразу получает 200, не дожидаясь обработчиков: обновления
+    разных пользователей обрабатываются параллельно. Типы вне `allowed_updates`
+    (например, пришедшие до смены настроек webhook) отбрасываются.
+    """
+
+    def __init__(self, feed: Callable[[Update], Awaitable], secret: str, allowed_updates: Iterable[str]):
+        self.feed = feed
+        self.secret = secret
+        self.allowed_updates = set(allowed_updates)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, '').encode(), self.secret.encode()):
+            raise web.HTTPUnauthorized()
+
+        try:
+            raw = await request.json()
+            if not isinstance(raw, dict):
+                raise ValueError(raw)
+            update = Update.parse_obj(raw) if self.allowed_updates.intersection(raw) else None
+        except ValueError:
+            raise web.HTTPBadRequest()
+
+        if update is not None:
+            await self.feed(update)
+
+        return web.json_response({})
+
+    def application(self, path: str = '/') -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+
+        return app
+
+
+async def serve(bot: Bot, feed: Callable[[Update], Awaitable], url: str, secret: str,
+                allowed_updates: Iterable[str], host: str = '0.0.0.0', port: int = 8080):
+    """
+    Регистрирует webhook `url` и принимает обновления на `host:port`.
+    Путь берётся из `url`; TLS обычно завершает reverse proxy перед ботом.
+    """
+    allowed_updates = list(allowed_updates)
+    handler = WebhookHandler(feed, secret, allowed_updates)
+    runner = web.AppRunner(handler.application(urlparse(url).path or '/'))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    try:
+        await bot.set_webhook(url, secret_token=secret, allowed_updates=allowed_updates)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,224 @@
+import zlib
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from queue import Full
+from typing import Awaitable, Callable, Iterable, List
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from src import outbound
+from src.limits import LIMITER
+from src.scheduler import CONCURRENCY, DEPTH, Scheduler
+
+# Столько обновлений может ждать в очереди одного процесса, дальше опрос Telegram притормаживает
+QUEUE_SIZE = 1024
+
+# Столько секунд ждём места в очереди процесса, потом обновление отбрасывается
+PUT_TIMEOUT = 5
+
+# Пауза перед повтором getUpdates после ошибки
+RETRY_DELAY = 5
+
+# Процесс с фоновыми сервисами (алерты, изменения инвентаря): их подписки живут в его памяти
+BACKGROUND = 0
+
+# Стольких пользователей, работающих с подписками, помним; вытесненный вернётся в свой процесс
+MAX_PINNED = 10000
+
+
+def owner(update: Update) -> int:
+    """Пользователь (или чат, если пользователя нет), которому принадлежит обновление."""
+    chat, user = UserContextMiddleware.resolve_event_context(update)
+    if user is not None:
+        return user.id
+    if chat is not None:
+        return chat.id
+
+    return 0
+
+
+def shard(update: Update, workers: int) -> int:
+    """Номер процесса для обновления: все обновления пользователя попадают в один процесс."""
+    return zlib.crc32(str(owner(update)).encode()) % workers
+
+
+def encode(update: Update) -> str:
+    return update.json(by_alias=True, exclude_none=True)
+
+
+def chat(update: Update) -> int:
+    """Чат обновления (или пользователь, если чата нет): по нему обновления упорядочиваются."""
+    chat, user = UserContextMiddleware.resolve_event_context(update)
+    if chat is not None:
+        return chat.id
+    if user is not None:
+        return user.id
+
+    return 0
+
+
+class Worker:
+    """
+    Обрабатывает обновления своей доли пользователей через `Scheduler`:
+    по порядку внутри чата, параллельно между чатами.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int = CONCURRENCY, depth: int = DEPTH):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.scheduler = Scheduler(self._process, concurrency, depth)
+        self._logger = logging.getLogger(__name__)
+
+    async def submit(self, update: Update):
+        self.feed(update)
+
+    def feed(self, update: Update) -> bool:
+        if not self.scheduler.submit(chat(update), update):
+            self._logger.warning('Update %s dropped: chat %s queue is full', update.update_id, chat(update))
+            return False
+
+        return True
+
+    async def _process(self, update: Update):
+        await self.dispatcher.feed_update(self.bot, update)
+
+    async def join(self):
+        await self.scheduler.join()
+
+
+async def _serve(queue: multiprocessing.Queue, token: str, workers: int, background: bool):
+    from src.__main__ import create_dispatcher, start_background
+
+    bot = Bot(token=token)
+    outbound.install(bot, workers)
+    LIMITER.share(workers)
+    dispatcher = create_dispatcher()
+    worker = Worker(dispatcher, bot)
+    background = start_background(bot) if background else []
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+            worker.feed(Update.parse_raw(raw))
+
+        await worker.join()
+    finally:
+        for service in background:
+            await service.stop()
+        await dispatcher.storage.close()
+        await bot.session.close()
+
+
+def serve(queue: multiprocessing.Queue, token: str, workers: int, background: bool = False):
+    """Точка входа процесса: свой Dispatcher поверх общего FSM storage."""
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(queue, token, workers, background))
+
+
+class Shards:
+    """
+    Процессы-обработчики и их очереди.
+
+    Пользователь всегда попадает в один и тот же процесс, поэтому порядок его
+    обновлений сохраняется, а общая пропускная способность растёт с числом ядер.
+    FSM storage (SQLite или Redis) у процессов общий.
+
+    Фоновые сервисы работают только в процессе `BACKGROUND`. Пользователь,
+    нажавший кнопку с префиксом из `pinned` (модули подписок), направляется
+    туда до первой кнопки другого модуля, чтобы его подписки попали в этот процесс.
+
+    Упавший процесс перезапускается с новой очередью (обновления в старой
+    теряются). Если процесс не разбирает очередь дольше `PUT_TIMEOUT`,
+    обновление отбрасывается: приём для остальных процессов не останавливается.
+    """
+
+    def __init__(self, token: str, workers: int, pinned: Iterable[str] = ()):
+        self.token = token
+        self.pinned = tuple(f'{prefix}:' for prefix in pinned)
+        self._pins: 'OrderedDict[int, None]' = OrderedDict()
+        self._context = multiprocessing.get_context('spawn')
+        self._logger = logging.getLogger(__name__)
+        self.queues = [self._context.Queue(QUEUE_SIZE) for _ in range(workers)]
+        self.processes = [self._spawn(index, queue) for index, queue in enumerate(self.queues)]
+
+    def _spawn(self, index: int, queue: multiprocessing.Queue) -> multiprocessing.Process:
+        return self._context.Process(target=serve, args=(queue, self.token, len(self.queues), index == BACKGROUND),
+                                     name=f'worker-{index}')
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def supervise(self):
+        """Перезапускает завершившиеся процессы."""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+
+            self._logger.warning('Worker %s exited with code %s, restarting', process.name, process.exitcode)
+            # читателя у старой очереди нет: не ждём, пока её буфер уйдёт в pipe
+            self.queues[index].cancel_join_thread()
+            self.queues[index].close()
+            self.queues[index] = self._context.Queue(QUEUE_SIZE)
+            self.processes[index] = self._spawn(index, self.queues[index])
+            self.processes[index].start()
+
+    def route(self, update: Update) -> int:
+        """Номер процесса для обновления с учётом пользователей, закреплённых за `BACKGROUND`."""
+        user = owner(update)
+        data = update.callback_query.data if update.callback_query is not None else None
+        if data is not None and self.pinned:
+            if data.startswith(self.pinned):
+                self._pins[user] = None
+                self._pins.move_to_end(user)
+                while len(self._pins) > MAX_PINNED:
+                    self._pins.popitem(last=False)
+            else:
+                self._pins.pop(user, None)
+
+        if user in self._pins:
+            return BACKGROUND
+
+        return shard(update, len(self.queues))
+
+    async def put(self, update: Update):
+        self.supervise()
+        index = self.route(update)
+        # put ждёт на заполненной очереди - так перегруженный процесс тормозит приём, но не дольше PUT_TIMEOUT
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.queues[index].put, encode(update), True,
+                                                             PUT_TIMEOUT)
+        except Full:
+            self._logger.warning('Update %s dropped: worker %s queue is full', update.update_id, index)
+
+    def close(self):
+        for process, queue in zip(self.processes, self.queues):
+            if process.is_alive():
+                queue.put(None)
+        for process in self.processes:
+            process.join()
+
+
+async def route(bot: Bot, feed: Callable[[Update], Awaitable], allowed_updates: List[str]):
+    """Long polling: передаёт обновления в `feed` по порядку."""
+    logger = logging.getLogger(__name__)
+    offset = None
+
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.warning('getUpdates failed: %s', e)
+            await asyncio.sleep(RETRY_DELAY)
+            continue
+
+        for update in updates:
+            await feed(update)
+            offset = update.update_id + 1